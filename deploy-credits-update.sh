@@ -18,6 +18,9 @@ GREEN='\033[0;32m'
 YELLOW='\033[1;33m'
 NC='\033[0m' # No Color
 
+# Roues Linux du runtime Lambda (python3.11) : numpy compile, script lance depuis macOS
+PIP_PLATFORM_FLAGS="--platform manylinux2014_x86_64 --python-version 3.11 --only-binary=:all:"
+
 # ========================================
 # 1. DEPLOYER thor-web-article-generator
 # ========================================
@@ -26,10 +29,19 @@ echo -e "\n${YELLOW}[1/2] Deploiement de thor-web-article-generator (web.thorpod
 # Aller dans le repertoire
 cd /Users/directionradiofidelite/thor-web/lambda/article-generator
 
-# Creer le package ZIP
+# Creer le package ZIP avec les dependances (numpy : pre-resume extractif)
+echo "  - Installation des dependances..."
+rm -rf /tmp/article-generator-package
+mkdir -p /tmp/article-generator-package
+pip install -r requirements.txt -t /tmp/article-generator-package --quiet --upgrade $PIP_PLATFORM_FLAGS
+
+# Copier le code et le runtime commun des processeurs
+cp index.py ../common/thor_common.py /tmp/article-generator-package/
+
 echo "  - Creation du package ZIP..."
+cd /tmp/article-generator-package
 rm -f /tmp/article-generator.zip
-zip -r /tmp/article-generator.zip . -x "*.pyc" -x "__pycache__/*" -x "*.zip" -q
+zip -r /tmp/article-generator.zip . -x "*.pyc" -x "__pycache__/*" -q
 
 # Mettre a jour le code de la Lambda
 echo "  - Mise a jour du code Lambda..."
@@ -77,10 +89,10 @@ cd /Users/directionradiofidelite/thor-web/lambda/titre-async-processor
 echo "  - Installation des dependances..."
 rm -rf /tmp/titre-async-package
 mkdir -p /tmp/titre-async-package
-pip install anthropic boto3 chardet -t /tmp/titre-async-package --quiet --upgrade 2>/dev/null
+pip install -r requirements.txt -t /tmp/titre-async-package --quiet --upgrade $PIP_PLATFORM_FLAGS
 
 # Copier le code
-cp index.py /tmp/titre-async-package/
+cp index.py ../common/thor_common.py /tmp/titre-async-package/
 
 # Creer le ZIP
 echo "  - Creation du package ZIP..."
@@ -120,6 +132,21 @@ aws lambda update-function-configuration \
     --environment "Variables=$(cat /tmp/titre-vars-updated.json | jq -c '.')" \
     --region ${REGION} > /dev/null
 
+# Le handler renvoie batchItemFailures : sans ReportBatchItemFailures, SQS ignorerait
+# la reponse et supprimerait tout le batch, messages en echec compris
+echo "  - Activation de ReportBatchItemFailures sur le declencheur SQS..."
+TITRE_MAPPING_UUIDS=$(aws lambda list-event-source-mappings \
+    --function-name demo-thor-async-processor \
+    --region ${REGION} \
+    --query 'EventSourceMappings[].UUID' \
+    --output text)
+for MAPPING_UUID in ${TITRE_MAPPING_UUIDS}; do
+    aws lambda update-event-source-mapping \
+        --uuid ${MAPPING_UUID} \
+        --function-response-types ReportBatchItemFailures \
+        --region ${REGION} > /dev/null
+done
+
 echo -e "  ${GREEN}OK demo-thor-async-processor deploye avec succes${NC}"
 
 # ========================================
@@ -2,6 +2,7 @@ import React, { useState, useEffect } from 'react';
 import { FileUploader } from './components/FileUploader';
 import { authService } from './services/auth';
 import { apiService, JobStatus } from './services/api';
+import { jobEventsService } from './services/jobEvents';
 import { config } from './config';
 import { LogOut, User, FileText, Clock, CheckCircle, Loader, AlertCircle } from 'lucide-react';
 import './App.css';
@@ -11,6 +12,7 @@ function App() {
   const [user, setUser] = useState<any>(null);
   const [currentJob, setCurrentJob] = useState<JobStatus | null>(null);
   const [pollingInterval, setPollingInterval] = useState<NodeJS.Timeout | null>(null);
+  const [pushConnected, setPushConnected] = useState(jobEventsService.isEnabled());
   const [jobHistory, setJobHistory] = useState<JobStatus[]>([]);
   const [loadingHistory, setLoadingHistory] = useState(false);
   const [hasAccess, setHasAccess] = useState(true);
@@ -79,7 +81,37 @@ function App() {
     }
   }, [isAuthenticated]);
 
+  // Receive pushed status transitions for the current job
+  useEffect(() => {
+    if (!currentJob || !jobEventsService.isEnabled()
+      || ['COMPLETED', 'FAILED', 'TRANSCRIPTION_FAILED'].includes(currentJob.status)) {
+      return;
+    }
+
+    setPushConnected(true);
+    const unsubscribe = jobEventsService.subscribe(
+      currentJob.job_id,
+      (event) => {
+        setCurrentJob(job => job && job.job_id === event.job_id ? {
+          ...job,
+          status: event.status,
+          updated_at: event.updated_at || job.updated_at,
+          result: event.result || job.result,
+          preview: event.preview || job.preview,
+          progress: event.progress || job.progress,
+          artifacts: event.artifacts || job.artifacts,
+          error_message: event.error_message || job.error_message
+        } : job);
+      },
+      // Socket lost: fall back to regular polling
+      () => setPushConnected(false)
+    );
+
+    return unsubscribe;
+  }, [currentJob?.job_id]);
+
   // Poll job status when we have a current job that's not completed
+  // (safety net only while push notifications are connected)
   useEffect(() => {
     if (currentJob && !['COMPLETED', 'FAILED', 'TRANSCRIPTION_FAILED'].includes(currentJob.status)) {
       // Start polling
@@ -98,7 +130,7 @@ function App() {
         } catch (error) {
           console.error('Error polling job status:', error);
         }
-      }, config.upload.pollingIntervalMs);
+      }, pushConnected ? config.upload.pushFallbackPollingIntervalMs : config.upload.pollingIntervalMs);
 
       setPollingInterval(interval);
 
@@ -107,7 +139,7 @@ function App() {
         clearInterval(interval);
       };
     }
-  }, [currentJob?.job_id, currentJob?.status]);
+  }, [currentJob?.job_id, currentJob?.status, pushConnected]);
 
   const handleLogin = (pool: 'demo' | 'saint-esprit' = 'demo') => {
     authService.login(pool);
@@ -168,6 +200,11 @@ function App() {
         icon: <CheckCircle size={20} />,
         color: '#10b981'
       },
+      'QUEUED': {
+        text: 'IA surchargée, nouvelle tentative sous peu...',
+        icon: <Clock size={20} />,
+        color: '#f59e0b'
+      },
       'GENERATING': {
         text: 'Génération de l\'article...',
         icon: <Loader className="spinner" size={20} />,
@@ -374,6 +411,24 @@ function App() {
                   </div>
                 )}
 
+                {currentJob.progress && (
+                  <div className="job-progress">
+                    {currentJob.progress.completed} / {currentJob.progress.total} fichiers traités
+                    {currentJob.progress.failed > 0 && ` (${currentJob.progress.failed} en échec)`}
+                  </div>
+                )}
+
+                {/* Speculative headline while the full article is being written */}
+                {currentJob.status === 'GENERATING' && currentJob.preview?.titre && (
+                  <div className="article-result article-preview">
+                    <span className="preview-label">Avant-première</span>
+                    <h3 className="article-title">{currentJob.preview.titre}</h3>
+                    {currentJob.preview.introduction && (
+                      <p className="article-paragraph">{currentJob.preview.introduction}</p>
+                    )}
+                  </div>
+                )}
+
                 {/* Display article when completed */}
                 {currentJob.status === 'COMPLETED' && currentJob.result && (
                   <div className="article-result">
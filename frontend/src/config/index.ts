@@ -9,6 +9,8 @@ export const config = {
     endpoint: process.env.REACT_APP_API_ENDPOINT || 'https://n3gnin38qf.execute-api.eu-west-3.amazonaws.com/prod',
     // API spécifique pour upload et génération web (ancienne API thor-web)
     uploadEndpoint: 'https://0grw79hxx1.execute-api.eu-west-3.amazonaws.com/dev',
+    // API WebSocket des notifications de statut (job-notifier). Vide : polling uniquement
+    websocketEndpoint: process.env.REACT_APP_WEBSOCKET_ENDPOINT || '',
     region: 'eu-west-3'
   },
   cognito: {
@@ -43,6 +45,7 @@ export const config = {
   upload: {
     maxFileSizeMB: 500,
     allowedFormats: ['.mp3'],
-    pollingIntervalMs: 3000  // Poll job status every 3 seconds
+    pollingIntervalMs: 3000,  // Poll job status every 3 seconds
+    pushFallbackPollingIntervalMs: 60000  // Safety-net poll while push notifications are active
   }
 };
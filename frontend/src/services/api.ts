@@ -26,6 +26,21 @@ export interface JobStatus {
     article: string;
     conclusion: string;
   };
+  artifacts?: {
+    html: string;
+    markdown: string;
+  };
+  // Speculative headline published while the article is still generating
+  preview?: {
+    titre?: string;
+    introduction?: string;
+  };
+  // Bulk imports: aggregated progress of the parent job
+  progress?: {
+    total: number;
+    completed: number;
+    failed: number;
+  };
   error_message?: string;
 }
 
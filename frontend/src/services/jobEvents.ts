@@ -0,0 +1,72 @@
+import { config } from '../config';
+import { authService } from './auth';
+import { JobStatus } from './api';
+
+/**
+ * Job Events Service
+ * Receives job status transitions pushed over the WebSocket API (job-notifier Lambda)
+ */
+
+export interface JobEvent {
+  type: 'job_status';
+  job_id: string;
+  status: string;
+  updated_at?: string;
+  titre?: string;
+  result?: JobStatus['result'];
+  artifacts?: JobStatus['artifacts'];
+  preview?: JobStatus['preview'];
+  progress?: JobStatus['progress'];
+  error_message?: string;
+}
+
+class JobEventsService {
+  private endpoint: string;
+
+  constructor() {
+    this.endpoint = config.api.websocketEndpoint;
+  }
+
+  /**
+   * Push notifications are available only when a WebSocket endpoint is configured
+   */
+  isEnabled(): boolean {
+    return Boolean(this.endpoint);
+  }
+
+  /**
+   * Subscribe to a job's transitions.
+   * onClose is called when the socket drops so the caller can fall back to polling.
+   * Returns an unsubscribe function.
+   */
+  subscribe(jobId: string, onEvent: (event: JobEvent) => void, onClose: () => void): () => void {
+    const url = `${this.endpoint}?job_id=${encodeURIComponent(jobId)}` +
+      `&token=${encodeURIComponent(authService.getToken() || '')}`;
+    const socket = new WebSocket(url);
+    let closedByClient = false;
+
+    socket.onmessage = (message) => {
+      try {
+        const event: JobEvent = JSON.parse(message.data);
+        if (event.job_id === jobId) {
+          onEvent(event);
+        }
+      } catch (error) {
+        console.error('Invalid job event:', error);
+      }
+    };
+
+    socket.onclose = () => {
+      if (!closedByClient) {
+        onClose();
+      }
+    };
+
+    return () => {
+      closedByClient = true;
+      socket.close();
+    };
+  }
+}
+
+export const jobEventsService = new JobEventsService();
@@ -1,55 +1,61 @@
 import json
 import os
+import re
+import sys
 import logging
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
-from decimal import Decimal
-import time
 
 logger = logging.getLogger()
 logger.setLevel(logging.INFO)
 
-# Environment variables
-ANTHROPIC_API_KEY = os.environ.get('ANTHROPIC_API_KEY')
-JOBS_TABLE = os.environ.get('JOBS_TABLE', 'thor-web-jobs')
-RESULTS_TABLE = os.environ.get('RESULTS_TABLE', 'thor-web-results')
-RESULTS_BUCKET = os.environ.get('RESULTS_BUCKET', 'thor-web-storage')
-SUBSCRIPTIONS_TABLE = os.environ.get('SUBSCRIPTIONS_TABLE', 'thor-subscriptions')
-REGION = 'eu-west-3'
-
-# Import AWS after environment setup
-import boto3
-from botocore.exceptions import ClientError
-
-# AWS clients
-dynamodb = boto3.resource('dynamodb', region_name=REGION)
-s3_client = boto3.client('s3', region_name=REGION)
-
-# Import and initialize Anthropic client
-import anthropic
-
-if ANTHROPIC_API_KEY:
-    claude_client = anthropic.Anthropic(api_key=ANTHROPIC_API_KEY)
-else:
-    claude_client = None
-    logger.warning("ANTHROPIC_API_KEY not set - Claude API calls will fail")
-
-
-def check_and_consume_audio_credit(user_id):
+# Runtime commun (pool Anthropic, circuit breaker, concurrence, fair share, rendu...) :
+# embarqué à côté de index.py par deploy-lambdas.sh, lu depuis lambda/common en local
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'common'))
+from thor_common import (
+    CIRCUIT_OPEN_SECONDS, circuit_allows_request, consume_credits, create_claude_message,
+    defer_message, dynamodb, emit_memory_profile, env_setting, estimate_tokens,
+    generate_with_retry, memory_checkpoint, prefetch_batch_items, presummarize_text,
+    release_circuit_probe, release_tenant_slot, resolve_task_type, s3_client,
+    save_rendered_artifacts, schedule_fair_share, sqs_sent_at, start_memory_profile
+)
+
+# Environment variables (préfixe ARTICLE_ prioritaire : tables propres au pipeline dans le task engine)
+JOBS_TABLE = env_setting('ARTICLE_', 'JOBS_TABLE', 'thor-web-jobs')
+RESULTS_TABLE = env_setting('ARTICLE_', 'RESULTS_TABLE', 'thor-web-results')
+RESULTS_BUCKET = env_setting('ARTICLE_', 'RESULTS_BUCKET', 'thor-web-storage')
+SUBSCRIPTIONS_TABLE = env_setting('ARTICLE_', 'SUBSCRIPTIONS_TABLE', 'thor-subscriptions')
+TRANSCRIPT_COMPACTION = os.environ.get('TRANSCRIPT_COMPACTION', 'true').lower() == 'true'
+EXTRACTIVE_PRESUMMARY = os.environ.get('EXTRACTIVE_PRESUMMARY', 'true').lower() == 'true'
+# ~48 000 caractères : tient dans la fenêtre [:50000] du prompt
+PRESUMMARY_TOKEN_BUDGET = int(env_setting('ARTICLE_', 'PRESUMMARY_TOKEN_BUDGET', '12000'))
+QUALITY_GATE = os.environ.get('QUALITY_GATE', 'true').lower() == 'true'
+SPECULATIVE_TITLE = os.environ.get('SPECULATIVE_TITLE', 'true').lower() == 'true'
+# reconcile : le titre de l'article prévaut ; force : le titre publié en avant-première est conservé
+SPECULATIVE_TITLE_MODE = os.environ.get('SPECULATIVE_TITLE_MODE', 'reconcile').lower()
+CLAUDE_MODEL = 'claude-sonnet-4-5-20250929'
+SPECULATIVE_MODEL = 'claude-haiku-4-5-20251001'
+PROCESSOR_NAME = 'article'
+
+
+def check_and_consume_audio_credit(user_id, subscription=None):
     """
     Vérifie et consomme 1 crédit audio pour l'utilisateur.
+    subscription: abonnement déjà préchargé (prefetch_batch_items), relu sinon.
     Retourne (success, message)
     """
     try:
         subscriptions_table = dynamodb.Table(SUBSCRIPTIONS_TABLE)
 
         # Récupérer l'abonnement de l'utilisateur
-        response = subscriptions_table.get_item(Key={'userId': user_id})
+        if subscription is None:
+            response = subscriptions_table.get_item(Key={'userId': user_id})
 
-        if 'Item' not in response:
-            logger.warning(f"User {user_id} not found in subscriptions table")
-            return False, "Aucun abonnement trouvé. Veuillez vous abonner sur thorpodcast.link"
+            if 'Item' not in response:
+                logger.warning(f"User {user_id} not found in subscriptions table")
+                return False, "Aucun abonnement trouvé. Veuillez vous abonner sur thorpodcast.link"
 
-        subscription = response['Item']
+            subscription = response['Item']
 
         # Vérifier le statut de l'abonnement
         subscription_status = subscription.get('subscriptionStatus', 'inactive')
@@ -57,24 +63,19 @@ def check_and_consume_audio_credit(user_id):
             logger.warning(f"User {user_id} subscription is not active: {subscription_status}")
             return False, "Votre abonnement n'est pas actif. Veuillez renouveler sur thorpodcast.link"
 
-        # Vérifier les crédits audio restants
-        remaining_credits = int(subscription.get('remainingAudioCredits', 0))
-
-        if remaining_credits <= 0:
+        # Rejet anticipé sur la vue préchargée (aucune écriture)
+        if int(subscription.get('remainingAudioCredits', 0)) <= 0:
             logger.warning(f"User {user_id} has no remaining audio credits")
             return False, "Crédits audio insuffisants. Veuillez recharger sur thorpodcast.link"
 
-        # Décrémenter le compteur de crédits
-        new_remaining = remaining_credits - 1
+        # Décrément atomique conditionnel : le solde préchargé peut être périmé
+        new_remaining = consume_credits(SUBSCRIPTIONS_TABLE, user_id, 'remainingAudioCredits')
+        if new_remaining is None:
+            logger.warning(f"User {user_id} has no remaining audio credits or an inactive subscription")
+            return False, "Crédits audio insuffisants. Veuillez recharger sur thorpodcast.link"
 
-        subscriptions_table.update_item(
-            Key={'userId': user_id},
-            UpdateExpression="SET remainingAudioCredits = :new_credits, updatedAt = :timestamp",
-            ExpressionAttributeValues={
-                ':new_credits': new_remaining,
-                ':timestamp': datetime.utcnow().isoformat()
-            }
-        )
+        # Garder la vue en mémoire cohérente pour les messages suivants du batch
+        subscription['remainingAudioCredits'] = new_remaining
 
         logger.info(f"User {user_id} consumed 1 audio credit. Remaining: {new_remaining}")
         return True, f"Crédit consommé. Crédits audio restants: {new_remaining}"
@@ -84,6 +85,99 @@ def check_and_consume_audio_credit(user_id):
         return False, f"Erreur lors de la vérification des crédits: {str(e)}"
 
 
+# Compaction des transcriptions Amazon Transcribe
+# Hésitations supprimées partout où elles apparaissent
+STRONG_FILLERS_RE = re.compile(r"(?<!\w)(?:eu+h+|heu+|hu+m+|hm+|mh+)(?!\w)\s*(?:,|\.\.\.|…)?", re.IGNORECASE)
+# Interjections supprimées seulement lorsqu'elles sont isolées par la ponctuation ("Ben, ..." / "..., voilà.").
+# Suivies d'un "?", ce sont des questions ("Hein ?") : conservées
+WEAK_FILLERS_RE = re.compile(
+    r"(?:(?<=^)|(?<=[.!?…,]\s)|(?<=[.!?…,]))\s*(?:bon ben|ben|bah|bon|voilà|hein|tu vois|vous voyez|en fait)\s*(?:,|\.\.\.|…|(?=[.!]))",
+    re.IGNORECASE
+)
+# "quoi" n'est une hésitation qu'en fin de phrase après une virgule ("c'est fini, quoi.") :
+# "Quoi ?" ou "Quoi." seul est une vraie réplique
+TRAILING_QUOI_RE = re.compile(r",\s*quoi\s*(?=[.!…]|$)", re.IGNORECASE)
+# Mots ou groupes de mots (jusqu'à 4) répétés immédiatement : "le le le", "c'est c'est".
+# Les nombres ne sont jamais fusionnés ("20 20 ans", "puis 3 3")
+REPEATED_NGRAM_RE = re.compile(
+    r"(?<![\w'’-])((?:(?:[^\W\d]|['’-])+[\s,]+){0,3}?(?:[^\W\d]|['’-])+)(?:[\s,]+\1(?![\w'’-]))+",
+    re.IGNORECASE
+)
+# Un mot seul n'est fusionné que s'il s'agit d'un mot-outil en minuscules : les noms propres
+# et expressions redoublées ("Bora Bora", "Duran Duran", "Tora Tora Tora") sont conservés
+REPEATABLE_FUNCTION_WORDS = {
+    'le', 'la', 'les', "l'", 'un', 'une', 'des', 'de', 'du', "d'", 'au', 'aux',
+    'je', "j'", 'tu', 'il', 'elle', 'on', 'ils', 'elles', 'ce', "c'", "c'est", 'ça', 'qui', 'que', "qu'",
+    'et', 'ou', 'mais', 'donc', 'car', 'à', 'en', 'dans', 'sur', 'pour', 'par', 'avec',
+    'est', 'a', 'ne', 'pas', 'se', "s'", 'mon', 'ma', 'mes', 'son', 'sa', 'ses', 'si', 'y'
+}
+# Un groupe de mots n'est fusionné qu'à partir de trois occurrences : "New York New York" est un titre
+MIN_PHRASE_REPEATS = 3
+SENTENCE_SPLIT_RE = re.compile(r"(?<=[.!?…])\s+")
+# Phrases répétées mot pour mot (jingles, annonces, pubs) : dédupliquées au-delà de cette longueur
+MIN_DUPLICATE_SENTENCE_WORDS = 6
+
+
+def _collapse_repeat(match):
+    phrase = match.group(1)
+    if not re.search(r"[\s,]", phrase):
+        # Répétition d'un mot seul : mot-outil, répété en minuscules ("Le le" mais pas "De De")
+        repeats = match.group(0)[len(phrase):]
+        if phrase.lower().replace('’', "'") not in REPEATABLE_FUNCTION_WORDS or repeats != repeats.lower():
+            return match.group(0)
+    elif len(re.findall(re.escape(phrase), match.group(0), re.IGNORECASE)) < MIN_PHRASE_REPEATS:
+        return match.group(0)
+    return phrase
+
+
+def compact_transcript(transcript_text):
+    """
+    Compacte une transcription avant l'envoi à Claude (traitement local et déterministe) :
+    hésitations, répétitions, phrases dupliquées (jingles) et espaces superflus.
+    Retourne (texte_compacte, stats)
+    """
+    text = transcript_text or ''
+
+    text = STRONG_FILLERS_RE.sub(' ', text)
+    text = WEAK_FILLERS_RE.sub(' ', text)
+    text = TRAILING_QUOI_RE.sub('', text)
+    text = REPEATED_NGRAM_RE.sub(_collapse_repeat, text)
+
+    # Normalisation des espaces et de la ponctuation orpheline : une interjection retirée
+    # entre deux fins de phrase laisse ". ." ou "? ." (les "..." du texte sont conservés).
+    # L'espace typographique français avant "?" et "!" est conservé ("Il a dit quoi ?")
+    text = re.sub(r"\s+", ' ', text)
+    text = re.sub(r"([.!?…])(?:\s+[.!?…]+)+", r"\1", text)
+    text = re.sub(r"\s+([,.…])", r"\1", text)
+    text = re.sub(r"([,.!?…])(?:\s*,)+", r"\1", text)
+    text = re.sub(r",+(\s?)([.!?…])", r"\1\2", text)
+    text = re.sub(r"^[\s,.!?…]+", '', text)
+
+    # Suppression des phrases longues répétées mot pour mot
+    seen_sentences = set()
+    sentences = []
+    for sentence in SENTENCE_SPLIT_RE.split(text):
+        key = re.sub(r"[^\w\s]", '', sentence.lower()).strip()
+        if len(key.split()) >= MIN_DUPLICATE_SENTENCE_WORDS:
+            if key in seen_sentences:
+                continue
+            seen_sentences.add(key)
+        sentences.append(sentence[:1].upper() + sentence[1:])
+    text = ' '.join(sentences).strip()
+
+    original_tokens = estimate_tokens(transcript_text or '')
+    compacted_tokens = estimate_tokens(text)
+    stats = {
+        'original_chars': len(transcript_text or ''),
+        'compacted_chars': len(text),
+        'original_tokens': original_tokens,
+        'compacted_tokens': compacted_tokens,
+        'reduction_pct': round(100.0 * (original_tokens - compacted_tokens) / original_tokens, 1) if original_tokens else 0.0
+    }
+
+    return text, stats
+
+
 def lambda_handler(event, context):
     """
     Article Generator - Traitement SQS avec appel API Claude
@@ -92,71 +186,128 @@ def lambda_handler(event, context):
 
     logger.info(f"Processing {len(event['Records'])} messages from SQS")
 
-    for record in event['Records']:
+    # Précharger les jobs et abonnements du batch en une ou deux lectures groupées
+    prefetched_jobs, prefetched_subscriptions = prefetch_batch_items(event['Records'], JOBS_TABLE, SUBSCRIPTIONS_TABLE)
+    batch_item_failures = []
+
+    # Ordre équitable entre utilisateurs : l'excédent d'un gros déposant est remis en file
+    records = schedule_fair_share(event['Records'], prefetched_jobs, batch_item_failures, PROCESSOR_NAME)
+
+    for record in records:
         try:
             # Parse SQS message
             message = json.loads(record['body'])
             job_id = message['job_id']
             user_id = message['user_id']
             transcript_text = message['transcript_text']
+            task = TASK_DEFINITIONS[resolve_task_type(TASK_DEFINITIONS, message)]
 
             logger.info(f"Processing job {job_id}")
+            start_memory_profile(job_id)
+            stage_timestamps = {
+                'queued_at': message.get('queued_at') or sqs_sent_at(record),
+                'dequeued_at': datetime.utcnow().isoformat()
+            }
 
-            # Get job details from DynamoDB
-            jobs_table = dynamodb.Table(JOBS_TABLE)
-            job_response = jobs_table.get_item(Key={'job_id': job_id})
-
-            if 'Item' not in job_response:
-                raise Exception(f"Job {job_id} not found in database")
-
-            job = job_response['Item']
+            # Circuit ouvert : remettre le message en file au lieu d'échouer le job
+            allowed, wait_seconds = circuit_allows_request()
+            if not allowed:
+                defer_message(record, message, wait_seconds, batch_item_failures)
+                continue
+
+            # Get job details (prefetched, or from DynamoDB)
+            job = prefetched_jobs.get(job_id)
+            if job is None:
+                jobs_table = dynamodb.Table(JOBS_TABLE)
+                job_response = jobs_table.get_item(Key={'job_id': job_id})
+
+                if 'Item' not in job_response:
+                    raise Exception(f"Job {job_id} not found in database")
+
+                job = job_response['Item']
+
+            # Compacter la transcription pour réduire les tokens d'entrée
+            if TRANSCRIPT_COMPACTION:
+                transcript_text, compaction_stats = compact_transcript(transcript_text)
+                logger.info(
+                    f"Transcript compacted for job {job_id}: "
+                    f"{compaction_stats['original_tokens']} -> {compaction_stats['compacted_tokens']} tokens "
+                    f"(-{compaction_stats['reduction_pct']}%)"
+                )
+            memory_checkpoint('compaction')
+
+            # Pré-résumé extractif local si la transcription dépasse encore le budget de tokens
+            if EXTRACTIVE_PRESUMMARY:
+                transcript_text, presummary_stats = presummarize_text(transcript_text, PRESUMMARY_TOKEN_BUDGET)
+                if presummary_stats['applied']:
+                    logger.info(
+                        f"Transcript pre-summarized for job {job_id}: "
+                        f"{presummary_stats['original_tokens']} -> {presummary_stats['presummary_tokens']} tokens "
+                        f"({presummary_stats['selected_units']}/{presummary_stats['units']} sentences)"
+                    )
+            memory_checkpoint('presummary')
 
             # Vérifier et consommer 1 crédit audio AVANT la génération
-            credit_success, credit_message = check_and_consume_audio_credit(user_id)
-            if not credit_success:
-                logger.error(f"Credit check failed for user {user_id}: {credit_message}")
-                update_job_status(
-                    job_id=job_id,
-                    status='FAILED',
-                    error=credit_message
+            # (sauf si déjà consommé avant une remise en file pour surcharge)
+            if not message.get('credit_consumed'):
+                credit_success, credit_message = check_and_consume_audio_credit(
+                    user_id, subscription=prefetched_subscriptions.get(user_id)
                 )
-                continue  # Passer au message suivant sans lever d'exception (ne pas retry)
+                if not credit_success:
+                    logger.error(f"Credit check failed for user {user_id}: {credit_message}")
+                    update_job_status(
+                        job_id=job_id,
+                        status='FAILED',
+                        error=credit_message
+                    )
+                    continue  # Passer au message suivant sans lever d'exception (ne pas retry)
+            memory_checkpoint('credit_check')
+            stage_timestamps['credit_checked_at'] = datetime.utcnow().isoformat()
 
             # Update job status to GENERATING
-            update_job_status(job_id, 'GENERATING')
-
-            # Generate article with Claude
-            article_result = generate_article_with_retry(
-                transcript_text=transcript_text,
-                file_name=job.get('file_name', 'audio.mp3'),
-                max_retries=3
+            update_job_status(
+                job_id,
+                'GENERATING',
+                fields={
+                    'job_type': task['job_type'],
+                    'model': CLAUDE_MODEL,
+                    **{name: value for name, value in stage_timestamps.items() if value}
+                }
             )
 
-            if article_result['success']:
-                # Save result to S3
-                s3_key = save_result_to_s3(
-                    job_id=job_id,
-                    user_id=user_id,
-                    article=article_result['article']
+            # Titre + introduction en avant-première (petit modèle), en parallèle de l'article
+            # (déjà publiée si le job revient d'une remise en file)
+            speculative = None
+            if SPECULATIVE_TITLE and not job.get('preview'):
+                speculative = speculative_executor.submit(
+                    publish_speculative_headline, job_id, transcript_text, job.get('file_name', 'audio.mp3')
                 )
 
-                # Save result to DynamoDB
-                save_result_to_dynamodb(
-                    job_id=job_id,
-                    user_id=user_id,
-                    article=article_result['article'],
-                    s3_key=s3_key
-                )
+            # Generate article with Claude
+            timings = {}
+            article_result = generate_article_with_retry(
+                task['build_prompt'](transcript_text, job, message),
+                task['parse'],
+                max_retries=3,
+                timings=timings
+            )
+            memory_checkpoint('generation')
 
-                # Update job status to COMPLETED
-                update_job_status(
-                    job_id=job_id,
-                    status='COMPLETED',
-                    result=article_result['article']
-                )
+            # Attendre l'avant-première : sa mise à jour GENERATING ne doit pas suivre le statut final
+            preview = speculative.result() if speculative else job.get('preview')
 
+            if article_result['success']:
+                article = finalize_article(article_result['article'], preview, timings)
+                task['persist'](job_id, {**job, 'user_id': user_id}, article, timings)
+                memory_checkpoint('persistence')
                 logger.info(f"Job {job_id} completed successfully")
 
+            elif article_result.get('overloaded'):
+                # IA surchargée : remettre le job en file, crédit déjà consommé
+                message['credit_consumed'] = True
+                defer_message(record, message, CIRCUIT_OPEN_SECONDS, batch_item_failures)
+                update_job_status(job_id, 'QUEUED', fields=timings)
+
             else:
                 # Handle failure
                 error_message = article_result.get('error', 'Unknown error during article generation')
@@ -165,12 +316,13 @@ def lambda_handler(event, context):
                 update_job_status(
                     job_id=job_id,
                     status='FAILED',
-                    error=error_message
+                    error=error_message,
+                    fields=timings
                 )
 
-                # If rate limit error, throw to trigger retry
+                # Rate limit : seul ce message est rendu à la file (retry SQS)
                 if 'rate_limit' in error_message.lower():
-                    raise Exception(f"Rate limit error: {error_message}")
+                    batch_item_failures.append({'itemIdentifier': record['messageId']})
 
         except Exception as e:
             logger.error(f"Error processing message: {str(e)}")
@@ -183,27 +335,57 @@ def lambda_handler(event, context):
                     error=str(e)
                 )
 
-            # Re-raise for SQS retry if it's a temporary error
+            # Erreur temporaire : seul ce message est rendu à la file (retry SQS) ; lever
+            # ferait rejouer tout le batch, messages déjà remis en file compris
             if 'rate_limit' in str(e).lower() or 'timeout' in str(e).lower():
-                raise
+                batch_item_failures.append({'itemIdentifier': record['messageId']})
 
-    return {'statusCode': 200, 'body': json.dumps('Processing complete')}
+        finally:
+            # Sonde half-open obtenue pour ce message sans appel Claude : la rendre
+            release_circuit_probe()
+            # Slot "en cours" du tenant (fair share entre invocations)
+            release_tenant_slot(record)
+            emit_memory_profile(context)
 
+    return {
+        'statusCode': 200,
+        'body': json.dumps('Processing complete'),
+        'batchItemFailures': batch_item_failures
+    }
 
-def generate_article_with_retry(transcript_text, file_name, max_retries=3):
+
+def persist_article(job_id, job, article, timings=None):
     """
-    Call Claude API with retry logic to generate web article
-    Inspiré de Thor KTO V2
+    Persiste un article généré : JSON S3, rendus HTML / Markdown, DynamoDB, statut COMPLETED
     """
-
-    if not claude_client:
-        return {
-            'success': False,
-            'error': 'API Claude non configurée'
-        }
-
-    # Prompt détaillé pour générer un article de qualité
-    prompt = f"""RÔLE
+    user_id = job.get('user_id', 'unknown')
+    s3_key = save_result_to_s3(job_id=job_id, user_id=user_id, article=article)
+
+    # Save publish-ready HTML / Markdown next to the JSON
+    artifacts = save_article_artifacts(job_id=job_id, user_id=user_id, article=article)
+
+    save_result_to_dynamodb(
+        job_id=job_id,
+        user_id=user_id,
+        article=article,
+        s3_key=s3_key,
+        artifacts=artifacts
+    )
+
+    update_job_status(
+        job_id=job_id,
+        status='COMPLETED',
+        result=article,
+        artifacts=artifacts,
+        fields={**(timings or {}), 'persisted_at': datetime.utcnow().isoformat()}
+    )
+
+
+def build_article_prompt(transcript_text, file_name):
+    """
+    Prompt détaillé pour générer un article de qualité
+    """
+    return f"""RÔLE
 
 Vous êtes rédacteur de contenu pour une radio locale, spécialisé dans la création de textes indiscernables de ceux rédigés par des humains. Votre expertise réside dans la capture des nuances émotionnelles, de la pertinence culturelle et de l'authenticité contextuelle, garantissant un contenu qui résonne naturellement auprès de n'importe quel public.
 
@@ -274,72 +456,145 @@ TRANSCRIPTION DE L'ÉMISSION RADIO :
 
 Rédigez maintenant l'article en suivant toutes les directives ci-dessus."""
 
-    for attempt in range(max_retries):
-        try:
-            logger.info(f"Calling Claude API (attempt {attempt + 1}/{max_retries})")
-
-            # Call Claude API
-            response = claude_client.messages.create(
-                model="claude-sonnet-4-5-20250929",
-                max_tokens=6000,
-                temperature=0.7,
-                messages=[
-                    {
-                        "role": "user",
-                        "content": prompt
-                    }
-                ]
-            )
 
-            # Extract response text
-            response_text = response.content[0].text if response.content else ""
+def generate_article_with_retry(prompt, parse, max_retries=3, timings=None):
+    """
+    Call Claude API with retry logic to generate web article
+    Inspiré de Thor KTO V2
+    """
+    generation = generate_with_retry(
+        prompt,
+        parse,
+        model=CLAUDE_MODEL,
+        max_tokens=6000,
+        temperature=0.7,
+        max_retries=max_retries,
+        timings=timings
+    )
+    if not generation['success']:
+        return generation
 
-            logger.info(f"Claude API response received: {len(response_text)} characters")
+    return {
+        'success': True,
+        'article': generation['result']
+    }
 
-            # Parse the response to extract article components
-            parsed_result = parse_claude_response(response_text)
 
-            return {
-                'success': True,
-                'article': parsed_result
-            }
+def finalize_article(article, preview=None, timings=None):
+    """
+    Rapprochement du titre avec l'avant-première, puis contrôle qualité local et réparation
+    ciblée des sections fautives. Le contrôle vient après : un titre manquant est repris
+    de l'avant-première plutôt que réparé par un appel Claude.
+    """
+    if SPECULATIVE_TITLE and preview:
+        reconcile_headline(article, preview)
 
-        except anthropic.RateLimitError as e:
-            logger.warning(f"Rate limit error (attempt {attempt + 1}): {str(e)}")
-            if attempt < max_retries - 1:
-                # Exponential backoff
-                wait_time = 2 ** attempt
-                logger.info(f"Waiting {wait_time} seconds before retry...")
-                time.sleep(wait_time)
-            else:
-                return {
-                    'success': False,
-                    'error': f'Rate limit dépassé après {max_retries} tentatives'
-                }
+    if QUALITY_GATE:
+        article = enforce_article_quality(article)
+        if timings is not None:
+            timings['quality_checked_at'] = datetime.utcnow().isoformat()
 
-        except anthropic.APIError as e:
-            logger.error(f"Claude API error: {str(e)}")
-            if 'overloaded' in str(e).lower() or '529' in str(e):
-                return {
-                    'success': False,
-                    'error': 'IA temporairement surchargée. Merci de réessayer dans quelques instants.'
-                }
-            return {
-                'success': False,
-                'error': f'Erreur API Claude: {str(e)}'
-            }
+    return article
 
-        except Exception as e:
-            logger.error(f"Unexpected error calling Claude: {str(e)}")
-            return {
-                'success': False,
-                'error': f'Erreur inattendue: {str(e)}'
-            }
 
+# Avant-première : titre + introduction par un petit modèle, publiés sur le job en quelques secondes
+SPECULATIVE_INPUT_CHARS = 20000
+SPECULATIVE_MAX_TOKENS = 300
+SPECULATIVE_HEADLINE_RE = re.compile(r"TITRE\s*:\s*(?P<titre>[^\n]+)(?:.*?INTRODUCTION\s*:\s*(?P<introduction>.+))?", re.DOTALL)
+GENERIC_TITLES = {'', 'Article généré'}
+
+# Exécuteur dédié : l'appel spéculatif tourne pendant la génération de l'article
+speculative_executor = ThreadPoolExecutor(max_workers=2)
+
+
+def generate_speculative_headline(transcript_text, file_name):
+    """
+    Appel court au petit modèle (début de la transcription seulement).
+    Retourne {'titre', 'introduction'} ou None ; n'alimente ni le circuit breaker
+    ni le contrôleur de concurrence.
+    """
+    prompt = f"""Vous êtes rédacteur pour une radio locale (public CSP+ 30/60 ans, ton conversationnel).
+À partir de la transcription ci-dessous, rédigez le titre et l'introduction d'un article web.
+
+Ne pas utiliser : {', '.join(BANNED_PHRASES)}.
+
+FORMAT DE SORTIE OBLIGATOIRE :
+
+TITRE : [Un titre accrocheur et informatif]
+INTRODUCTION : [2-3 phrases d'accroche pour captiver le lecteur]
+
+Fichier audio source : {file_name}
+
+TRANSCRIPTION DE L'ÉMISSION RADIO :
+{transcript_text[:SPECULATIVE_INPUT_CHARS]}"""
+
+    # Hors contrôleur de concurrence : à limite 1, l'avant-première attendrait la fin de l'article
+    response = create_claude_message(
+        controlled=False,
+        model=SPECULATIVE_MODEL,
+        max_tokens=SPECULATIVE_MAX_TOKENS,
+        temperature=0.7,
+        messages=[{"role": "user", "content": prompt}]
+    )
+    response_text = response.content[0].text if response.content else ''
+
+    match = SPECULATIVE_HEADLINE_RE.search(response_text.replace('**', '').replace('*', ''))
+    if not match or not match.group('titre').strip():
+        return None
     return {
-        'success': False,
-        'error': 'Échec après toutes les tentatives'
+        'titre': match.group('titre').strip(),
+        'introduction': (match.group('introduction') or '').strip()
+    }
+
+
+def publish_speculative_headline(job_id, transcript_text, file_name):
+    """
+    Génère l'avant-première et la publie sur le job (attribut preview, diffusé par job-notifier).
+    Un échec est sans effet sur l'article : None est retourné.
+    """
+    try:
+        headline = generate_speculative_headline(transcript_text, file_name)
+        if not headline:
+            logger.warning(f"No speculative headline for job {job_id}")
+            return None
+
+        preview = {**headline, 'model': SPECULATIVE_MODEL}
+        update_job_status(
+            job_id,
+            'GENERATING',
+            fields={'preview': preview, 'preview_published_at': datetime.utcnow().isoformat()}
+        )
+        logger.info(f"Speculative headline published for job {job_id}")
+        return preview
+
+    except Exception as e:
+        logger.warning(f"Speculative headline failed for job {job_id}: {str(e)}")
+        return None
+
+
+def reconcile_headline(article, preview):
+    """
+    Rapproche le titre de l'article de celui déjà publié :
+    - force : le titre de l'avant-première est conservé (les lecteurs l'ont déjà vu)
+    - reconcile : le titre de l'article prévaut, l'avant-première ne sert que s'il manque
+    La décision est tracée dans article['headline'].
+    """
+    article_title = article.get('titre', '')
+    if SPECULATIVE_TITLE_MODE == 'force' or article_title in GENERIC_TITLES:
+        article['titre'] = preview['titre']
+        if not article.get('introduction'):
+            article['introduction'] = preview['introduction']
+        source = 'speculative'
+    else:
+        source = 'article'
+
+    article['headline'] = {
+        'source': source,
+        'speculative_titre': preview['titre'],
+        'changed': article['titre'] != preview['titre']
     }
+    logger.info(f"Headline reconciled ({SPECULATIVE_TITLE_MODE}): source {source}, changed {article['headline']['changed']}")
+    return article
 
 
 def parse_claude_response(response_text):
@@ -411,7 +666,207 @@ def parse_claude_response(response_text):
     return result
 
 
-def update_job_status(job_id, status, result=None, error=None):
+# Contrôle qualité local de l'article (contraintes du prompt) et réparation ciblée par section
+ARTICLE_MIN_WORDS = 800
+ARTICLE_MAX_WORDS = 1000
+# Marge avant de déclencher une réparation sur la longueur
+WORD_COUNT_TOLERANCE = 0.1
+# Le prompt vise ~80 ; en dessous de ce seuil, la section est réécrite
+FLESCH_MIN_SCORE = 55
+# Appels de réparation max par article (au-delà, l'article est conservé tel quel)
+QUALITY_MAX_REPAIR_CALLS = 3
+QUALITY_SECTIONS = ['titre', 'introduction', 'article', 'conclusion']
+BANNED_PHRASES = [
+    'optez', 'opter', 'plonger', 'plongez', 'plongeons', 'débloquer', 'débloquez', 'libérer', 'libérez',
+    'complexe', 'complexes', 'utilisation', 'transformation', 'alignement', 'proactif', 'proactive',
+    'évolutif', 'évolutive', 'benchmark', 'dans ce monde', "dans le monde d'aujourd'hui",
+    'à la fin de la journée', "sur la même longueur d'onde", 'de bout en bout', 'afin de',
+    'afin d', 'meilleures pratiques',
+]
+# Automate unique (alternation compilée, expressions les plus longues d'abord)
+BANNED_PHRASES_RE = re.compile(
+    r"(?<!\w)(?:" + '|'.join(re.escape(phrase) for phrase in sorted(BANNED_PHRASES, key=len, reverse=True)) + r")(?![\w])",
+    re.IGNORECASE
+)
+QUALITY_WORD_RE = re.compile(r"[^\W\d_]+(?:['’-][^\W\d_]+)*")
+QUALITY_SENTENCE_RE = re.compile(r"[.!?…]+(?:\s|$)|\n+")
+SYLLABLE_RE = re.compile(r"[aeiouyàâäéèêëîïôöùûüÿœæ]+", re.IGNORECASE)
+SILENT_ENDING_RE = re.compile(r"[^aeiouyàâäéèêëîïôöùûüÿœæ](?:e|es|ent)$", re.IGNORECASE)
+REPAIR_MAX_TOKENS = {'titre': 100, 'introduction': 400, 'conclusion': 300, 'paragraph': 800, 'article': 3000}
+
+
+def count_syllables_fr(word):
+    """
+    Approximation française : groupes de voyelles, "e" muet final non compté
+    """
+    syllables = len(SYLLABLE_RE.findall(word))
+    if syllables > 1 and SILENT_ENDING_RE.search(word):
+        syllables -= 1
+    return max(1, syllables)
+
+
+def flesch_score_fr(text):
+    """
+    Score de lisibilité Flesch adapté au français (Kandel et Moles)
+    """
+    words = QUALITY_WORD_RE.findall(text or '')
+    if not words:
+        return 0.0
+    sentences = max(1, len([s for s in QUALITY_SENTENCE_RE.split(text) if QUALITY_WORD_RE.search(s)]))
+    syllables = sum(count_syllables_fr(word) for word in words)
+    return 207 - 1.015 * (len(words) / sentences) - 73.6 * (syllables / len(words))
+
+
+def find_banned_phrases(text):
+    return sorted({match.group(0).lower() for match in BANNED_PHRASES_RE.finditer((text or '').replace('’', "'"))})
+
+
+def check_article_quality(article):
+    """
+    Vérifie les contraintes du prompt sur l'article parsé.
+    Retourne (metrics, issues) ; chaque problème : {'section', 'check', 'detail'}
+    """
+    issues = []
+    body = '\n\n'.join(article.get(key, '') for key in ['introduction', 'article', 'conclusion'])
+    word_count = len(QUALITY_WORD_RE.findall(body))
+    flesch = flesch_score_fr(body)
+
+    # Sections manquantes (le parsing de secours met tout dans 'article')
+    for section in QUALITY_SECTIONS:
+        if not article.get(section) or (section == 'titre' and article[section] == 'Article généré'):
+            issues.append({'section': section, 'check': 'missing', 'detail': 'section absente'})
+
+    for section in QUALITY_SECTIONS:
+        banned = find_banned_phrases(article.get(section, ''))
+        if banned:
+            issues.append({'section': section, 'check': 'banned_phrases', 'detail': ', '.join(banned)})
+
+    if word_count < ARTICLE_MIN_WORDS * (1 - WORD_COUNT_TOLERANCE) or word_count > ARTICLE_MAX_WORDS * (1 + WORD_COUNT_TOLERANCE):
+        issues.append({'section': 'article', 'check': 'word_count', 'detail': f"{word_count} mots"})
+
+    if word_count and flesch < FLESCH_MIN_SCORE:
+        issues.append({'section': 'article', 'check': 'flesch', 'detail': f"score {flesch:.0f}"})
+
+    metrics = {'word_count': word_count, 'flesch': int(round(flesch))}
+    return metrics, issues
+
+
+def _repair_instructions(section, issues, word_count):
+    instructions = []
+    for issue in issues:
+        if issue['check'] == 'banned_phrases':
+            instructions.append(f"Remplacer ces mots ou expressions interdits par des formulations naturelles : {issue['detail']}.")
+        elif issue['check'] == 'missing':
+            instructions.append(f"Rédiger la section {section.upper()} manquante à partir de l'article.")
+        elif issue['check'] == 'word_count':
+            target = (ARTICLE_MIN_WORDS + ARTICLE_MAX_WORDS) // 2
+            delta = target - word_count
+            verb = 'Développer' if delta > 0 else 'Resserrer'
+            instructions.append(f"{verb} le texte d'environ {abs(delta)} mots (l'article complet doit faire {ARTICLE_MIN_WORDS}-{ARTICLE_MAX_WORDS} mots).")
+        elif issue['check'] == 'flesch':
+            instructions.append("Simplifier pour viser un score de lisibilité Flesch autour de 80 : phrases plus courtes, mots plus simples.")
+    return ' '.join(instructions)
+
+
+def _request_repair(section, text, instructions, context, max_tokens):
+    """
+    Petit appel de réparation : seule la section fautive est envoyée et réécrite
+    """
+    prompt = f"""Vous corrigez une section d'un article web rédigé pour une radio locale (public CSP+ 30/60 ans, ton conversationnel).
+
+CORRECTIONS DEMANDÉES : {instructions}
+
+Conserver le sens, les faits, les citations et les sous-titres existants. Ne pas utiliser : {', '.join(BANNED_PHRASES)}.
+Répondre uniquement avec le texte corrigé de la section {section.upper()}, sans préfixe ni commentaire.
+
+CONTEXTE (titre et introduction) :
+{context}
+
+SECTION À CORRIGER :
+{text}"""
+
+    response = create_claude_message(
+        model=CLAUDE_MODEL,
+        max_tokens=max_tokens,
+        temperature=0.5,
+        messages=[{"role": "user", "content": prompt}]
+    )
+    repaired = response.content[0].text if response.content else ''
+    repaired = re.sub(rf"^\s*{section.upper()}\s*:\s*", '', repaired.strip(), flags=re.IGNORECASE)
+    return repaired.replace('**', '').replace('*', '').strip()
+
+
+def enforce_article_quality(article):
+    """
+    Contrôle qualité après parse_claude_response. En cas d'échec, seule la section fautive
+    est réparée par un petit appel (au lieu d'une régénération complète), puis l'article
+    est revérifié. Les métriques sont ajoutées dans article['quality'].
+    """
+    metrics, issues = check_article_quality(article)
+    repaired = []
+
+    # Corps absent : le parsing a échoué, une réparation ciblée n'a pas de base
+    if issues and article.get('article'):
+        issues_by_section = {}
+        for issue in issues:
+            issues_by_section.setdefault(issue['section'], []).append(issue)
+
+        context = f"TITRE : {article.get('titre', '')}\nINTRODUCTION : {article.get('introduction', '')}"
+        calls = 0
+
+        for section in QUALITY_SECTIONS:
+            section_issues = issues_by_section.get(section)
+            if not section_issues or calls >= QUALITY_MAX_REPAIR_CALLS:
+                continue
+
+            try:
+                instructions = _repair_instructions(section, section_issues, metrics['word_count'])
+                only_banned = all(issue['check'] == 'banned_phrases' for issue in section_issues)
+
+                if section == 'article' and only_banned:
+                    # Mots interdits dans le corps : seuls les paragraphes concernés sont réécrits
+                    paragraphs = article['article'].split('\n\n')
+                    for index, paragraph in enumerate(paragraphs):
+                        banned = find_banned_phrases(paragraph)
+                        if not banned or calls >= QUALITY_MAX_REPAIR_CALLS:
+                            continue
+                        calls += 1
+                        paragraphs[index] = _request_repair(
+                            'paragraphe',
+                            paragraph,
+                            f"Remplacer ces mots ou expressions interdits par des formulations naturelles : {', '.join(banned)}.",
+                            context,
+                            REPAIR_MAX_TOKENS['paragraph']
+                        ) or paragraph
+                    article['article'] = '\n\n'.join(paragraphs)
+                else:
+                    calls += 1
+                    source = article.get(section) or article['article']
+                    article[section] = _request_repair(
+                        section, source, instructions, context, REPAIR_MAX_TOKENS[section]
+                    ) or article.get(section, '')
+
+                repaired.append(section)
+
+            except Exception as e:
+                logger.warning(f"Quality repair failed for section {section}: {str(e)}")
+
+        if repaired:
+            metrics, issues = check_article_quality(article)
+
+    article['quality'] = {
+        **metrics,
+        'issues': [f"{issue['section']}:{issue['check']}" for issue in issues],
+        'repaired_sections': repaired
+    }
+    logger.info(
+        f"Quality gate: {metrics['word_count']} words, Flesch {metrics['flesch']}, "
+        f"repaired {repaired or 'none'}, remaining issues {article['quality']['issues'] or 'none'}"
+    )
+    return article
+
+
+def update_job_status(job_id, status, result=None, error=None, artifacts=None, fields=None):
     """
     Update job status in DynamoDB
     """
@@ -434,6 +889,16 @@ def update_job_status(job_id, status, result=None, error=None):
             update_expr += ", error_message = :error"
             expr_values[':error'] = error
 
+        if artifacts:
+            update_expr += ", artifacts = :artifacts"
+            expr_values[':artifacts'] = artifacts
+
+        # Horodatages d'étapes et attributs de suivi (queued_at, first_token_at, model...)
+        for name, value in (fields or {}).items():
+            update_expr += f", #{name} = :{name}"
+            expr_values[f":{name}"] = value
+            expr_names[f"#{name}"] = name
+
         if status == 'COMPLETED':
             update_expr += ", completed_at = :completed"
             expr_values[':completed'] = datetime.utcnow().isoformat()
@@ -474,7 +939,23 @@ def save_result_to_s3(job_id, user_id, article):
         return None
 
 
-def save_result_to_dynamodb(job_id, user_id, article, s3_key):
+def save_article_artifacts(job_id, user_id, article):
+    """
+    Pré-rend l'article (titre, introduction, corps, conclusion) en HTML et Markdown
+    """
+    return save_rendered_artifacts(
+        bucket=RESULTS_BUCKET,
+        base_key=f"{user_id}/articles/{job_id}/article",
+        title=article.get('titre', ''),
+        sections=[
+            (article.get('introduction', ''), 'introduction', False),
+            (article.get('article', ''), None, True),
+            (article.get('conclusion', ''), 'conclusion', False),
+        ]
+    )
+
+
+def save_result_to_dynamodb(job_id, user_id, article, s3_key, artifacts=None):
     """
     Save article result to DynamoDB with TTL (30 days)
     """
@@ -490,6 +971,7 @@ def save_result_to_dynamodb(job_id, user_id, article, s3_key):
                 'user_id': user_id,
                 'article': article,
                 's3_key': s3_key,
+                'artifacts': artifacts,
                 'created_at': datetime.utcnow().isoformat(),
                 'ttl': ttl
             }
@@ -499,3 +981,17 @@ def save_result_to_dynamodb(job_id, user_id, article, s3_key):
 
     except Exception as e:
         logger.error(f"Error saving to DynamoDB: {str(e)}")
+
+
+# Types de tâches de ce processeur (registre du task engine) :
+# prompt, parsing, crédit consommé et persistance du résultat
+TASK_DEFINITIONS = {
+    'article': {
+        'job_type': 'article',
+        'credit_attribute': 'remainingAudioCredits',
+        'build_prompt': lambda text, job, message: build_article_prompt(text, job.get('file_name', 'audio.mp3')),
+        'parse': parse_claude_response,
+        'persist': persist_article,
+        'matches': lambda message: 'transcript_text' in message
+    },
+}
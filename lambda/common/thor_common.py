@@ -0,0 +1,1595 @@
+import json
+import os
+import re
+import html
+import hashlib
+import logging
+import random
+import threading
+import tracemalloc
+from datetime import datetime
+from decimal import Decimal
+import time
+
+logger = logging.getLogger()
+logger.setLevel(logging.INFO)
+
+# Runtime commun aux processeurs article et titre (et au task engine qui les héberge) :
+# pool de clés Anthropic, cassettes, contrôleur de concurrence, circuit breaker, ordonnancement
+# équitable, préchargement, profilage mémoire, pré-résumé et rendu des artefacts.
+# Embarqué à côté de index.py par deploy-lambdas.sh ; un seul exemplaire par conteneur,
+# donc un état partagé par tous les pipelines d'un même worker.
+
+# Environment variables
+ANTHROPIC_API_KEY = os.environ.get('ANTHROPIC_API_KEY')
+ANTHROPIC_API_KEYS = os.environ.get('ANTHROPIC_API_KEYS', '')
+CIRCUIT_BREAKER_TABLE = os.environ.get('CIRCUIT_BREAKER_TABLE', 'thor-circuit-breaker')
+CIRCUIT_BREAKER_ENABLED = os.environ.get('CIRCUIT_BREAKER_ENABLED', 'true').lower() == 'true'
+CIRCUIT_OPEN_SECONDS = int(os.environ.get('CIRCUIT_OPEN_SECONDS', '60'))
+MEMORY_PROFILING = os.environ.get('MEMORY_PROFILING', 'false').lower() == 'true'
+ADAPTIVE_CONCURRENCY = os.environ.get('ADAPTIVE_CONCURRENCY', 'true').lower() == 'true'
+CONCURRENCY_MIN = int(os.environ.get('CONCURRENCY_MIN', '1'))
+CONCURRENCY_MAX = int(os.environ.get('CONCURRENCY_MAX', '8'))
+CONCURRENCY_INITIAL = int(os.environ.get('CONCURRENCY_INITIAL', '2'))
+FAIR_SHARE_ENABLED = os.environ.get('FAIR_SHARE_ENABLED', 'true').lower() == 'true'
+FAIR_SHARE_KEY = os.environ.get('FAIR_SHARE_KEY', 'user_id')
+FAIR_SHARE_MAX_PER_TENANT = int(os.environ.get('FAIR_SHARE_MAX_PER_TENANT', '2'))
+FAIR_SHARE_WEIGHTS = os.environ.get('FAIR_SHARE_WEIGHTS', '')
+FAIR_SHARE_DEFER_SECONDS = int(os.environ.get('FAIR_SHARE_DEFER_SECONDS', '30'))
+FAIR_SHARE_TABLE = os.environ.get('FAIR_SHARE_TABLE', 'thor-tenant-load')
+METRICS_NAMESPACE = os.environ.get('METRICS_NAMESPACE', 'ThorWeb')
+ANTHROPIC_CASSETTE_MODE = os.environ.get('ANTHROPIC_CASSETTE_MODE', 'off').lower()
+ANTHROPIC_CASSETTE_DIR = os.environ.get('ANTHROPIC_CASSETTE_DIR', '/tmp/anthropic-cassettes')
+ANTHROPIC_CASSETTE_LATENCY_SCALE = float(os.environ.get('ANTHROPIC_CASSETTE_LATENCY_SCALE', '1.0'))
+ANTHROPIC_CASSETTE_MATCH = os.environ.get('ANTHROPIC_CASSETTE_MATCH', 'exact').lower()
+FUNCTION_NAME = os.environ.get('AWS_LAMBDA_FUNCTION_NAME', 'local')
+REGION = 'eu-west-3'
+
+# Import AWS after environment setup
+import boto3
+from botocore.exceptions import ClientError
+
+# AWS clients
+dynamodb = boto3.resource('dynamodb', region_name=REGION)
+s3_client = boto3.client('s3', region_name=REGION)
+sqs_client = boto3.client('sqs', region_name=REGION)
+
+# Import and initialize Anthropic client
+import anthropic
+
+# numpy est optionnel : sans lui, le pré-résumé extractif est désactivé
+# (signalé dès le démarrage à froid : package construit sans roues Linux, par exemple)
+try:
+    import numpy as np
+except ImportError as e:
+    np = None
+    logger.warning(f"numpy not available ({str(e)}) - extractive pre-summary disabled")
+
+
+def env_setting(prefix, name, default):
+    """
+    Variable d'environnement d'un pipeline : <prefix><name> (task engine, un jeu de tables
+    par pipeline) prioritaire sur <name> (Lambda dédiée)
+    """
+    return os.environ.get(f"{prefix}{name}") or os.environ.get(name, default)
+
+
+def resolve_task_type(task_definitions, message):
+    """
+    Type de tâche d'un message : type explicite (task_type, posé par le task engine),
+    sinon premier type de task_definitions qui reconnaît le message (matches)
+    """
+    if message.get('task_type') in task_definitions:
+        return message['task_type']
+    for task_type, definition in task_definitions.items():
+        if definition['matches'](message):
+            return task_type
+    return None
+
+
+# Pool de clients Anthropic multi-clés, répartition selon la marge restante (headers rate-limit)
+RATE_LIMIT_COOLDOWN_SECONDS = 10
+
+
+def _parse_weight(value):
+    try:
+        weight = float(value)
+    except ValueError:
+        return None
+    return weight if weight > 0 else None
+
+
+def _parse_api_keys():
+    """
+    ANTHROPIC_API_KEYS="nom:cle:poids,..." (nom et poids optionnels), sinon ANTHROPIC_API_KEY.
+    Deux parties : "cle:poids" si la seconde est numérique, "nom:cle" sinon.
+    Les entrées invalides sont ignorées (journalisées sans la clé)
+    """
+    entries = []
+    for index, spec in enumerate(part.strip() for part in ANTHROPIC_API_KEYS.split(',') if part.strip()):
+        parts = [part.strip() for part in spec.split(':')]
+        name, weight = f"key{index + 1}", 1.0
+        if len(parts) == 3:
+            name, api_key = parts[0] or name, parts[1]
+            weight = _parse_weight(parts[2])
+        elif len(parts) == 2 and _parse_weight(parts[1]) is not None:
+            api_key, weight = parts[0], _parse_weight(parts[1])
+        elif len(parts) == 2:
+            name, api_key = parts[0] or name, parts[1]
+        elif len(parts) == 1:
+            api_key = parts[0]
+        else:
+            api_key = None
+
+        if not api_key or weight is None:
+            logger.error(f"Invalid ANTHROPIC_API_KEYS entry #{index + 1} ({len(parts)} parts), skipped")
+            continue
+        entries.append({'name': name, 'api_key': api_key, 'weight': weight})
+
+    if not entries and ANTHROPIC_API_KEY:
+        entries.append({'name': 'default', 'api_key': ANTHROPIC_API_KEY, 'weight': 1.0})
+
+    return entries
+
+
+claude_pool = [
+    {
+        'name': entry['name'],
+        'client': anthropic.Anthropic(api_key=entry['api_key']),
+        'weight': entry['weight'],
+        'headroom': 1.0,
+        'reset_at': 0.0,
+        'cooldown_until': 0.0
+    }
+    for entry in _parse_api_keys()
+]
+
+if not claude_pool and ANTHROPIC_CASSETTE_MODE != 'replay':
+    logger.warning("ANTHROPIC_API_KEY not set - Claude API calls will fail")
+
+
+def _parse_reset(value):
+    try:
+        return datetime.fromisoformat(value.replace('Z', '+00:00')).timestamp()
+    except (AttributeError, ValueError):
+        return 0.0
+
+
+def _update_headroom(entry, headers):
+    """
+    Marge restante = min(requêtes restantes / limite, tokens restants / limite)
+    """
+    ratios = []
+    resets = []
+    for kind in ('requests', 'tokens', 'input-tokens', 'output-tokens'):
+        limit = headers.get(f"anthropic-ratelimit-{kind}-limit")
+        remaining = headers.get(f"anthropic-ratelimit-{kind}-remaining")
+        if limit and remaining and float(limit) > 0:
+            ratios.append(float(remaining) / float(limit))
+            resets.append(_parse_reset(headers.get(f"anthropic-ratelimit-{kind}-reset")))
+
+    if ratios:
+        entry['headroom'] = max(0.0, min(ratios))
+        entry['reset_at'] = max(resets)
+
+
+def _current_headroom(entry, now):
+    if now >= entry['reset_at']:
+        return 1.0
+    return entry['headroom']
+
+
+def select_claude_client():
+    """
+    Choisit une clé du pool : tirage proportionnel à poids x marge restante,
+    les clés en pause après un 429 sont écartées tant qu'une autre est disponible.
+    Le tirage (plutôt que le maximum) évite que tous les conteneurs froids visent la même clé.
+    """
+    now = time.time()
+    available = [entry for entry in claude_pool if entry['cooldown_until'] <= now]
+    if not available:
+        return min(claude_pool, key=lambda entry: entry['cooldown_until'])
+
+    scores = [entry['weight'] * max(_current_headroom(entry, now), 0.01) for entry in available]
+    return random.choices(available, weights=scores)[0]
+
+
+def claude_pool_has_available_key():
+    now = time.time()
+    return any(entry['cooldown_until'] <= now for entry in claude_pool)
+
+
+# Cassettes Anthropic : ANTHROPIC_CASSETTE_MODE=record enregistre chaque appel (un fichier JSON
+# par empreinte de requête), replay les rejoue sans réseau avec la latence d'origine
+# multipliée par ANTHROPIC_CASSETTE_LATENCY_SCALE (0 = instantané).
+# ANTHROPIC_CASSETTE_MATCH=sequence rejoue dans l'ordre d'enregistrement les requêtes inconnues
+# (prompt modifié), pour mesurer un handler modifié sur un trafic de production réel.
+CASSETTE_RECORDED_HEADERS_PREFIX = 'anthropic-ratelimit-'
+_cassette_replay = {'index': None, 'sequences': None, 'served': {}, 'positions': {}, 'lock': threading.Lock()}
+
+
+def request_fingerprint(kwargs):
+    """
+    Empreinte stable d'une requête Claude (modèle, paramètres et messages)
+    """
+    payload = json.dumps(kwargs, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()[:32]
+
+
+def sequence_key(request):
+    """
+    Clé du mode sequence : (modèle, max_tokens), pour que l'appel article et les appels
+    de réparation d'un même modèle ne s'échangent pas leurs réponses
+    """
+    return request.get('model'), request.get('max_tokens')
+
+
+def record_cassette(kwargs, message, chunks, headers, started_at, finished_at):
+    """
+    Ajoute l'interaction à la cassette de la requête : réponse complète (usage inclus),
+    headers rate-limit et timing des chunks du stream ([décalage_s, caractères])
+    """
+    fingerprint = request_fingerprint(kwargs)
+    path = os.path.join(ANTHROPIC_CASSETTE_DIR, f"{fingerprint}.json")
+
+    try:
+        os.makedirs(ANTHROPIC_CASSETTE_DIR, exist_ok=True)
+        cassette = {'fingerprint': fingerprint, 'request': kwargs, 'interactions': []}
+        if os.path.exists(path):
+            with open(path, encoding='utf-8') as f:
+                cassette = json.load(f)
+
+        cassette['interactions'].append({
+            'model': kwargs.get('model'),
+            'recorded_at': datetime.utcfromtimestamp(started_at).isoformat(),
+            'duration_s': round(finished_at - started_at, 4),
+            'headers': {
+                name: value for name, value in headers.items()
+                if name.lower().startswith(CASSETTE_RECORDED_HEADERS_PREFIX)
+            },
+            'chunks': chunks,
+            'usage': message.usage.model_dump(mode='json') if getattr(message, 'usage', None) else None,
+            'response': message.model_dump(mode='json')
+        })
+
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(cassette, f, ensure_ascii=False, default=str)
+
+    except Exception as e:
+        logger.warning(f"Failed to record cassette {fingerprint}: {str(e)}")
+
+
+def _load_cassettes():
+    """
+    Index des cassettes : {empreinte: [interactions]} et, par (modèle, max_tokens), toutes les
+    interactions dans l'ordre d'enregistrement (mode sequence)
+    """
+    with _cassette_replay['lock']:
+        if _cassette_replay['index'] is None:
+            _index_cassettes()
+    return _cassette_replay['index'], _cassette_replay['sequences']
+
+
+def _index_cassettes():
+    """
+    Lit les cassettes de ANTHROPIC_CASSETTE_DIR (appelé une fois, sous verrou)
+    """
+    index = {}
+    recorded = []
+    if os.path.isdir(ANTHROPIC_CASSETTE_DIR):
+        for name in sorted(os.listdir(ANTHROPIC_CASSETTE_DIR)):
+            if not name.endswith('.json'):
+                continue
+            with open(os.path.join(ANTHROPIC_CASSETTE_DIR, name), encoding='utf-8') as f:
+                cassette = json.load(f)
+            index[cassette['fingerprint']] = cassette['interactions']
+            key = sequence_key(cassette.get('request', {}))
+            recorded.extend((key, interaction) for interaction in cassette['interactions'])
+
+    sequences = {}
+    for key, interaction in sorted(recorded, key=lambda item: item[1]['recorded_at']):
+        sequences.setdefault(key, []).append(interaction)
+
+    _cassette_replay['index'] = index
+    _cassette_replay['sequences'] = sequences
+    logger.info(f"Loaded {len(index)} cassettes ({len(recorded)} interactions) from {ANTHROPIC_CASSETTE_DIR}")
+
+
+def _next_interaction(counters, key, interactions):
+    # Appels rejoués en parallèle (task engine, vagues d'import) : compteurs sous verrou
+    with _cassette_replay['lock']:
+        served = counters.get(key, 0)
+        counters[key] = served + 1
+    return interactions[served % len(interactions)]
+
+
+def replay_cassette(kwargs, timings=None):
+    """
+    Rejoue une interaction enregistrée : respecte le timing des chunks (mis à l'échelle)
+    et complète timings comme un vrai appel streaming
+    """
+    index, sequences = _load_cassettes()
+    fingerprint = request_fingerprint(kwargs)
+
+    if index.get(fingerprint):
+        interaction = _next_interaction(_cassette_replay['served'], fingerprint, index[fingerprint])
+    elif ANTHROPIC_CASSETTE_MATCH == 'sequence' and sequences.get(sequence_key(kwargs)):
+        key = sequence_key(kwargs)
+        interaction = _next_interaction(_cassette_replay['positions'], key, sequences[key])
+    else:
+        raise Exception(f"No cassette recorded for request {fingerprint}")
+
+    started_at = time.time()
+    for offset, _ in interaction['chunks']:
+        delay = offset * ANTHROPIC_CASSETTE_LATENCY_SCALE - (time.time() - started_at)
+        if delay > 0:
+            time.sleep(delay)
+        if timings is not None and 'first_token_at' not in timings:
+            timings['first_token_at'] = datetime.utcnow().isoformat()
+
+    remaining = interaction['duration_s'] * ANTHROPIC_CASSETTE_LATENCY_SCALE - (time.time() - started_at)
+    if remaining > 0:
+        time.sleep(remaining)
+
+    if timings is not None:
+        timings['generation_finished_at'] = datetime.utcnow().isoformat()
+    return anthropic.types.Message.model_validate(interaction['response'])
+
+
+# Contrôleur de concurrence adaptatif (AIMD) : limite les appels Claude simultanés du worker.
+# +1/limite par succès obtenu limite atteinte (soit +1 par "fenêtre" pleine), x0.5 sur 429/529,
+# x0.9 si le premier token, la latence par token de sortie dépassent 2x la référence du modèle
+# ou si la marge de la clé est presque épuisée.
+CONCURRENCY_BACKOFF_FACTOR = 0.5
+CONCURRENCY_CONGESTION_FACTOR = 0.9
+CONCURRENCY_LATENCY_TOLERANCE = 2.0
+CONCURRENCY_HEADROOM_FLOOR = 0.1
+# Une seule baisse par intervalle : des échecs simultanés ne comptent qu'une fois
+CONCURRENCY_DECREASE_COOLDOWN_SECONDS = 5
+LATENCY_BASELINE_ALPHA = 0.05
+
+_concurrency = {
+    'limit': float(max(CONCURRENCY_MIN, min(CONCURRENCY_MAX, CONCURRENCY_INITIAL))),
+    'in_flight': 0,
+    'condition': threading.Condition(),
+    # Références de latence par modèle : {model: {'ttft': s, 'latency': s/token}}
+    'baselines': {},
+    'last_decrease': 0.0
+}
+
+
+def acquire_generation_slot():
+    """
+    Attend qu'un slot soit libre sous la limite courante.
+    Retourne True si l'appel occupe le dernier slot (limite atteinte)
+    """
+    if not ADAPTIVE_CONCURRENCY:
+        return False
+    condition = _concurrency['condition']
+    with condition:
+        while _concurrency['in_flight'] >= int(_concurrency['limit']):
+            condition.wait(timeout=1.0)
+        _concurrency['in_flight'] += 1
+        return _concurrency['in_flight'] >= int(_concurrency['limit'])
+
+
+def _decrease_concurrency(factor, reason, now):
+    if now - _concurrency['last_decrease'] < CONCURRENCY_DECREASE_COOLDOWN_SECONDS:
+        return
+    _concurrency['limit'] = max(float(CONCURRENCY_MIN), _concurrency['limit'] * factor)
+    _concurrency['last_decrease'] = now
+    logger.info(f"Concurrency limit decreased to {_concurrency['limit']:.2f} ({reason})")
+
+
+def _update_baseline(model, name, sample):
+    baselines = _concurrency['baselines'].setdefault(model, {})
+    baseline = baselines.get(name)
+    baselines[name] = sample if baseline is None else baseline + LATENCY_BASELINE_ALPHA * (sample - baseline)
+    return baseline
+
+
+def release_generation_slot(outcome):
+    """
+    Libère le slot et ajuste la limite selon le résultat de l'appel
+    outcome: {'model', 'started_at', 'first_token_at', 'finished_at', 'output_tokens', 'headroom',
+              'saturated', 'error'}
+    """
+    if not ADAPTIVE_CONCURRENCY:
+        return
+
+    now = time.time()
+    condition = _concurrency['condition']
+    with condition:
+        # Limite atteinte au début ou à la fin de l'appel : seule preuve que la limite contraint le débit
+        saturated = outcome.get('saturated') or _concurrency['in_flight'] >= int(_concurrency['limit'])
+        _concurrency['in_flight'] -= 1
+        error = outcome.get('error')
+        model = outcome.get('model')
+
+        if isinstance(error, anthropic.RateLimitError):
+            _decrease_concurrency(CONCURRENCY_BACKOFF_FACTOR, 'rate limited', now)
+        elif isinstance(error, anthropic.APIError) and is_overloaded_error(error):
+            _decrease_concurrency(CONCURRENCY_BACKOFF_FACTOR, 'overloaded', now)
+        elif error is None:
+            congestion = None
+            if outcome.get('headroom') is not None and outcome['headroom'] < CONCURRENCY_HEADROOM_FLOOR:
+                congestion = 'low headroom'
+
+            if outcome.get('first_token_at'):
+                ttft = outcome['first_token_at'] - outcome['started_at']
+                baseline = _update_baseline(model, 'ttft', ttft)
+                if baseline and ttft > CONCURRENCY_LATENCY_TOLERANCE * baseline:
+                    congestion = congestion or 'slow first token'
+
+            # Latence par token de sortie : indépendante de la longueur de la réponse
+            latency = (outcome.get('finished_at', now) - outcome['started_at']) / max(1, outcome.get('output_tokens') or 0)
+            baseline = _update_baseline(model, 'latency', latency)
+            if baseline and latency > CONCURRENCY_LATENCY_TOLERANCE * baseline:
+                congestion = congestion or 'slow generation'
+
+            if congestion:
+                _decrease_concurrency(CONCURRENCY_CONGESTION_FACTOR, congestion, now)
+            elif saturated:
+                # Sous la limite, un succès ne dit rien de la capacité : pas d'augmentation
+                _concurrency['limit'] = min(float(CONCURRENCY_MAX), _concurrency['limit'] + 1.0 / _concurrency['limit'])
+
+        limit = _concurrency['limit']
+        in_flight = _concurrency['in_flight']
+        condition.notify_all()
+
+    # Une limite par worker (partagée par les pipelines du task engine) : dimension Function
+    emit_metrics({'Function': FUNCTION_NAME}, {'ConcurrencyLimit': round(limit, 2), 'InFlight': in_flight})
+
+
+def create_claude_message(timings=None, controlled=True, **kwargs):
+    """
+    Appel Claude sous le contrôleur de concurrence adaptatif (voir _create_claude_message).
+    controlled=False : appel court hors contrôleur (avant-première), qui n'attend pas un slot
+    occupé par l'appel principal et n'ajuste pas la limite (un 429 met tout de même la clé en pause)
+    """
+    if not controlled:
+        outcome = {'first_token_at': None, 'headroom': None}
+        return _create_claude_message(timings, outcome, kwargs)
+
+    saturated = acquire_generation_slot()
+    outcome = {
+        'model': kwargs.get('model'),
+        'started_at': time.time(),
+        'first_token_at': None,
+        'output_tokens': 0,
+        'headroom': None,
+        'saturated': saturated,
+        'error': None
+    }
+    try:
+        message = _create_claude_message(timings, outcome, kwargs)
+        usage = getattr(message, 'usage', None)
+        outcome['output_tokens'] = getattr(usage, 'output_tokens', 0) or 0
+        outcome['finished_at'] = time.time()
+        return message
+    except Exception as e:
+        outcome['error'] = e
+        raise
+    finally:
+        release_generation_slot(outcome)
+
+
+def _create_claude_message(timings, outcome, kwargs):
+    """
+    Appel Claude (streaming) via le pool : met à jour la marge de la clé utilisée,
+    ou la met en pause (retry-after) sur un 429 avant de relancer l'erreur.
+    timings: dict optionnel complété avec first_token_at et generation_finished_at.
+    Enregistre ou rejoue l'appel selon ANTHROPIC_CASSETTE_MODE.
+    """
+    if ANTHROPIC_CASSETTE_MODE == 'replay':
+        return replay_cassette(kwargs, timings)
+
+    entry = select_claude_client()
+    recording = ANTHROPIC_CASSETTE_MODE == 'record'
+    started_at = time.time()
+    chunks = []
+    try:
+        with entry['client'].messages.stream(**kwargs) as stream:
+            _update_headroom(entry, stream.response.headers)
+            outcome['headroom'] = entry['headroom']
+            for text in stream.text_stream:
+                if outcome['first_token_at'] is None:
+                    outcome['first_token_at'] = time.time()
+                if recording:
+                    chunks.append([round(time.time() - started_at, 4), len(text)])
+                if timings is not None and 'first_token_at' not in timings:
+                    timings['first_token_at'] = datetime.utcnow().isoformat()
+            message = stream.get_final_message()
+
+        if timings is not None:
+            timings['generation_finished_at'] = datetime.utcnow().isoformat()
+        if recording:
+            record_cassette(kwargs, message, chunks, stream.response.headers, started_at, time.time())
+        return message
+
+    except anthropic.RateLimitError as e:
+        headers = e.response.headers if getattr(e, 'response', None) is not None else {}
+        try:
+            retry_after = float(headers.get('retry-after', RATE_LIMIT_COOLDOWN_SECONDS))
+        except (TypeError, ValueError):
+            retry_after = RATE_LIMIT_COOLDOWN_SECONDS
+        entry['cooldown_until'] = time.time() + retry_after
+        entry['headroom'] = 0.0
+        logger.warning(f"Anthropic key {entry['name']} rate limited, paused for {retry_after:.0f}s")
+        raise
+
+
+def generate_with_retry(prompt, parse, model, max_tokens, temperature, max_retries=3, timings=None):
+    """
+    Appel Claude avec retry puis parsing de la réponse (parse(texte) -> résultat).
+    429 : nouvel essai immédiat sur une autre clé du pool, sinon backoff exponentiel.
+    Surcharge (529) : 'overloaded' pour que l'appelant remette le job en file.
+    Retourne {'success': True, 'result': ...} ou {'success': False, 'error': ...}
+    """
+    if not claude_pool and ANTHROPIC_CASSETTE_MODE != 'replay':
+        return {
+            'success': False,
+            'error': 'API Claude non configurée'
+        }
+
+    for attempt in range(max_retries):
+        try:
+            logger.info(f"Calling Claude API (attempt {attempt + 1}/{max_retries})")
+            if timings is not None:
+                timings.setdefault('generation_started_at', datetime.utcnow().isoformat())
+
+            # Call Claude API
+            response = create_claude_message(
+                timings=timings,
+                model=model,
+                max_tokens=max_tokens,
+                temperature=temperature,
+                messages=[
+                    {
+                        "role": "user",
+                        "content": prompt
+                    }
+                ]
+            )
+
+            # Extract response text
+            response_text = response.content[0].text if response.content else ""
+
+            logger.info(f"Claude API response received: {len(response_text)} characters")
+
+            record_circuit_result(overloaded=False)
+
+            return {
+                'success': True,
+                'result': parse(response_text)
+            }
+
+        except anthropic.RateLimitError as e:
+            logger.warning(f"Rate limit error (attempt {attempt + 1}): {str(e)}")
+            if attempt < max_retries - 1:
+                # Une autre clé du pool a de la marge : réessayer immédiatement dessus
+                if claude_pool_has_available_key():
+                    continue
+                # Exponential backoff
+                wait_time = 2 ** attempt
+                logger.info(f"Waiting {wait_time} seconds before retry...")
+                time.sleep(wait_time)
+            else:
+                return {
+                    'success': False,
+                    'error': f'Rate limit dépassé après {max_retries} tentatives'
+                }
+
+        except anthropic.APIError as e:
+            logger.error(f"Claude API error: {str(e)}")
+            if is_overloaded_error(e):
+                record_circuit_result(overloaded=True)
+                return {
+                    'success': False,
+                    'overloaded': True,
+                    'error': 'IA temporairement surchargée. Merci de réessayer dans quelques instants.'
+                }
+            return {
+                'success': False,
+                'error': f'Erreur API Claude: {str(e)}'
+            }
+
+        except Exception as e:
+            logger.error(f"Unexpected error calling Claude: {str(e)}")
+            return {
+                'success': False,
+                'error': f'Erreur inattendue: {str(e)}'
+            }
+
+    return {
+        'success': False,
+        'error': 'Échec après toutes les tentatives'
+    }
+
+
+def estimate_tokens(text):
+    """
+    Estimation rapide du nombre de tokens (~4 caractères par token)
+    """
+    return (len(text) + 3) // 4
+
+
+# Pré-résumé extractif local (TF-IDF + TextRank) des entrées qui dépassent le budget de tokens
+PRESUMMARY_SPLIT_RE = re.compile(r"(?<=[.!?…])\s+|\s*\n+\s*")
+PRESUMMARY_WORD_RE = re.compile(r"[^\W\d_]{3,}")
+# Au-delà, les phrases voisines sont regroupées (matrice de similarité n x n bornée)
+PRESUMMARY_MAX_UNITS = 2000
+PRESUMMARY_MAX_TERMS = 4000
+TEXTRANK_DAMPING = 0.85
+TEXTRANK_MAX_ITERATIONS = 50
+PRESUMMARY_STOPWORDS = {
+    'les', 'des', 'une', 'est', 'que', 'qui', 'dans', 'pour', 'pas', 'sur', 'par', 'avec', 'son', 'ses',
+    'sa', 'leur', 'leurs', 'nous', 'vous', 'ils', 'elle', 'elles', 'mais', 'donc', 'alors', 'comme',
+    'cette', 'ces', 'cet', 'aussi', 'plus', 'moins', 'tout', 'tous', 'toute', 'toutes', 'très', 'bien',
+    'fait', 'faire', 'être', 'avoir', 'ont', 'sont', 'était', 'été', 'sera', 'peut', 'quand', 'où',
+    'oui', 'non', 'moi', 'toi', 'lui', 'eux', 'même', 'encore', 'déjà', 'ici', 'voilà', 'quoi', 'hein',
+    'euh', 'ben', 'bah', 'bon', 'ceux', 'celle', 'celui', 'dont', 'autre', 'autres', 'entre', 'après',
+    'avant', 'sans', 'sous', 'chez', 'vers', 'parce', 'puis', 'notre', 'votre', 'nos', 'vos', 'mes',
+    'tes', 'mon', 'ton', 'aux', 'avait', 'cela', 'ceci', 'rien', 'chose',
+}
+
+
+def _presummary_units(text):
+    units = [unit for unit in PRESUMMARY_SPLIT_RE.split(text) if unit.strip()]
+    if len(units) > PRESUMMARY_MAX_UNITS:
+        size = -(-len(units) // PRESUMMARY_MAX_UNITS)
+        units = [' '.join(units[i:i + size]) for i in range(0, len(units), size)]
+    return units
+
+
+def _tfidf_matrix(units):
+    """
+    Matrice TF-IDF (tf logarithmique, lignes normalisées L2) des unités.
+    Les termes présents dans une seule unité ou dans plus de la moitié sont ignorés.
+    """
+    tokenized = [
+        [word for word in PRESUMMARY_WORD_RE.findall(unit.lower()) if word not in PRESUMMARY_STOPWORDS]
+        for unit in units
+    ]
+    document_frequency = {}
+    for words in tokenized:
+        for word in set(words):
+            document_frequency[word] = document_frequency.get(word, 0) + 1
+
+    count = len(units)
+    max_frequency = max(2, count // 2)
+    vocabulary = [word for word, frequency in document_frequency.items() if 2 <= frequency <= max_frequency]
+    vocabulary = sorted(vocabulary, key=lambda word: -document_frequency[word])[:PRESUMMARY_MAX_TERMS]
+    columns_by_word = {word: column for column, word in enumerate(vocabulary)}
+
+    rows, columns = [], []
+    for row, words in enumerate(tokenized):
+        for word in words:
+            column = columns_by_word.get(word)
+            if column is not None:
+                rows.append(row)
+                columns.append(column)
+
+    matrix = np.zeros((count, len(vocabulary)), dtype=np.float32)
+    if not vocabulary:
+        return matrix
+    np.add.at(matrix, (np.array(rows), np.array(columns)), 1.0)
+
+    idf = np.log(count / np.array([document_frequency[word] for word in vocabulary], dtype=np.float32)) + 1.0
+    matrix = np.log1p(matrix) * idf
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    matrix /= np.where(norms == 0, 1.0, norms)
+    return matrix
+
+
+def _textrank_scores(matrix):
+    """
+    TextRank : itération de puissance sur le graphe de similarité cosinus des unités
+    """
+    count = matrix.shape[0]
+    similarity = matrix @ matrix.T
+    np.fill_diagonal(similarity, 0.0)
+
+    row_sums = similarity.sum(axis=1, keepdims=True)
+    similarity /= np.where(row_sums == 0, 1.0, row_sums)
+    # Unités sans voisin : transition uniforme
+    similarity[row_sums[:, 0] == 0] = 1.0 / count
+
+    scores = np.full(count, 1.0 / count, dtype=np.float32)
+    for _ in range(TEXTRANK_MAX_ITERATIONS):
+        updated = (1.0 - TEXTRANK_DAMPING) / count + TEXTRANK_DAMPING * (similarity.T @ scores)
+        converged = np.abs(updated - scores).sum() < 1e-6
+        scores = updated
+        if converged:
+            break
+    return scores
+
+
+def presummarize_text(text, token_budget):
+    """
+    Pré-résumé extractif local, sans appel modèle : sélectionne les phrases les plus
+    informatives (TF-IDF + TextRank) dans leur ordre d'origine, jusqu'au budget de tokens.
+    Le texte est inchangé s'il tient dans le budget ou si numpy n'est pas disponible.
+    Retourne (texte, stats)
+    """
+    text = text or ''
+    original_tokens = estimate_tokens(text)
+    stats = {
+        'applied': False,
+        'original_tokens': original_tokens,
+        'presummary_tokens': original_tokens,
+        'units': 0,
+        'selected_units': 0
+    }
+
+    if original_tokens <= token_budget:
+        return text, stats
+    if np is None:
+        logger.warning("numpy not available - extractive pre-summary skipped")
+        return text, stats
+
+    units = _presummary_units(text)
+    stats['units'] = len(units)
+    if len(units) < 2:
+        return text, stats
+
+    # Sans vocabulaire discriminant, les scores sont uniformes : les premières unités sont gardées
+    scores = _textrank_scores(_tfidf_matrix(units))
+
+    selected = []
+    used_tokens = 0
+    for index in np.argsort(-scores, kind='stable'):
+        cost = estimate_tokens(units[index]) + 1
+        if used_tokens + cost > token_budget:
+            continue
+        selected.append(index)
+        used_tokens += cost
+    selected.sort()
+
+    separator = '\n' if '\n' in text else ' '
+    summary = separator.join(units[index].strip() for index in selected)
+
+    stats.update({
+        'applied': True,
+        'presummary_tokens': estimate_tokens(summary),
+        'selected_units': len(selected)
+    })
+    return summary, stats
+
+
+def batch_get_items(table_keys, max_attempts=5):
+    """
+    Lecture groupée (BatchGetItem) sur plusieurs tables, avec reprise des UnprocessedKeys.
+    table_keys: {table_name: (key_name, valeurs)}
+    Retourne {table_name: {valeur_cle: item}}
+    """
+    results = {table_name: {} for table_name in table_keys}
+    pending = [
+        (table_name, key_name, value)
+        for table_name, (key_name, values) in table_keys.items()
+        for value in sorted(set(values))
+    ]
+    key_names = {table_name: key_name for table_name, (key_name, _) in table_keys.items()}
+
+    # BatchGetItem accepte 100 clés maximum par appel
+    for chunk_start in range(0, len(pending), 100):
+        request_items = {}
+        for table_name, key_name, value in pending[chunk_start:chunk_start + 100]:
+            request_items.setdefault(table_name, {'Keys': []})['Keys'].append({key_name: value})
+
+        attempt = 0
+        while request_items:
+            response = dynamodb.batch_get_item(RequestItems=request_items)
+            for table_name, items in response.get('Responses', {}).items():
+                for item in items:
+                    results[table_name][item[key_names[table_name]]] = item
+
+            request_items = response.get('UnprocessedKeys') or {}
+            attempt += 1
+            if request_items:
+                if attempt >= max_attempts:
+                    logger.warning(f"BatchGetItem: unprocessed keys left after {max_attempts} attempts")
+                    break
+                time.sleep(0.05 * 2 ** attempt)
+
+    return results
+
+
+def prefetch_batch_items(records, jobs_table, subscriptions_table):
+    """
+    Précharge en une ou deux lectures groupées les jobs et abonnements d'un batch SQS.
+    Retourne (jobs, subscriptions) indexés par job_id / userId.
+    En cas d'erreur, les dictionnaires sont partiels et le traitement retombe sur get_item.
+    """
+    job_ids = set()
+    user_ids = set()
+    for record in records:
+        try:
+            message = json.loads(record['body'])
+        except (KeyError, TypeError, ValueError):
+            continue
+        if message.get('job_id'):
+            job_ids.add(message['job_id'])
+        if message.get('user_id') and message['user_id'] != 'unknown':
+            user_ids.add(message['user_id'])
+
+    jobs = {}
+    subscriptions = {}
+    try:
+        results = batch_get_items({
+            jobs_table: ('job_id', job_ids),
+            subscriptions_table: ('userId', user_ids)
+        })
+        jobs = results[jobs_table]
+        subscriptions = results[subscriptions_table]
+
+        # Deuxième lecture pour les utilisateurs connus uniquement via le job
+        missing_user_ids = {job.get('user_id') for job in jobs.values()} - set(subscriptions) - {None, 'unknown'}
+        if missing_user_ids:
+            subscriptions.update(
+                batch_get_items({subscriptions_table: ('userId', missing_user_ids)})[subscriptions_table]
+            )
+
+        logger.info(f"Prefetched {len(jobs)} jobs and {len(subscriptions)} subscriptions")
+
+    except Exception as e:
+        logger.error(f"Error prefetching batch items: {str(e)}")
+
+    return jobs, subscriptions
+
+
+def consume_credits(subscriptions_table, user_id, credit_attribute, count=1):
+    """
+    Décrémente atomiquement count crédits (credit_attribute) d'un abonnement actif :
+    écriture conditionnelle relative, sans écraser les réservations ou remboursements concurrents.
+    Retourne le solde restant, ou None si l'abonnement n'est plus actif ou le solde insuffisant.
+    """
+    try:
+        response = dynamodb.Table(subscriptions_table).update_item(
+            Key={'userId': user_id},
+            UpdateExpression="SET #credits = #credits - :count, updatedAt = :timestamp",
+            ConditionExpression="subscriptionStatus = :active AND #credits >= :count",
+            ExpressionAttributeNames={'#credits': credit_attribute},
+            ExpressionAttributeValues={
+                ':count': count,
+                ':active': 'active',
+                ':timestamp': datetime.utcnow().isoformat()
+            },
+            ReturnValues='UPDATED_NEW'
+        )
+        return int(response['Attributes'][credit_attribute])
+
+    except ClientError as e:
+        if e.response['Error']['Code'] == 'ConditionalCheckFailedException':
+            return None
+        raise
+
+
+# Circuit breaker partagé (table DynamoDB) pour les surcharges Anthropic (529 / overloaded)
+CIRCUIT_KEY = 'anthropic'
+CIRCUIT_WINDOW_SECONDS = 60
+CIRCUIT_MIN_REQUESTS = 5
+CIRCUIT_FAILURE_RATIO = 0.5
+CIRCUIT_CACHE_SECONDS = 5
+CIRCUIT_PROBE_TIMEOUT_SECONDS = 300
+SQS_MAX_DELAY_SECONDS = 900
+
+# État lu depuis DynamoDB, mis en cache quelques secondes par conteneur
+_circuit_cache = {'state': None, 'fetched_at': 0.0}
+# Sonde half-open détenue par ce conteneur (fil qui l'a obtenue)
+_circuit_probe = {'active': False, 'owner': None}
+
+
+def is_overloaded_error(error):
+    """
+    Détecte une erreur de surcharge Anthropic (HTTP 529 / overloaded_error)
+    """
+    return getattr(error, 'status_code', None) == 529 or 'overloaded' in str(error).lower() or '529' in str(error)
+
+
+def _set_circuit_cache(state):
+    _circuit_cache['state'] = state
+    _circuit_cache['fetched_at'] = time.time()
+
+
+def _load_circuit_state(force=False):
+    """
+    Lit l'état du circuit (cache mémoire, puis DynamoDB). En cas d'erreur le circuit est considéré fermé.
+    """
+    if not force and _circuit_cache['state'] is not None \
+            and time.time() - _circuit_cache['fetched_at'] < CIRCUIT_CACHE_SECONDS:
+        return _circuit_cache['state']
+
+    try:
+        table = dynamodb.Table(CIRCUIT_BREAKER_TABLE)
+        response = table.get_item(Key={'breaker_id': CIRCUIT_KEY}, ConsistentRead=True)
+        state = response.get('Item') or {'state': 'CLOSED'}
+    except Exception as e:
+        logger.warning(f"Circuit breaker state unavailable, assuming CLOSED: {str(e)}")
+        state = {'state': 'CLOSED'}
+
+    _set_circuit_cache(state)
+    return state
+
+
+def circuit_allows_request():
+    """
+    Indique si un appel Claude peut partir.
+    Retourne (autorise, attente_secondes). Quand le délai d'ouverture est écoulé,
+    une seule invocation obtient le droit de sonder l'API (half-open).
+    """
+    if not CIRCUIT_BREAKER_ENABLED:
+        return True, 0
+
+    state = _load_circuit_state()
+    if state.get('state', 'CLOSED') == 'CLOSED':
+        return True, 0
+
+    now = time.time()
+    open_until = float(state.get('open_until', 0))
+    probe_until = float(state.get('probe_until', 0))
+    if now < open_until:
+        return False, open_until - now
+    if now < probe_until:
+        return False, CIRCUIT_OPEN_SECONDS
+
+    # Tenter de devenir la sonde half-open (écriture conditionnelle, une seule gagnante)
+    try:
+        table = dynamodb.Table(CIRCUIT_BREAKER_TABLE)
+        response = table.update_item(
+            Key={'breaker_id': CIRCUIT_KEY},
+            UpdateExpression="SET #state = :half_open, probe_until = :probe_until",
+            ConditionExpression="#state <> :closed AND open_until <= :now "
+                                "AND (attribute_not_exists(probe_until) OR probe_until <= :now)",
+            ExpressionAttributeNames={'#state': 'state'},
+            ExpressionAttributeValues={
+                ':half_open': 'HALF_OPEN',
+                ':closed': 'CLOSED',
+                ':now': Decimal(str(now)),
+                ':probe_until': Decimal(str(now + CIRCUIT_PROBE_TIMEOUT_SECONDS))
+            },
+            ReturnValues='ALL_NEW'
+        )
+        _set_circuit_cache(response['Attributes'])
+        _circuit_probe['active'] = True
+        _circuit_probe['owner'] = threading.get_ident()
+        logger.info("Circuit breaker HALF_OPEN: this invocation sends the probe request")
+        return True, 0
+
+    except ClientError as e:
+        if e.response.get('Error', {}).get('Code') == 'ConditionalCheckFailedException':
+            _load_circuit_state(force=True)
+            return False, CIRCUIT_OPEN_SECONDS
+        logger.warning(f"Circuit breaker probe failed, allowing request: {str(e)}")
+        return True, 0
+
+    except Exception as e:
+        logger.warning(f"Circuit breaker probe failed, allowing request: {str(e)}")
+        return True, 0
+
+
+def release_circuit_probe():
+    """
+    Libère la sonde half-open si l'invocation l'a obtenue sans appeler Claude (crédit refusé,
+    job introuvable, erreur S3...) : une autre invocation peut sonder aussitôt, et aucun appel
+    ultérieur sans rapport ne fermera ni ne rouvrira le circuit à sa place.
+    """
+    # Task engine : ne pas libérer la sonde obtenue par l'autre pipeline
+    if not _circuit_probe['active'] or _circuit_probe['owner'] != threading.get_ident():
+        return
+    _circuit_probe['active'] = False
+
+    try:
+        table = dynamodb.Table(CIRCUIT_BREAKER_TABLE)
+        response = table.update_item(
+            Key={'breaker_id': CIRCUIT_KEY},
+            UpdateExpression="SET probe_until = :now",
+            ConditionExpression="#state = :half_open",
+            ExpressionAttributeNames={'#state': 'state'},
+            ExpressionAttributeValues={
+                ':half_open': 'HALF_OPEN',
+                ':now': Decimal(str(time.time()))
+            },
+            ReturnValues='ALL_NEW'
+        )
+        _set_circuit_cache(response['Attributes'])
+        logger.info("Circuit breaker probe released without a Claude call")
+
+    except ClientError as e:
+        if e.response.get('Error', {}).get('Code') != 'ConditionalCheckFailedException':
+            logger.warning(f"Error releasing circuit breaker probe: {str(e)}")
+
+    except Exception as e:
+        logger.warning(f"Error releasing circuit breaker probe: {str(e)}")
+
+
+def _open_circuit(now):
+    table = dynamodb.Table(CIRCUIT_BREAKER_TABLE)
+    response = table.update_item(
+        Key={'breaker_id': CIRCUIT_KEY},
+        UpdateExpression="SET #state = :open, open_until = :open_until, opened_at = :now REMOVE probe_until",
+        ExpressionAttributeNames={'#state': 'state'},
+        ExpressionAttributeValues={
+            ':open': 'OPEN',
+            ':now': Decimal(str(now)),
+            ':open_until': Decimal(str(now + CIRCUIT_OPEN_SECONDS))
+        },
+        ReturnValues='ALL_NEW'
+    )
+    _set_circuit_cache(response['Attributes'])
+    logger.warning(f"Circuit breaker OPEN for {CIRCUIT_OPEN_SECONDS}s (Anthropic overloaded)")
+
+
+def _close_circuit():
+    table = dynamodb.Table(CIRCUIT_BREAKER_TABLE)
+    table.update_item(
+        Key={'breaker_id': CIRCUIT_KEY},
+        UpdateExpression="SET #state = :closed REMOVE open_until, probe_until",
+        ExpressionAttributeNames={'#state': 'state'},
+        ExpressionAttributeValues={':closed': 'CLOSED'}
+    )
+    _set_circuit_cache({'state': 'CLOSED'})
+    logger.info("Circuit breaker CLOSED: Anthropic API recovered")
+
+
+def record_circuit_result(overloaded):
+    """
+    Enregistre le résultat d'un appel Claude dans la fenêtre glissante partagée
+    et ouvre / ferme le circuit selon le taux d'erreurs de surcharge.
+    """
+    if not CIRCUIT_BREAKER_ENABLED:
+        return
+
+    now = time.time()
+    try:
+        # Résultat de la sonde half-open : fermer ou rouvrir immédiatement.
+        # Task engine : seul le thread qui a obtenu la sonde en rend le verdict
+        if _circuit_probe['active'] and _circuit_probe['owner'] == threading.get_ident():
+            _circuit_probe['active'] = False
+            if overloaded:
+                _open_circuit(now)
+            else:
+                _close_circuit()
+            return
+
+        window = int(now // CIRCUIT_WINDOW_SECONDS)
+        table = dynamodb.Table(CIRCUIT_BREAKER_TABLE)
+        response = table.update_item(
+            Key={'breaker_id': f"{CIRCUIT_KEY}#{window}"},
+            UpdateExpression="ADD requests :one, failures :failed SET #ttl = :ttl",
+            ExpressionAttributeNames={'#ttl': 'ttl'},
+            ExpressionAttributeValues={
+                ':one': 1,
+                ':failed': 1 if overloaded else 0,
+                ':ttl': int(now) + 10 * CIRCUIT_WINDOW_SECONDS
+            },
+            ReturnValues='UPDATED_NEW'
+        )
+
+        requests_count = int(response['Attributes'].get('requests', 0))
+        failures_count = int(response['Attributes'].get('failures', 0))
+        if overloaded and requests_count >= CIRCUIT_MIN_REQUESTS \
+                and failures_count / requests_count >= CIRCUIT_FAILURE_RATIO \
+                and _load_circuit_state().get('state', 'CLOSED') == 'CLOSED':
+            _open_circuit(now)
+
+    except Exception as e:
+        logger.warning(f"Error recording circuit breaker result: {str(e)}")
+
+
+def queue_url_from_arn(queue_arn):
+    """
+    arn:aws:sqs:region:account:name -> https://sqs.region.amazonaws.com/account/name
+    """
+    _, _, _, region, account_id, queue_name = queue_arn.split(':')
+    return f"https://sqs.{region}.amazonaws.com/{account_id}/{queue_name}"
+
+
+# Messages remis en file par le fil courant, suivis à la demande du task engine
+_deferral_tracking = threading.local()
+
+
+def track_deferred_messages():
+    """
+    Démarre le suivi des messages remis en file par le fil courant.
+    Retourne l'ensemble des messageId renvoyés, complété par defer_message
+    """
+    _deferral_tracking.message_ids = set()
+    return _deferral_tracking.message_ids
+
+
+def defer_message(record, message, delay_seconds, batch_item_failures, reason='circuit breaker'):
+    """
+    Remet le message dans sa file avec un délai plutôt que d'échouer le job.
+    Si le renvoi échoue, le message est signalé en échec partiel (batchItemFailures).
+    """
+    # Conserver l'heure de la première mise en file (rapport de latence)
+    if not message.get('queued_at') and sqs_sent_at(record):
+        message['queued_at'] = sqs_sent_at(record)
+    try:
+        sqs_client.send_message(
+            QueueUrl=queue_url_from_arn(record['eventSourceARN']),
+            MessageBody=json.dumps(message),
+            DelaySeconds=max(0, min(SQS_MAX_DELAY_SECONDS, int(delay_seconds)))
+        )
+        logger.info(f"Job {message.get('job_id')} deferred for {int(delay_seconds)}s ({reason})")
+        tracked = getattr(_deferral_tracking, 'message_ids', None)
+        if tracked is not None:
+            tracked.add(record.get('messageId'))
+
+    except Exception as e:
+        logger.error(f"Error requeuing message, returning it to the queue: {str(e)}")
+        batch_item_failures.append({'itemIdentifier': record['messageId']})
+
+
+# Ordonnancement équitable par tenant (user_id ou user_group) : deficit round-robin sur
+# des sous-files par tenant au sein du batch, et plafond de messages en cours par tenant
+# partagé par toutes les invocations (compteur DynamoDB, table FAIR_SHARE_TABLE).
+# Un tenant au-delà de sa part voit l'excédent remis en file avec un délai croissant,
+# même seul dans le batch : c'est le batch suivant, d'un autre utilisateur, qui en profite.
+# Le compteur est rendu dans le finally du processeur (release_tenant_slot) ; un compteur
+# laissé par une invocation interrompue expire avec son bail (FAIR_SHARE_LEASE_SECONDS).
+FAIR_SHARE_LEASE_SECONDS = 900
+
+# Slots obtenus par message : {messageId: tenant}
+_tenant_slots = {}
+_tenant_slots_lock = threading.Lock()
+
+
+def _parse_tenant_weights():
+    """
+    FAIR_SHARE_WEIGHTS="tenant:poids,..." (poids 1 par défaut)
+    """
+    weights = {}
+    for spec in (part.strip() for part in FAIR_SHARE_WEIGHTS.split(',') if part.strip()):
+        tenant, _, weight = spec.rpartition(':')
+        try:
+            weights[tenant] = max(0.1, float(weight))
+        except ValueError:
+            logger.warning(f"Invalid fair share weight: {spec}")
+    return weights
+
+
+TENANT_WEIGHTS = _parse_tenant_weights()
+
+
+def emit_metrics(dimensions, values, unit='Count'):
+    """
+    Métriques CloudWatch au format EMF (Embedded Metric Format) : une ligne JSON
+    extraite par CloudWatch Logs, sans appel API. print() car le logger préfixe les lignes.
+    """
+    print(json.dumps({
+        '_aws': {
+            'Timestamp': int(time.time() * 1000),
+            'CloudWatchMetrics': [{
+                'Namespace': METRICS_NAMESPACE,
+                'Dimensions': [sorted(dimensions)],
+                'Metrics': [{'Name': name, 'Unit': unit} for name in values]
+            }]
+        },
+        **dimensions,
+        **values
+    }))
+
+
+def _acquire_tenant_slot(tenant, cap):
+    """
+    Réserve un slot "en cours" pour le tenant si son compteur est sous le plafond.
+    Un bail expiré (aucune réservation depuis FAIR_SHARE_LEASE_SECONDS) remet le compteur à 1.
+    En cas d'erreur DynamoDB le message est admis (comme le circuit breaker).
+    """
+    now = Decimal(str(time.time()))
+    lease_until = Decimal(str(time.time() + FAIR_SHARE_LEASE_SECONDS))
+    table = dynamodb.Table(FAIR_SHARE_TABLE)
+    try:
+        try:
+            table.update_item(
+                Key={'tenant': tenant},
+                UpdateExpression="SET in_flight = if_not_exists(in_flight, :zero) + :one, "
+                                 "lease_until = :lease_until, #ttl = :ttl",
+                ConditionExpression="attribute_not_exists(in_flight) OR (in_flight < :cap AND lease_until > :now)",
+                ExpressionAttributeNames={'#ttl': 'ttl'},
+                ExpressionAttributeValues={
+                    ':zero': 0, ':one': 1, ':cap': cap, ':now': now,
+                    ':lease_until': lease_until, ':ttl': int(lease_until) + 86400
+                }
+            )
+            return True
+        except ClientError as e:
+            if e.response.get('Error', {}).get('Code') != 'ConditionalCheckFailedException':
+                raise
+
+        # Compteur laissé par une invocation interrompue : le bail a expiré
+        try:
+            table.update_item(
+                Key={'tenant': tenant},
+                UpdateExpression="SET in_flight = :one, lease_until = :lease_until, #ttl = :ttl",
+                ConditionExpression="lease_until <= :now",
+                ExpressionAttributeNames={'#ttl': 'ttl'},
+                ExpressionAttributeValues={
+                    ':one': 1, ':now': now, ':lease_until': lease_until, ':ttl': int(lease_until) + 86400
+                }
+            )
+            logger.warning(f"Fair share lease expired for tenant {tenant}, counter reset")
+            return True
+        except ClientError as e:
+            if e.response.get('Error', {}).get('Code') != 'ConditionalCheckFailedException':
+                raise
+        return False
+
+    except Exception as e:
+        logger.error(f"Fair share counter unavailable for tenant {tenant}, admitting: {str(e)}")
+        return None
+
+
+def release_tenant_slot(record):
+    """
+    Rend le slot du tenant réservé pour ce message (appelé dans le finally du processeur)
+    """
+    with _tenant_slots_lock:
+        tenant = _tenant_slots.pop(record.get('messageId'), None)
+    if tenant is None:
+        return
+    try:
+        dynamodb.Table(FAIR_SHARE_TABLE).update_item(
+            Key={'tenant': tenant},
+            UpdateExpression="SET in_flight = in_flight - :one",
+            ConditionExpression="in_flight > :zero",
+            ExpressionAttributeValues={':one': 1, ':zero': 0}
+        )
+    except ClientError as e:
+        if e.response.get('Error', {}).get('Code') != 'ConditionalCheckFailedException':
+            logger.error(f"Error releasing fair share slot for tenant {tenant}: {str(e)}")
+    except Exception as e:
+        logger.error(f"Error releasing fair share slot for tenant {tenant}: {str(e)}")
+
+
+def tenant_of(message, job):
+    for source in (message, job or {}):
+        value = source.get(FAIR_SHARE_KEY)
+        if value and value != 'unknown':
+            return str(value)
+    return 'unknown'
+
+
+def schedule_fair_share(records, prefetched_jobs, batch_item_failures, processor):
+    """
+    Ordonne les messages du batch par deficit round-robin entre tenants (poids TENANT_WEIGHTS)
+    et remet en file ce qui dépasse la part du tenant : messages en cours, toutes invocations
+    confondues, au plus FAIR_SHARE_MAX_PER_TENANT x poids.
+    Retourne les records à traiter ; chacun doit être rendu par release_tenant_slot.
+    """
+    if not FAIR_SHARE_ENABLED:
+        return records
+
+    tenant_queues = {}
+    unparsed = []
+    for record in records:
+        try:
+            message = json.loads(record['body'])
+        except (KeyError, ValueError):
+            unparsed.append(record)
+            continue
+        tenant = tenant_of(message, prefetched_jobs.get(message.get('job_id')))
+        tenant_queues.setdefault(tenant, []).append((record, message))
+
+    now = time.time()
+    admitted = {}
+    deferred_count = 0
+    for tenant, items in tenant_queues.items():
+        weight = TENANT_WEIGHTS.get(tenant, 1.0)
+        cap = max(1, int(round(FAIR_SHARE_MAX_PER_TENANT * weight)))
+        admitted[tenant] = []
+        excess = []
+        for record, message in items:
+            # Tenant inconnu : pas de compteur commun (il regrouperait des utilisateurs distincts)
+            # Plafond atteint : inutile de retenter pour les messages suivants du tenant
+            if excess or tenant == 'unknown':
+                acquired = False if excess else None
+            else:
+                acquired = _acquire_tenant_slot(tenant, cap)
+            if acquired is False:
+                excess.append((record, message))
+                continue
+            if acquired:
+                with _tenant_slots_lock:
+                    _tenant_slots[record.get('messageId')] = tenant
+            admitted[tenant].append(record)
+
+        # Excédent : délai croissant par tranche de "cap" messages
+        for position, (record, message) in enumerate(excess):
+            delay = FAIR_SHARE_DEFER_SECONDS * (position // cap + 1)
+            defer_message(record, message, delay, batch_item_failures, reason='fair share')
+        deferred_count += len(excess)
+
+        sent_at = [float(record.get('attributes', {}).get('SentTimestamp', now * 1000)) / 1000 for record, _ in items]
+        emit_metrics(
+            {'Processor': processor, 'Tenant': tenant},
+            {
+                'TenantBacklog': len(items),
+                'TenantDeferred': len(excess),
+                'TenantOldestAgeSeconds': round(max(0.0, now - min(sent_at)), 1)
+            }
+        )
+
+    # Deficit round-robin : chaque tour crédite chaque tenant de son poids, un message coûte 1
+    ordered = []
+    deficits = {tenant: 0.0 for tenant in admitted}
+    while any(admitted.values()):
+        for tenant, queue in admitted.items():
+            if not queue:
+                continue
+            deficits[tenant] += TENANT_WEIGHTS.get(tenant, 1.0)
+            while queue and deficits[tenant] >= 1:
+                ordered.append(queue.pop(0))
+                deficits[tenant] -= 1
+            if not queue:
+                deficits[tenant] = 0.0
+
+    if deferred_count or len(tenant_queues) > 1:
+        logger.info(
+            f"Fair share: {len(ordered)} scheduled across {len(tenant_queues)} tenants, {deferred_count} deferred"
+        )
+    return ordered + unparsed
+
+
+# Profilage mémoire opt-in (tracemalloc + RSS) pour dimensionner la mémoire Lambda.
+# Un profil par job : plusieurs jobs peuvent être ouverts en même temps (titres coalescés),
+# chaque pic observé est alors attribué à tous les jobs ouverts sur l'intervalle.
+MEMORY_SAMPLE_INTERVAL_SECONDS = 0.05
+_memory_profiles = {}
+_memory_state = {'current': None, 'hwm_reset': None, 'sampler': None, 'sampled_peak_kb': 0}
+_memory_lock = threading.Lock()
+
+
+def _read_status_kb(field):
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith(field + ':'):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return 0
+
+
+def _current_rss_kb():
+    return _read_status_kb('VmRSS')
+
+
+def _reset_rss_high_water_mark():
+    """
+    Remet VmHWM au RSS courant ("5" dans /proc/self/clear_refs) ; False si le noyau le refuse
+    """
+    try:
+        with open('/proc/self/clear_refs', 'w') as f:
+            f.write('5')
+        return True
+    except OSError:
+        return False
+
+
+def _sample_rss():
+    while MEMORY_PROFILING:
+        rss = _current_rss_kb()
+        with _memory_lock:
+            if rss > _memory_state['sampled_peak_kb']:
+                _memory_state['sampled_peak_kb'] = rss
+        time.sleep(MEMORY_SAMPLE_INTERVAL_SECONDS)
+
+
+def _ensure_rss_peak_tracking():
+    """
+    VmHWM remis à zéro si possible, sinon échantillonnage du RSS par un thread de fond
+    """
+    if _memory_state['hwm_reset'] is None:
+        _memory_state['hwm_reset'] = _reset_rss_high_water_mark()
+        if not _memory_state['hwm_reset']:
+            logger.warning("Cannot reset VmHWM - sampling RSS from a background thread")
+    if not _memory_state['hwm_reset'] and _memory_state['sampler'] is None:
+        _memory_state['sampled_peak_kb'] = _current_rss_kb()
+        _memory_state['sampler'] = threading.Thread(target=_sample_rss, name='rss-sampler', daemon=True)
+        _memory_state['sampler'].start()
+
+
+def _observe_memory_peaks():
+    """
+    Pics (RSS, tracemalloc) depuis l'observation précédente, reportés sur tous les profils ouverts.
+    Appelé sous _memory_lock.
+    """
+    if _memory_state['hwm_reset']:
+        rss_peak = _read_status_kb('VmHWM')
+        _reset_rss_high_water_mark()
+    else:
+        rss_peak = max(_memory_state['sampled_peak_kb'], _current_rss_kb())
+        _memory_state['sampled_peak_kb'] = _current_rss_kb()
+    traced_current, traced_peak = tracemalloc.get_traced_memory()
+    tracemalloc.reset_peak()
+
+    for profile in _memory_profiles.values():
+        profile['stage_rss_peak_kb'] = max(profile['stage_rss_peak_kb'], rss_peak)
+        profile['stage_traced_peak_kb'] = max(profile['stage_traced_peak_kb'], traced_peak)
+        profile['peak_rss_kb'] = max(profile['peak_rss_kb'], rss_peak)
+    return traced_current
+
+
+def start_memory_profile(job_id):
+    """
+    Démarre le profil mémoire d'un job (MEMORY_PROFILING=true)
+    """
+    if not MEMORY_PROFILING or not job_id:
+        return
+    if not tracemalloc.is_tracing():
+        tracemalloc.start()
+    with _memory_lock:
+        _ensure_rss_peak_tracking()
+        # Le pic en cours appartient aux jobs déjà ouverts, pas au nouveau
+        _observe_memory_peaks()
+        _memory_profiles[job_id] = {
+            'stages': {},
+            'stage_rss_peak_kb': 0,
+            'stage_traced_peak_kb': 0,
+            'peak_rss_kb': 0
+        }
+        _memory_state['current'] = job_id
+
+
+def memory_checkpoint(stage, job_id=None):
+    """
+    Enregistre les pics mémoire du job depuis son checkpoint précédent sous le nom de l'étape
+    """
+    if not MEMORY_PROFILING:
+        return
+    with _memory_lock:
+        profile = _memory_profiles.get(job_id or _memory_state['current'])
+        if profile is None:
+            return
+        traced_current = _observe_memory_peaks()
+        profile['stages'][stage] = {
+            'traced_peak_kb': profile['stage_traced_peak_kb'] // 1024,
+            'traced_current_kb': traced_current // 1024,
+            'rss_kb': _current_rss_kb(),
+            'rss_peak_kb': profile['stage_rss_peak_kb']
+        }
+        profile['stage_rss_peak_kb'] = 0
+        profile['stage_traced_peak_kb'] = 0
+
+
+def emit_memory_profile(context=None, job_id=None):
+    """
+    Écrit le profil du job (ou de tous les jobs encore ouverts) dans les logs
+    (ligne MEMORY_PROFILE lue par scripts/memory-report.py)
+    """
+    if not MEMORY_PROFILING:
+        return
+    with _memory_lock:
+        if _memory_profiles:
+            _observe_memory_peaks()
+        job_ids = [job_id] if job_id else list(_memory_profiles)
+        profiles = [(jid, _memory_profiles.pop(jid)) for jid in job_ids if jid in _memory_profiles]
+        if _memory_state['current'] not in _memory_profiles:
+            _memory_state['current'] = None
+
+    for profiled_job_id, profile in profiles:
+        stages = profile['stages']
+        logger.info("MEMORY_PROFILE " + json.dumps({
+            'function': getattr(context, 'function_name', None) or os.environ.get('AWS_LAMBDA_FUNCTION_NAME'),
+            'memory_limit_mb': int(
+                getattr(context, 'memory_limit_in_mb', 0) or os.environ.get('AWS_LAMBDA_FUNCTION_MEMORY_SIZE', 0) or 0
+            ),
+            'job_id': profiled_job_id,
+            'peak_traced_kb': max([stage['traced_peak_kb'] for stage in stages.values()], default=0),
+            # VmHWM (ou échantillons RSS) remis à zéro entre observations : pic du job seul,
+            # pas celui du conteneur depuis son démarrage
+            'peak_rss_kb': profile['peak_rss_kb'],
+            'stages': stages
+        }))
+
+
+def sqs_sent_at(record):
+    """
+    Date d'envoi du message dans la file (attribut SQS SentTimestamp, en ms)
+    """
+    try:
+        return datetime.utcfromtimestamp(int(record['attributes']['SentTimestamp']) / 1000.0).isoformat()
+    except (KeyError, TypeError, ValueError):
+        return None
+
+
+# Rendu des artefacts publiables (HTML / Markdown)
+ARTIFACT_CACHE_CONTROL = 'public, max-age=31536000, immutable'
+SUBHEADING_MAX_WORDS = 8
+
+
+def split_into_blocks(text, with_headings=True):
+    """
+    Découpe un texte en blocs ('h2', texte) / ('p', texte)
+    Sous-titre : ligne marquée '#', ou ligne courte sans ponctuation finale seule entre
+    deux lignes vides (une ligne courte au sein d'un paragraphe reste du texte)
+    """
+    blocks = []
+    for chunk in re.split(r"\n\s*\n", text or ''):
+        lines = [line.strip() for line in chunk.strip().split('\n') if line.strip()]
+        paragraph = []
+        for line in lines:
+            heading = line.lstrip('#').strip()
+            word_count = len(heading.split())
+            is_heading = with_headings and heading and (
+                line.startswith('#')
+                or (
+                    len(lines) == 1
+                    and heading[:1].isupper()
+                    and word_count <= SUBHEADING_MAX_WORDS
+                    and not re.search(r"[.,;:…]$", heading)
+                )
+            )
+            if is_heading:
+                if paragraph:
+                    blocks.append(('p', ' '.join(paragraph)))
+                    paragraph = []
+                blocks.append(('h2', heading))
+            else:
+                paragraph.append(line)
+        if paragraph:
+            blocks.append(('p', ' '.join(paragraph)))
+    return blocks
+
+
+def render_markdown(title, sections):
+    """
+    Rend un document Markdown : titre puis sections [(texte, css_class, with_headings)]
+    """
+    parts = [f"# {title}"]
+    for text, _, with_headings in sections:
+        for tag, content in split_into_blocks(text, with_headings):
+            parts.append(f"## {content}" if tag == 'h2' else content)
+    return '\n\n'.join(parts) + '\n'
+
+
+def render_html(title, sections):
+    """
+    Rend un fragment HTML <article> : titre puis sections [(texte, css_class, with_headings)]
+    """
+    parts = ['<article lang="fr">', f"<h1>{html.escape(title)}</h1>"]
+    for text, css_class, with_headings in sections:
+        class_attr = f' class="{css_class}"' if css_class else ''
+        for tag, content in split_into_blocks(text, with_headings):
+            if tag == 'h2':
+                parts.append(f"<h2>{html.escape(content)}</h2>")
+            else:
+                parts.append(f"<p{class_attr}>{html.escape(content)}</p>")
+    parts.append('</article>')
+    return '\n'.join(parts) + '\n'
+
+
+def save_rendered_artifacts(bucket, base_key, title, sections):
+    """
+    Enregistre les versions HTML et Markdown sur S3 avec une clé dérivée du contenu
+    (immuable, donc cacheable indéfiniment par le CDN).
+    Retourne {'html': key, 'markdown': key} ou None en cas d'erreur
+    """
+    try:
+        artifacts = {}
+        for fmt, extension, content_type, body in [
+            ('html', 'html', 'text/html; charset=utf-8', render_html(title, sections)),
+            ('markdown', 'md', 'text/markdown; charset=utf-8', render_markdown(title, sections)),
+        ]:
+            encoded = body.encode('utf-8')
+            digest = hashlib.sha256(encoded).hexdigest()[:16]
+            key = f"{base_key}_{digest}.{extension}"
+
+            s3_client.put_object(
+                Bucket=bucket,
+                Key=key,
+                Body=encoded,
+                ContentType=content_type,
+                CacheControl=ARTIFACT_CACHE_CONTROL
+            )
+            artifacts[fmt] = key
+
+        logger.info(f"Rendered artifacts saved to S3: {artifacts}")
+        return artifacts
+
+    except Exception as e:
+        logger.error(f"Error saving rendered artifacts to S3: {str(e)}")
+        return None
@@ -0,0 +1,236 @@
+import json
+import os
+import logging
+from datetime import datetime, timedelta
+from decimal import Decimal
+
+logger = logging.getLogger()
+logger.setLevel(logging.INFO)
+
+# Environment variables
+JOBS_TABLE = os.environ.get('JOBS_TABLE', 'thor-web-jobs')
+CONNECTIONS_TABLE = os.environ.get('CONNECTIONS_TABLE', 'thor-web-connections')
+# Endpoint de gestion de l'API WebSocket (https://{api_id}.execute-api.{region}.amazonaws.com/{stage})
+# Vide : diffusion locale en mémoire (tests / développement)
+WEBSOCKET_ENDPOINT = os.environ.get('WEBSOCKET_ENDPOINT', '')
+REGION = 'eu-west-3'
+
+# Champs du job diffusés aux clients à chaque transition
+NOTIFIED_FIELDS = ['status', 'error_message', 'result', 'artifacts', 'completed_count', 'failed_count', 'preview']
+
+# Import AWS after environment setup
+import boto3
+from boto3.dynamodb.conditions import Key
+from boto3.dynamodb.types import TypeDeserializer
+from botocore.exceptions import ClientError
+
+# AWS clients
+dynamodb = boto3.resource('dynamodb', region_name=REGION)
+deserializer = TypeDeserializer()
+
+if WEBSOCKET_ENDPOINT:
+    websocket_client = boto3.client('apigatewaymanagementapi', endpoint_url=WEBSOCKET_ENDPOINT, region_name=REGION)
+else:
+    websocket_client = None
+    logger.warning("WEBSOCKET_ENDPOINT not set - notifications are kept in the local outbox")
+
+# Diffusion locale : {connection_id: [payloads]}
+local_outbox = {}
+
+
+def lambda_handler(event, context):
+    """
+    Job Notifier - Diffusion des changements de statut des jobs
+    - Routes WebSocket $connect / $disconnect (abonnement à un job_id)
+    - Flux DynamoDB Streams de la table jobs (une notification par transition)
+    """
+
+    if 'Records' in event:
+        return handle_stream(event['Records'])
+
+    route_key = event.get('requestContext', {}).get('routeKey')
+    connection_id = event.get('requestContext', {}).get('connectionId')
+
+    if route_key == '$connect':
+        authorizer = event.get('requestContext', {}).get('authorizer') or {}
+        return handle_connect(connection_id, event.get('queryStringParameters') or {}, authorizer)
+
+    if route_key == '$disconnect':
+        remove_connection(connection_id)
+        return {'statusCode': 200}
+
+    return {'statusCode': 400, 'body': json.dumps({'error': f'Unsupported route: {route_key}'})}
+
+
+def handle_connect(connection_id, params, authorizer):
+    """
+    Enregistre la connexion WebSocket pour un job (?job_id=...)
+    Le token est validé par l'authorizer ws-authorizer, qui transmet l'utilisateur (user_id) ;
+    seul le propriétaire du job peut s'y abonner
+    """
+    job_id = params.get('job_id')
+    if not job_id:
+        return {'statusCode': 400, 'body': json.dumps({'error': 'job_id is required'})}
+
+    user_id = authorizer.get('user_id') or authorizer.get('principalId')
+    if not user_id:
+        logger.warning(f"Connection {connection_id} rejected: no authenticated user")
+        return {'statusCode': 401, 'body': json.dumps({'error': 'Unauthorized'})}
+
+    try:
+        job = dynamodb.Table(JOBS_TABLE).get_item(Key={'job_id': job_id}).get('Item')
+        if not job or job.get('user_id') != user_id:
+            logger.warning(f"Connection {connection_id} rejected: user {user_id} does not own job {job_id}")
+            return {'statusCode': 403, 'body': json.dumps({'error': 'Forbidden'})}
+
+        table = dynamodb.Table(CONNECTIONS_TABLE)
+
+        # Calculate TTL (2 hours) : nettoie les connexions jamais fermées proprement
+        ttl = int((datetime.utcnow() + timedelta(hours=2)).timestamp())
+
+        table.put_item(
+            Item={
+                'connection_id': connection_id,
+                'job_id': job_id,
+                'user_id': user_id,
+                'connected_at': datetime.utcnow().isoformat(),
+                'ttl': ttl
+            }
+        )
+
+        logger.info(f"Connection {connection_id} subscribed to job {job_id}")
+        return {'statusCode': 200}
+
+    except Exception as e:
+        logger.error(f"Error registering connection {connection_id}: {str(e)}")
+        return {'statusCode': 500, 'body': json.dumps({'error': 'Connection failed'})}
+
+
+def remove_connection(connection_id):
+    """
+    Supprime une connexion (déconnexion ou connexion expirée)
+    """
+    try:
+        table = dynamodb.Table(CONNECTIONS_TABLE)
+        table.delete_item(Key={'connection_id': connection_id})
+        local_outbox.pop(connection_id, None)
+        logger.info(f"Connection {connection_id} removed")
+
+    except Exception as e:
+        logger.error(f"Error removing connection {connection_id}: {str(e)}")
+
+
+def deserialize_image(image):
+    return {key: deserializer.deserialize(value) for key, value in (image or {}).items()}
+
+
+def build_job_event(new_job, old_job):
+    """
+    Construit la notification d'une transition, ou None si aucun champ diffusé n'a changé.
+    Le payload est partiel : statut, plus le titre dès qu'il est connu.
+    """
+    if all(new_job.get(field) == old_job.get(field) for field in NOTIFIED_FIELDS):
+        return None
+
+    payload = {
+        'type': 'job_status',
+        'job_id': new_job['job_id'],
+        'status': new_job.get('status'),
+        'updated_at': new_job.get('updated_at')
+    }
+
+    result = new_job.get('result') or {}
+    preview = new_job.get('preview') or {}
+    if result.get('titre'):
+        payload['titre'] = result['titre']
+    elif preview.get('titre'):
+        # Avant-première (petit modèle) en attendant l'article complet
+        payload['titre'] = preview['titre']
+        payload['preview'] = {'titre': preview['titre'], 'introduction': preview.get('introduction', '')}
+    if new_job.get('status') == 'COMPLETED' and result:
+        payload['result'] = result
+    if new_job.get('artifacts'):
+        payload['artifacts'] = new_job['artifacts']
+    if new_job.get('error_message'):
+        payload['error_message'] = new_job['error_message']
+    # Import groupe : progression agrégée du job parent
+    if new_job.get('total_count'):
+        payload['progress'] = {
+            'total': new_job['total_count'],
+            'completed': new_job.get('completed_count', 0),
+            'failed': new_job.get('failed_count', 0)
+        }
+
+    return payload
+
+
+def handle_stream(records):
+    """
+    Diffuse chaque transition de la table jobs aux connexions abonnées au job
+    """
+    sent = 0
+
+    for record in records:
+        if record.get('eventName') not in ('INSERT', 'MODIFY'):
+            continue
+
+        try:
+            images = record['dynamodb']
+            new_job = deserialize_image(images.get('NewImage'))
+            old_job = deserialize_image(images.get('OldImage'))
+
+            payload = build_job_event(new_job, old_job)
+            if payload is None:
+                continue
+
+            for connection_id in get_job_connections(new_job['job_id']):
+                if post_to_connection(connection_id, payload):
+                    sent += 1
+
+        except Exception as e:
+            logger.error(f"Error processing stream record: {str(e)}")
+
+    logger.info(f"Sent {sent} notifications for {len(records)} stream records")
+    return {'statusCode': 200, 'body': json.dumps({'sent': sent})}
+
+
+def get_job_connections(job_id):
+    """
+    Connexions abonnées à un job (index JobConnectionsIndex)
+    """
+    table = dynamodb.Table(CONNECTIONS_TABLE)
+    response = table.query(
+        IndexName='JobConnectionsIndex',
+        KeyConditionExpression=Key('job_id').eq(job_id)
+    )
+    return [item['connection_id'] for item in response.get('Items', [])]
+
+
+def _json_default(value):
+    if isinstance(value, Decimal):
+        return int(value) if value % 1 == 0 else float(value)
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+def post_to_connection(connection_id, payload):
+    """
+    Envoie une notification à une connexion WebSocket (ou à la diffusion locale).
+    Les connexions fermées (GoneException) sont supprimées.
+    """
+    data = json.dumps(payload, ensure_ascii=False, default=_json_default)
+
+    if websocket_client is None:
+        local_outbox.setdefault(connection_id, []).append(json.loads(data))
+        logger.info(f"[local] {connection_id} <- {data}")
+        return True
+
+    try:
+        websocket_client.post_to_connection(ConnectionId=connection_id, Data=data.encode('utf-8'))
+        return True
+
+    except ClientError as e:
+        if e.response.get('Error', {}).get('Code') == 'GoneException':
+            remove_connection(connection_id)
+        else:
+            logger.error(f"Error posting to connection {connection_id}: {str(e)}")
+        return False
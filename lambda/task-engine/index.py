@@ -0,0 +1,125 @@
+import json
+import os
+import sys
+import logging
+import importlib.util
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger()
+logger.setLevel(logging.INFO)
+
+# Environment variables
+TASK_MODULES_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# Runtime commun (thor_common) : un seul exemplaire dans le conteneur, importé par les deux
+# processeurs. Clients AWS, pool de clés Anthropic, circuit breaker, cassettes et contrôleur
+# de concurrence adaptatif sont donc partagés par tous les pipelines du worker.
+# Les ressources propres à chaque pipeline se surchargent par ARTICLE_<NOM> / TITRE_<NOM> (env_setting).
+sys.path.append(os.path.join(TASK_MODULES_DIR, '..', 'common'))
+from thor_common import CONCURRENCY_INITIAL, MEMORY_PROFILING, resolve_task_type, track_deferred_messages
+
+
+def _load_task_module(name, directory):
+    """
+    Charge un processeur : embarqué dans le package (deploy-lambdas.sh),
+    sinon lu depuis lambda/<directory>/index.py (développement local)
+    """
+    bundled = os.path.join(TASK_MODULES_DIR, f"{name}.py")
+    path = bundled if os.path.exists(bundled) else os.path.join(TASK_MODULES_DIR, '..', directory, 'index.py')
+    spec = importlib.util.spec_from_file_location(name, path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+# Processeurs hébergés, dans l'ordre de test du registre
+TASK_MODULES = {
+    'article': _load_task_module('article_tasks', 'article-generator'),
+    'titre': _load_task_module('titre_tasks', 'titre-async-processor'),
+}
+
+
+def _build_task_registry():
+    """
+    Registre des types de tâches : les définitions (prompt, parsing, crédit, persistance)
+    exposées par chaque processeur dans TASK_DEFINITIONS, testées dans l'ordre
+    """
+    registry = {}
+    for name, module in TASK_MODULES.items():
+        for task_type, definition in module.TASK_DEFINITIONS.items():
+            registry[task_type] = {**definition, 'module': name}
+    return registry
+
+
+TASK_TYPES = _build_task_registry()
+logger.info(f"Task engine ready: {', '.join(TASK_TYPES)} (initial Claude concurrency {CONCURRENCY_INITIAL})")
+
+
+def run_task_module(name, records, context):
+    """
+    Exécute un processeur sur ses messages (dans le fil du pool).
+    Les processeurs signalent leurs échecs message par message (batchItemFailures) et ne
+    lèvent pas : une exception ici est imprévue, ses messages sont réessayés sauf ceux
+    déjà remis en file par le processeur (ils reviendraient en double)
+    """
+    deferred_message_ids = track_deferred_messages()
+    try:
+        return TASK_MODULES[name].lambda_handler({'Records': records}, context) or {}
+    except Exception as e:
+        logger.error(f"Task module {name} failed: {str(e)}")
+        return {
+            'batchItemFailures': [
+                {'itemIdentifier': record['messageId']} for record in records
+                if record['messageId'] not in deferred_message_ids
+            ]
+        }
+
+
+def lambda_handler(event, context):
+    """
+    Task Engine - Worker unique pour les pipelines article, titre et régénération
+    - Résout le type de chaque message SQS (registre TASK_TYPES) et l'inscrit dans le message
+      (task_type) : le processeur applique la définition correspondante
+    - Exécute les processeurs en parallèle (un fil par processeur)
+    - Fusionne les échecs partiels (batchItemFailures)
+    """
+    records = event.get('Records', [])
+    groups = {}
+    task_counts = {}
+    batch_item_failures = []
+
+    for record in records:
+        try:
+            message = json.loads(record['body'])
+        except (KeyError, ValueError):
+            message = {}
+
+        task_type = resolve_task_type(TASK_TYPES, message)
+        if task_type is None:
+            logger.error(f"No task type for message {record.get('messageId')}")
+            continue
+
+        task_counts[task_type] = task_counts.get(task_type, 0) + 1
+        groups.setdefault(TASK_TYPES[task_type]['module'], []).append(
+            {**record, 'body': json.dumps({**message, 'task_type': task_type})}
+        )
+
+    logger.info(f"Task engine batch: {task_counts}")
+
+    # tracemalloc est global au processus : profils mémoire séquentiels
+    max_workers = 1 if MEMORY_PROFILING else max(1, len(groups))
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = {
+            name: executor.submit(run_task_module, name, group, context)
+            for name, group in groups.items()
+        }
+
+    for future in futures.values():
+        batch_item_failures.extend(future.result().get('batchItemFailures', []))
+
+    return {
+        'statusCode': 200,
+        'body': json.dumps({'processed': len(records), 'tasks': task_counts}),
+        'batchItemFailures': batch_item_failures
+    }
@@ -1,55 +1,68 @@
 import json
 import os
+import re
+import sys
+import io
 import logging
+import shutil
+import tarfile
+import tempfile
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
-from decimal import Decimal
-import time
 
 logger = logging.getLogger()
 logger.setLevel(logging.INFO)
 
-# Environment variables
-ANTHROPIC_API_KEY = os.environ.get('ANTHROPIC_API_KEY')
-JOBS_TABLE = os.environ.get('JOBS_TABLE', 'demo-thor-jobs')
-RESULTS_TABLE = os.environ.get('RESULTS_TABLE', 'demo-thor-results')
-RESULTS_BUCKET = os.environ.get('RESULTS_BUCKET', 'demo-thor-results')
-SUBSCRIPTIONS_TABLE = os.environ.get('SUBSCRIPTIONS_TABLE', 'thor-subscriptions')
-REGION = 'eu-west-3'
+# Runtime commun (pool Anthropic, circuit breaker, concurrence, fair share, rendu...) :
+# embarque a cote de index.py par deploy-lambdas.sh, lu depuis lambda/common en local
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'common'))
+from thor_common import (
+    ANTHROPIC_CASSETTE_MODE, CIRCUIT_OPEN_SECONDS, circuit_allows_request, claude_pool,
+    consume_credits, create_claude_message, defer_message, dynamodb, emit_memory_profile,
+    env_setting, generate_with_retry, is_overloaded_error, memory_checkpoint,
+    prefetch_batch_items, presummarize_text, record_circuit_result, release_circuit_probe,
+    release_tenant_slot, resolve_task_type, s3_client, save_rendered_artifacts,
+    schedule_fair_share, sqs_sent_at, start_memory_profile
+)
 
-# Import AWS after environment setup
-import boto3
-from botocore.exceptions import ClientError
-
-# AWS clients
-dynamodb = boto3.resource('dynamodb', region_name=REGION)
-s3_client = boto3.client('s3', region_name=REGION)
-
-# Import and initialize Anthropic client after boto3
 import anthropic
+from botocore.exceptions import ClientError
 
-if ANTHROPIC_API_KEY:
-    claude_client = anthropic.Anthropic(api_key=ANTHROPIC_API_KEY)
-else:
-    claude_client = None
-    logger.warning("ANTHROPIC_API_KEY not set - Claude API calls will fail")
-
-
-def check_and_consume_titre_credit(user_id):
+# Environment variables (prefixe TITRE_ prioritaire : tables propres au pipeline dans le task engine)
+JOBS_TABLE = env_setting('TITRE_', 'JOBS_TABLE', 'demo-thor-jobs')
+RESULTS_TABLE = env_setting('TITRE_', 'RESULTS_TABLE', 'demo-thor-results')
+RESULTS_BUCKET = env_setting('TITRE_', 'RESULTS_BUCKET', 'demo-thor-results')
+SUBSCRIPTIONS_TABLE = env_setting('TITRE_', 'SUBSCRIPTIONS_TABLE', 'thor-subscriptions')
+UPLOADS_BUCKET = env_setting('TITRE_', 'UPLOADS_BUCKET', 'demo-thor-uploads')
+TITRE_COALESCING = os.environ.get('TITRE_COALESCING', 'false').lower() == 'true'
+TITRE_COALESCE_MAX_JOBS = int(os.environ.get('TITRE_COALESCE_MAX_JOBS', '5'))
+TITRE_COALESCE_MAX_CHARS = int(os.environ.get('TITRE_COALESCE_MAX_CHARS', '8000'))
+BULK_MAX_PARALLELISM = int(os.environ.get('BULK_MAX_PARALLELISM', '4'))
+EXTRACTIVE_PRESUMMARY = os.environ.get('EXTRACTIVE_PRESUMMARY', 'true').lower() == 'true'
+# ~28 000 caracteres : tient dans la fenetre [:30000] du prompt
+PRESUMMARY_TOKEN_BUDGET = int(env_setting('TITRE_', 'PRESUMMARY_TOKEN_BUDGET', '7000'))
+CLAUDE_MODEL = 'claude-haiku-4-5-20251001'
+PROCESSOR_NAME = 'titre'
+
+def check_and_consume_titre_credit(user_id, subscription=None):
     """
     Verifie et consomme 1 credit titre pour l'utilisateur.
+    subscription: abonnement deja precharge (prefetch_batch_items), relu sinon.
     Retourne (success, message)
     """
     try:
         subscriptions_table = dynamodb.Table(SUBSCRIPTIONS_TABLE)
 
         # Recuperer l'abonnement de l'utilisateur
-        response = subscriptions_table.get_item(Key={'userId': user_id})
+        if subscription is None:
+            response = subscriptions_table.get_item(Key={'userId': user_id})
 
-        if 'Item' not in response:
-            logger.warning(f"User {user_id} not found in subscriptions table")
-            return False, "Aucun abonnement trouve. Veuillez vous abonner sur thorpodcast.link"
+            if 'Item' not in response:
+                logger.warning(f"User {user_id} not found in subscriptions table")
+                return False, "Aucun abonnement trouve. Veuillez vous abonner sur thorpodcast.link"
 
-        subscription = response['Item']
+            subscription = response['Item']
 
         # Verifier le statut de l'abonnement
         subscription_status = subscription.get('subscriptionStatus', 'inactive')
@@ -57,24 +70,19 @@ def check_and_consume_titre_credit(user_id):
             logger.warning(f"User {user_id} subscription is not active: {subscription_status}")
             return False, "Votre abonnement n'est pas actif. Veuillez renouveler sur thorpodcast.link"
 
-        # Verifier les credits titre restants
-        remaining_credits = int(subscription.get('remainingTitreCredits', 0))
-
-        if remaining_credits <= 0:
+        # Rejet anticipe sur la vue prechargee (aucune ecriture)
+        if int(subscription.get('remainingTitreCredits', 0)) <= 0:
             logger.warning(f"User {user_id} has no remaining titre credits")
             return False, "Credits titre insuffisants. Veuillez recharger sur thorpodcast.link"
 
-        # Decrementer le compteur de credits
-        new_remaining = remaining_credits - 1
+        # Decrement atomique conditionnel : le solde precharge peut etre perime
+        new_remaining = consume_credits(SUBSCRIPTIONS_TABLE, user_id, 'remainingTitreCredits')
+        if new_remaining is None:
+            logger.warning(f"User {user_id} has no remaining titre credits or an inactive subscription")
+            return False, "Credits titre insuffisants. Veuillez recharger sur thorpodcast.link"
 
-        subscriptions_table.update_item(
-            Key={'userId': user_id},
-            UpdateExpression="SET remainingTitreCredits = :new_credits, updatedAt = :timestamp",
-            ExpressionAttributeValues={
-                ':new_credits': new_remaining,
-                ':timestamp': datetime.utcnow().isoformat()
-            }
-        )
+        # Garder la vue en memoire coherente pour les messages suivants du batch
+        subscription['remainingTitreCredits'] = new_remaining
 
         logger.info(f"User {user_id} consumed 1 titre credit. Remaining: {new_remaining}")
         return True, f"Credit consomme. Credits titre restants: {new_remaining}"
@@ -88,199 +96,830 @@ def lambda_handler(event, context):
     """
     Traitement asynchrone depuis SQS avec appel API Claude
     Version TITRE avec consommation de credits
+    Chaque job est prepare (credits, lecture S3), genere et sauvegarde a la suite ;
+    avec TITRE_COALESCING, les jobs prepares sont generes ensuite par groupes, chaque
+    groupe etant sauvegarde des le retour de son appel. Les imports groupes passent en dernier.
     """
 
     logger.info(f"Processing {len(event['Records'])} messages from SQS")
 
-    for record in event['Records']:
-        try:
-            # Parse SQS message
-            message = json.loads(record['body'])
-            job_id = message['job_id']
-            user_id = message.get('user_id', 'unknown')
-
-            # Check if this is a regeneration request
-            is_regeneration = message.get('is_regeneration', False)
-            prompt_adjustment = message.get('prompt_adjustment', '')
-
-            logger.info(f"Processing job {job_id} for user {user_id} (regeneration: {is_regeneration})")
-
-            # Get job details from DynamoDB
-            jobs_table = dynamodb.Table(JOBS_TABLE)
-            job_response = jobs_table.get_item(Key={'job_id': job_id})
-
-            if 'Item' not in job_response:
-                raise Exception(f"Job {job_id} not found in database")
-
-            job = job_response['Item']
-
-            # Recuperer user_id depuis le job si pas dans le message
-            if user_id == 'unknown':
-                user_id = job.get('user_id', 'unknown')
-
-            # Verifier et consommer 1 credit titre AVANT la generation
-            # Ne pas verifier les credits pour les regenerations (deja paye)
-            if not is_regeneration:
-                credit_success, credit_message = check_and_consume_titre_credit(user_id)
-                if not credit_success:
-                    logger.error(f"Credit check failed for user {user_id}: {credit_message}")
-                    update_job_status(
-                        job_id=job_id,
-                        status='FAILED',
-                        error=credit_message
-                    )
-                    continue  # Passer au message suivant sans lever d'exception (ne pas retry)
-
-            # Get text from S3
-            s3_key = job.get('s3_key')
-            if not s3_key:
-                raise Exception(f"No S3 key found for job {job_id}")
-
-            # Read text from S3
-            uploads_bucket = os.environ.get('UPLOADS_BUCKET', 'demo-thor-uploads')
+    # Precharger les jobs et abonnements du batch en une ou deux lectures groupees
+    prefetched_jobs, prefetched_subscriptions = prefetch_batch_items(event['Records'], JOBS_TABLE, SUBSCRIPTIONS_TABLE)
+    batch_item_failures = []
+
+    try:
+        # Jobs prepares en attente d'une requete groupee (TITRE_COALESCING)
+        prepared_jobs = []
+        bulk_records = []
+        # Ordre equitable entre utilisateurs : l'excedent d'un gros deposant est remis en file
+        records = schedule_fair_share(event['Records'], prefetched_jobs, batch_item_failures, PROCESSOR_NAME)
+        for record in records:
+            job_id = None
             try:
-                s3_response = s3_client.get_object(Bucket=uploads_bucket, Key=s3_key)
-                content = s3_response['Body'].read()
-
-                # Try to decode with multiple encodings
-                text = None
-                encodings_to_try = ['utf-8', 'iso-8859-1', 'latin-1', 'cp1252', 'windows-1252']
-
-                for encoding in encodings_to_try:
-                    try:
-                        text = content.decode(encoding)
-                        logger.info(f"Successfully decoded file with {encoding} encoding")
-                        break
-                    except UnicodeDecodeError:
-                        continue
-
-                if text is None:
-                    # Try with chardet if available
-                    try:
-                        import chardet
-                        detected = chardet.detect(content)
-                        if detected['encoding']:
-                            text = content.decode(detected['encoding'])
-                            logger.info(f"Decoded file with detected encoding: {detected['encoding']}")
-                    except:
-                        pass
-
-                if text is None:
-                    logger.error(f"File {s3_key} could not be decoded with any encoding")
-
-                    # Check if there's a .txt version of the file
-                    text_key = s3_key.replace(job.get('file_extension', ''), 'txt')
-                    if text_key != s3_key:
-                        try:
-                            text_response = s3_client.get_object(Bucket=uploads_bucket, Key=text_key)
-                            text = text_response['Body'].read().decode('utf-8')
-                            logger.info(f"Found extracted text file: {text_key}")
-                        except:
-                            raise Exception(f"Failed to read extracted text for binary file {s3_key}")
-                    else:
-                        raise Exception(f"Cannot process binary file {s3_key} - text extraction failed")
+                # Parse SQS message
+                message = json.loads(record['body'])
+                job_id = message['job_id']
+
+                # Import groupe (archive ou prefixe S3) : traite apres les jobs unitaires
+                if message.get('bulk'):
+                    bulk_records.append((record, message))
+                    continue
+
+                job_ctx = prepare_titre_job(record, message, prefetched_jobs, prefetched_subscriptions, batch_item_failures)
+                if not job_ctx:
+                    continue
+                if TITRE_COALESCING:
+                    prepared_jobs.append(job_ctx)
+                else:
+                    # Sans regroupement : resultat sauvegarde sans attendre les autres jobs du batch
+                    generate_titre_results([job_ctx], batch_item_failures)
 
             except Exception as e:
-                logger.error(f"Failed to read file from S3: {str(e)}")
-                raise Exception(f"Failed to read file from S3: {str(e)}")
-
-            # Update job status to PROCESSING
-            update_job_status(job_id, 'PROCESSING')
-
-            # Generate summary with Claude (with feedback if regeneration)
-            if is_regeneration:
-                previous_result = job.get('result', {})
-                summary_result = generate_summary_with_retry(
-                    text=text,
-                    file_name=job.get('file_name', 'unknown.txt'),
-                    file_extension=job.get('file_extension', 'txt'),
-                    prompt_adjustment=prompt_adjustment,
-                    previous_result=previous_result
-                )
-            else:
-                summary_result = generate_summary_with_retry(
-                    text=text,
-                    file_name=job.get('file_name', 'unknown.txt'),
-                    file_extension=job.get('file_extension', 'txt')
-                )
+                # Les jobs deja prepares (credit consomme) doivent quand meme etre generes
+                handle_record_error(job_id, e, record, batch_item_failures)
 
-            if summary_result['success']:
-                # Save result to S3
-                s3_key = save_result_to_s3(
-                    job_id=job_id,
-                    user_group=job.get('user_group', 'unknown'),
-                    user_id=job.get('user_id', 'unknown'),
-                    summary=summary_result['summary']
-                )
-
-                # Save result to DynamoDB
-                save_result_to_dynamodb(
-                    job_id=job_id,
-                    user_id=job.get('user_id', 'unknown'),
-                    user_group=job.get('user_group', 'unknown'),
-                    summary=summary_result['summary'],
-                    s3_key=s3_key
-                )
-
-                # Update job status to COMPLETED
-                update_job_status(
-                    job_id=job_id,
-                    status='COMPLETED',
-                    result=summary_result['summary']
-                )
-
-                logger.info(f"Job {job_id} completed successfully")
+        # Requetes groupees pour les petits conducteurs, unitaires sinon
+        if prepared_jobs:
+            generate_titre_results(prepared_jobs, batch_item_failures)
+
+        # Imports groupes : seulement une fois les jobs unitaires du batch sauvegardes,
+        # pour qu'un import long ne les prive pas du temps d'execution restant
+        for record, message in bulk_records:
+            try:
+                process_bulk_job(record, message, prefetched_jobs, context, batch_item_failures)
+            except Exception as e:
+                handle_record_error(message['job_id'], e, record, batch_item_failures)
+
+    finally:
+        # Sonde half-open obtenue sans qu'aucun appel Claude ne soit parti : la rendre
+        release_circuit_probe()
+        # Slots "en cours" des tenants (fair share entre invocations)
+        for record in event['Records']:
+            release_tenant_slot(record)
+        # Profils des jobs interrompus avant leur sauvegarde
+        emit_memory_profile(context)
+
+    return {
+        'statusCode': 200,
+        'body': json.dumps('Processing complete'),
+        'batchItemFailures': batch_item_failures
+    }
 
+
+def handle_record_error(job_id, error, record, batch_item_failures):
+    """
+    Marque le job en echec ; si l'erreur est temporaire, seul ce message est rendu a la file
+    (batchItemFailures) : lever ferait rejouer tout le batch, messages deja remis en file compris
+    """
+    logger.error(f"Error processing message: {str(error)}")
+
+    # Update job status if we have job_id
+    if job_id:
+        update_job_status(
+            job_id=job_id,
+            status='FAILED',
+            error=str(error)
+        )
+
+    # Temporary error: SQS retry of this message only
+    if 'rate_limit' in str(error).lower() or 'timeout' in str(error).lower():
+        batch_item_failures.append({'itemIdentifier': record['messageId']})
+
+
+def decode_text_content(content):
+    """
+    Decode un fichier texte en essayant plusieurs encodages (puis chardet si disponible).
+    Retourne None si le contenu ne peut pas etre decode.
+    """
+    text = None
+    encodings_to_try = ['utf-8', 'iso-8859-1', 'latin-1', 'cp1252', 'windows-1252']
+
+    for encoding in encodings_to_try:
+        try:
+            text = content.decode(encoding)
+            logger.info(f"Successfully decoded file with {encoding} encoding")
+            break
+        except UnicodeDecodeError:
+            continue
+
+    if text is None:
+        # Try with chardet if available
+        try:
+            import chardet
+            detected = chardet.detect(content)
+            if detected['encoding']:
+                text = content.decode(detected['encoding'])
+                logger.info(f"Decoded file with detected encoding: {detected['encoding']}")
+        except:
+            pass
+
+    return text
+
+
+def prepare_titre_job(record, message, prefetched_jobs, prefetched_subscriptions, batch_item_failures):
+    """
+    Preparation : circuit breaker, chargement du job, credit et lecture du conducteur.
+    Retourne le contexte du job a generer, ou None si le message est deja traite.
+    """
+    job_id = message['job_id']
+    user_id = message.get('user_id', 'unknown')
+    # Profil memoire propre au job (les jobs coalesces partagent les pics de leur appel commun)
+    start_memory_profile(job_id)
+
+    # Type de tache (titre ou regeneration) : prompt, credit et persistance
+    task_type = resolve_task_type(TASK_DEFINITIONS, message)
+    task = TASK_DEFINITIONS[task_type]
+
+    logger.info(f"Processing job {job_id} for user {user_id} (task: {task_type})")
+    stage_timestamps = {
+        'queued_at': message.get('queued_at') or sqs_sent_at(record),
+        'dequeued_at': datetime.utcnow().isoformat()
+    }
+
+    # Circuit ouvert : remettre le message en file au lieu d'echouer le job
+    allowed, wait_seconds = circuit_allows_request()
+    if not allowed:
+        defer_message(record, message, wait_seconds, batch_item_failures)
+        return None
+
+    # Get job details (prefetched, or from DynamoDB)
+    job = prefetched_jobs.get(job_id)
+    if job is None:
+        jobs_table = dynamodb.Table(JOBS_TABLE)
+        job_response = jobs_table.get_item(Key={'job_id': job_id})
+
+        if 'Item' not in job_response:
+            raise Exception(f"Job {job_id} not found in database")
+
+        job = job_response['Item']
+
+    # Recuperer user_id depuis le job si pas dans le message
+    if user_id == 'unknown':
+        user_id = job.get('user_id', 'unknown')
+
+    # Verifier et consommer 1 credit AVANT la generation
+    # Pas de credit pour les regenerations (deja paye, credit_attribute None)
+    # ni apres une remise en file pour surcharge (credit deja consomme)
+    if task['credit_attribute'] and not message.get('credit_consumed'):
+        credit_success, credit_message = check_and_consume_titre_credit(
+            user_id, subscription=prefetched_subscriptions.get(user_id)
+        )
+        if not credit_success:
+            logger.error(f"Credit check failed for user {user_id}: {credit_message}")
+            update_job_status(
+                job_id=job_id,
+                status='FAILED',
+                error=credit_message
+            )
+            return None  # Passer au message suivant sans lever d'exception (ne pas retry)
+    stage_timestamps['credit_checked_at'] = datetime.utcnow().isoformat()
+
+    # Get text from S3
+    s3_key = job.get('s3_key')
+    if not s3_key:
+        raise Exception(f"No S3 key found for job {job_id}")
+
+    # Read text from S3
+    uploads_bucket = UPLOADS_BUCKET
+    try:
+        s3_response = s3_client.get_object(Bucket=uploads_bucket, Key=s3_key)
+        content = s3_response['Body'].read()
+        text = decode_text_content(content)
+
+        if text is None:
+            logger.error(f"File {s3_key} could not be decoded with any encoding")
+
+            # Check if there's a .txt version of the file
+            text_key = s3_key.replace(job.get('file_extension', ''), 'txt')
+            if text_key != s3_key:
+                try:
+                    text_response = s3_client.get_object(Bucket=uploads_bucket, Key=text_key)
+                    text = text_response['Body'].read().decode('utf-8')
+                    logger.info(f"Found extracted text file: {text_key}")
+                except:
+                    raise Exception(f"Failed to read extracted text for binary file {s3_key}")
             else:
-                # Handle failure
-                error_message = summary_result.get('error', 'Erreur inconnue lors de la generation')
-                logger.error(f"Failed to generate summary for job {job_id}: {error_message}")
+                raise Exception(f"Cannot process binary file {s3_key} - text extraction failed")
 
-                update_job_status(
-                    job_id=job_id,
-                    status='FAILED',
-                    error=error_message
-                )
+    except Exception as e:
+        logger.error(f"Failed to read file from S3: {str(e)}")
+        raise Exception(f"Failed to read file from S3: {str(e)}")
+
+    # Pre-resume extractif local si le texte depasse le budget de tokens
+    if EXTRACTIVE_PRESUMMARY:
+        text, presummary_stats = presummarize_text(text, PRESUMMARY_TOKEN_BUDGET)
+        if presummary_stats['applied']:
+            logger.info(
+                f"Text pre-summarized for job {job_id}: "
+                f"{presummary_stats['original_tokens']} -> {presummary_stats['presummary_tokens']} tokens "
+                f"({presummary_stats['selected_units']}/{presummary_stats['units']} sentences)"
+            )
 
-                # If rate limit error, throw to trigger retry
-                if 'rate_limit' in error_message.lower():
-                    raise Exception(f"Rate limit error: {error_message}")
+    # Update job status to PROCESSING
+    update_job_status(
+        job_id,
+        'PROCESSING',
+        fields={
+            'job_type': task['job_type'],
+            'model': CLAUDE_MODEL,
+            **{name: value for name, value in stage_timestamps.items() if value}
+        }
+    )
+
+    memory_checkpoint('read_and_decode', job_id)
+    return {
+        'record': record,
+        'message': message,
+        'job_id': job_id,
+        'job': job,
+        'text': text,
+        'task_type': task_type,
+        'timings': {}
+    }
 
+
+def generate_titre_results(prepared_jobs, batch_item_failures):
+    """
+    Genere puis sauvegarde chaque job prepare (finish_titre_job des que son resultat est connu :
+    un timeout Lambda ne perd pas les resultats deja obtenus).
+    Les petits conducteurs (hors regeneration) sont regroupes par TITRE_COALESCE_MAX_JOBS
+    dans une seule requete ; tout job non recupere du groupe repasse en appel unitaire.
+    """
+    if TITRE_COALESCING:
+        eligible = [
+            job_ctx for job_ctx in prepared_jobs
+            if job_ctx['task_type'] == 'titre' and len(job_ctx['text']) <= TITRE_COALESCE_MAX_CHARS
+        ]
+        for start in range(0, len(eligible), TITRE_COALESCE_MAX_JOBS):
+            group = eligible[start:start + TITRE_COALESCE_MAX_JOBS]
+            if len(group) < 2:
+                continue
+            results = generate_coalesced_summaries(group)
+            for job_ctx in group:
+                if job_ctx['job_id'] in results:
+                    job_ctx['summary_result'] = results[job_ctx['job_id']]
+                    complete_titre_job(job_ctx, batch_item_failures)
+
+    for job_ctx in prepared_jobs:
+        if 'summary_result' in job_ctx:
+            continue
+
+        task = TASK_DEFINITIONS[job_ctx['task_type']]
+        try:
+            job_ctx['summary_result'] = generate_summary_with_retry(
+                task['build_prompt'](job_ctx['text'], job_ctx['job'], job_ctx['message']),
+                task['parse'],
+                timings=job_ctx['timings']
+            )
         except Exception as e:
-            logger.error(f"Error processing message: {str(e)}")
+            job_ctx['summary_result'] = {
+                'success': False,
+                'error': f'Erreur inattendue: {str(e)}'
+            }
+        complete_titre_job(job_ctx, batch_item_failures)
+
+
+def complete_titre_job(job_ctx, batch_item_failures):
+    """
+    Sauvegarde le job des que son resultat est connu, rend le slot fair share de son message
+    et ecrit le profil memoire du job
+    """
+    memory_checkpoint('generation', job_ctx['job_id'])
+    try:
+        finish_titre_job(job_ctx, batch_item_failures)
+    except Exception as e:
+        handle_record_error(job_ctx['job_id'], e, job_ctx['record'], batch_item_failures)
+    finally:
+        release_tenant_slot(job_ctx['record'])
+        memory_checkpoint('persistence', job_ctx['job_id'])
+        emit_memory_profile(job_id=job_ctx['job_id'])
+
+
+def finish_titre_job(job_ctx, batch_item_failures):
+    """
+    Sauvegarde du resultat, remise en file (surcharge) ou echec du job
+    """
+    job_id = job_ctx['job_id']
+    job = job_ctx['job']
+    summary_result = job_ctx['summary_result']
+
+    if summary_result['success']:
+        TASK_DEFINITIONS[job_ctx['task_type']]['persist'](job_id, job, summary_result['summary'], job_ctx['timings'])
+        logger.info(f"Job {job_id} completed successfully")
 
-            # Update job status if we have job_id
-            if 'job_id' in locals():
-                update_job_status(
-                    job_id=job_id,
-                    status='FAILED',
-                    error=str(e)
-                )
+    elif summary_result.get('overloaded'):
+        # IA surchargee : remettre le job en file, credit deja consomme
+        message = job_ctx['message']
+        message['credit_consumed'] = True
+        defer_message(job_ctx['record'], message, CIRCUIT_OPEN_SECONDS, batch_item_failures)
+        update_job_status(job_id, 'QUEUED', fields=job_ctx['timings'])
+
+    else:
+        # Handle failure
+        error_message = summary_result.get('error', 'Erreur inconnue lors de la generation')
+        logger.error(f"Failed to generate summary for job {job_id}: {error_message}")
+
+        update_job_status(
+            job_id=job_id,
+            status='FAILED',
+            error=error_message,
+            fields=job_ctx['timings']
+        )
+
+        # Rate limit: SQS retry of this message only
+        if 'rate_limit' in error_message.lower():
+            batch_item_failures.append({'itemIdentifier': job_ctx['record']['messageId']})
 
-            # Re-raise for SQS retry if it's a temporary error
-            if 'rate_limit' in str(e).lower() or 'timeout' in str(e).lower():
-                raise
 
-    return {'statusCode': 200, 'body': json.dumps('Processing complete')}
+# Import groupe : un job parent (archive zip/tar ou prefixe S3 de conducteurs) deploye en jobs enfants
+BULK_MEMBER_EXTENSIONS = ('.txt', '.text', '.md', '.csv')
+BULK_TAR_SUFFIXES = ('.tar', '.tar.gz', '.tgz', '.tar.bz2')
+# Taille des lectures Range dans une archive zip
+BULK_READ_BUFFER_BYTES = 1024 * 1024
+# Temps restant sous lequel l'import est remis en file pour reprendre au curseur
+BULK_TIME_MARGIN_MS = 60000
+# Reprise des enfants limites par l'API (rate limit, timeout)
+BULK_RETRY_DELAY_SECONDS = 30
+# Part de l'espace libre de /tmp (stockage ephemere) utilisable pour une archive tar
+BULK_SPOOL_MAX_FREE_RATIO = 0.8
 
 
-def generate_summary_with_retry(text, file_name, file_extension, prompt_adjustment=None, previous_result=None, max_retries=3):
+class S3RangeReader(io.RawIOBase):
     """
-    Appel Claude API avec retry logic et prompt identique a v1
+    Lecture aleatoire d'un objet S3 par requetes Range : zipfile ne lit que le
+    repertoire central et les membres traites, sans telecharger ni decompresser l'archive sur disque
     """
 
-    if not claude_client:
-        return {
-            'success': False,
-            'error': 'API Claude non configuree'
-        }
+    def __init__(self, bucket, key):
+        self.bucket = bucket
+        self.key = key
+        self.size = s3_client.head_object(Bucket=bucket, Key=key)['ContentLength']
+        self.position = 0
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def tell(self):
+        return self.position
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        if whence == io.SEEK_SET:
+            self.position = offset
+        elif whence == io.SEEK_CUR:
+            self.position += offset
+        else:
+            self.position = self.size + offset
+        return self.position
+
+    def readinto(self, buffer):
+        if self.position >= self.size:
+            return 0
+        end = min(self.position + len(buffer), self.size) - 1
+        data = s3_client.get_object(
+            Bucket=self.bucket,
+            Key=self.key,
+            Range=f"bytes={self.position}-{end}"
+        )['Body'].read()
+        buffer[:len(data)] = data
+        self.position += len(data)
+        return len(data)
+
+
+def _is_bulk_member(name):
+    base_name = name.rsplit('/', 1)[-1]
+    return (
+        bool(base_name)
+        and not base_name.startswith('.')
+        and '__MACOSX/' not in name
+        and base_name.lower().endswith(BULK_MEMBER_EXTENSIONS)
+    )
+
+
+def iter_bulk_members(job, bucket, wanted, archive_path=None):
+    """
+    Parcourt les conducteurs d'un import dans un ordre stable : (index, nom, contenu).
+    Le contenu n'est lu que pour les index demandes (wanted(index)), None sinon.
+    Source : job['s3_prefix'] (objets S3) ou job['s3_key'] (archive zip ou tar, lue en flux,
+    ou depuis archive_path si l'archive tar a deja ete telechargee).
+    """
+    if job.get('s3_prefix'):
+        paginator = s3_client.get_paginator('list_objects_v2')
+        index = 0
+        for page in paginator.paginate(Bucket=bucket, Prefix=job['s3_prefix']):
+            for item in page.get('Contents', []):
+                if not _is_bulk_member(item['Key']):
+                    continue
+                content = s3_client.get_object(Bucket=bucket, Key=item['Key'])['Body'].read() if wanted(index) else None
+                yield index, item['Key'].rsplit('/', 1)[-1], content
+                index += 1
+        return
+
+    archive_key = job.get('s3_key', '')
+    if archive_key.lower().endswith('.zip'):
+        reader = io.BufferedReader(S3RangeReader(bucket, archive_key), buffer_size=BULK_READ_BUFFER_BYTES)
+        with zipfile.ZipFile(reader) as archive:
+            members = [info for info in archive.infolist() if not info.is_dir() and _is_bulk_member(info.filename)]
+            for index, info in enumerate(members):
+                content = archive.read(info) if wanted(index) else None
+                yield index, info.filename.rsplit('/', 1)[-1], content
+        return
+
+    if archive_key.lower().endswith(BULK_TAR_SUFFIXES):
+        if archive_path:
+            archive = tarfile.open(archive_path, mode='r:*')
+        else:
+            body = s3_client.get_object(Bucket=bucket, Key=archive_key)['Body']
+            # Mode flux 'r|*' : lecture sequentielle du corps S3, compression detectee
+            archive = tarfile.open(fileobj=body, mode='r|*')
+        with archive:
+            index = 0
+            for member in archive:
+                if not member.isfile() or not _is_bulk_member(member.name):
+                    continue
+                content = archive.extractfile(member).read() if wanted(index) else None
+                yield index, member.name.rsplit('/', 1)[-1], content
+                index += 1
+        return
+
+    raise Exception(f"Unsupported bulk source for job {job.get('job_id')}: {archive_key or 'no s3_key / s3_prefix'}")
+
+
+def download_bulk_archive(job, bucket):
+    """
+    Archive tar (sans index, lisible seulement en flux) : telechargee une fois dans /tmp pour
+    le denombrement et la generation, au lieu de deux lectures S3 completes, si elle tient
+    dans l'espace libre du stockage ephemere. Sinon les membres sont lus en flux a chaque passe.
+    Retourne le chemin local, ou None (archive lue en flux, zip lu par Range, prefixe S3)
+    """
+    archive_key = job.get('s3_key', '')
+    if job.get('s3_prefix') or not archive_key.lower().endswith(BULK_TAR_SUFFIXES):
+        return None
 
-    # Prepare the prompt (with feedback adjustment if provided)
-    if prompt_adjustment:
-        previous_title = previous_result.get('titre', '') if previous_result else ''
-        previous_summary = previous_result.get('resume', '') if previous_result else ''
+    archive_size = s3_client.head_object(Bucket=bucket, Key=archive_key)['ContentLength']
+    spool_limit = int(shutil.disk_usage(tempfile.gettempdir()).free * BULK_SPOOL_MAX_FREE_RATIO)
+    if archive_size > spool_limit:
+        logger.info(f"Archive {archive_key} ({archive_size} bytes) exceeds /tmp space ({spool_limit}), streaming it")
+        return None
+
+    fd, archive_path = tempfile.mkstemp(prefix='bulk-', suffix='.tar')
+    try:
+        with os.fdopen(fd, 'wb') as archive_file:
+            s3_client.download_fileobj(bucket, archive_key, archive_file)
+    except Exception:
+        os.remove(archive_path)
+        raise
+    return archive_path
+
+
+def reserve_titre_credits(user_id, parent_job_id, count):
+    """
+    Reserve les credits titre de tout l'import en une transaction conditionnelle :
+    debit (abonnement actif et solde suffisant) et marqueur credits_reserved sur le job parent.
+    Idempotent : un message rejoue (timeout Lambda) ne debite pas une deuxieme fois.
+    Retourne (success, message)
+    """
+    try:
+        dynamodb.meta.client.transact_write_items(TransactItems=[
+            {
+                'Update': {
+                    'TableName': SUBSCRIPTIONS_TABLE,
+                    'Key': {'userId': {'S': user_id}},
+                    'UpdateExpression': "SET remainingTitreCredits = remainingTitreCredits - :count, updatedAt = :timestamp",
+                    'ConditionExpression': "subscriptionStatus = :active AND remainingTitreCredits >= :count",
+                    'ExpressionAttributeValues': {
+                        ':count': {'N': str(count)},
+                        ':active': {'S': 'active'},
+                        ':timestamp': {'S': datetime.utcnow().isoformat()}
+                    }
+                }
+            },
+            {
+                'Update': {
+                    'TableName': JOBS_TABLE,
+                    'Key': {'job_id': {'S': parent_job_id}},
+                    'UpdateExpression': "SET credits_reserved = :count",
+                    'ConditionExpression': "attribute_not_exists(credits_reserved)",
+                    'ExpressionAttributeValues': {':count': {'N': str(count)}}
+                }
+            }
+        ])
+        logger.info(f"User {user_id} reserved {count} titre credits for bulk job {parent_job_id}")
+        return True, f"{count} credits reserves"
+
+    except ClientError as e:
+        if e.response['Error']['Code'] == 'TransactionCanceledException':
+            reasons = [reason.get('Code') for reason in e.response.get('CancellationReasons', [])]
+            if len(reasons) > 1 and reasons[1] == 'ConditionalCheckFailed':
+                logger.info(f"Bulk job {parent_job_id}: credits already reserved")
+                return True, "Credits deja reserves pour cet import"
+            logger.warning(f"User {user_id} cannot reserve {count} titre credits")
+            return False, f"Credits titre insuffisants pour cet import ({count} fichiers). Veuillez recharger sur thorpodcast.link"
+        logger.error(f"Error reserving titre credits for user {user_id}: {str(e)}")
+        return False, f"Erreur lors de la verification des credits: {str(e)}"
+
+    except Exception as e:
+        logger.error(f"Error reserving titre credits for user {user_id}: {str(e)}")
+        return False, f"Erreur lors de la verification des credits: {str(e)}"
+
+
+def update_bulk_progress(parent_job_id, completed=0, failed=0):
+    """
+    Compteurs atomiques de progression du job parent. Retourne (completed_count, failed_count)
+    """
+    response = dynamodb.Table(JOBS_TABLE).update_item(
+        Key={'job_id': parent_job_id},
+        UpdateExpression="ADD completed_count :completed, failed_count :failed SET updated_at = :timestamp",
+        ExpressionAttributeValues={
+            ':completed': completed,
+            ':failed': failed,
+            ':timestamp': datetime.utcnow().isoformat()
+        },
+        ReturnValues='ALL_NEW'
+    )
+    attributes = response['Attributes']
+    return int(attributes.get('completed_count', 0)), int(attributes.get('failed_count', 0))
+
+
+def create_bulk_child_job(parent_job, index, file_name):
+    """
+    Job enfant d'un import (id deterministe : une reprise ne cree pas de doublon).
+    Retourne None si l'enfant est deja COMPLETED (message rejoue apres un timeout)
+    """
+    now = datetime.utcnow()
+    child = {
+        'job_id': f"{parent_job['job_id']}-{index:05d}",
+        'parent_job_id': parent_job['job_id'],
+        'user_id': parent_job.get('user_id', 'unknown'),
+        'user_group': parent_job.get('user_group', 'unknown'),
+        'file_name': file_name,
+        'file_extension': file_name.rsplit('.', 1)[-1].lower() if '.' in file_name else 'txt',
+        'status': 'PROCESSING',
+        'job_type': 'titre',
+        'model': CLAUDE_MODEL,
+        'created_at': now.isoformat(),
+        'updated_at': now.isoformat(),
+        'timestamp': int(now.timestamp() * 1000)
+    }
+    try:
+        dynamodb.Table(JOBS_TABLE).put_item(
+            Item=child,
+            ConditionExpression="attribute_not_exists(job_id) OR #status <> :completed",
+            ExpressionAttributeNames={'#status': 'status'},
+            ExpressionAttributeValues={':completed': 'COMPLETED'}
+        )
+    except ClientError as e:
+        if e.response['Error']['Code'] == 'ConditionalCheckFailedException':
+            return None
+        raise
+    return child
+
+
+def run_bulk_wave(record, message, wave):
+    """
+    Genere une vague de conducteurs en parallele (BULK_MAX_PARALLELISM) puis persiste
+    les resultats. Les enfants a reprendre (IA surchargee, rate limit, timeout) repassent en QUEUED.
+    Retourne (index a reprendre, delai avant reprise, progression)
+    """
+    task = TASK_DEFINITIONS['titre']
+
+    def generate(job_ctx):
+        job_ctx['summary_result'] = generate_summary_with_retry(
+            task['build_prompt'](job_ctx['text'], job_ctx['job'], job_ctx['message']),
+            task['parse'],
+            timings=job_ctx['timings']
+        )
+        return job_ctx
+
+    with ThreadPoolExecutor(max_workers=BULK_MAX_PARALLELISM) as executor:
+        results = list(executor.map(generate, wave))
+
+    retry_indexes = []
+    retry_delay = None
+    completed = 0
+    failed = 0
+    for job_ctx in results:
+        summary_result = job_ctx['summary_result']
+        error_message = (summary_result.get('error') or '').lower()
+        rate_limited = not summary_result['success'] and ('rate_limit' in error_message or 'timeout' in error_message)
+        if summary_result.get('overloaded') or rate_limited:
+            # Credit deja reserve : l'enfant est repris au curseur plutot que marque FAILED
+            retry_indexes.append(job_ctx['index'])
+            retry_delay = CIRCUIT_OPEN_SECONDS if summary_result.get('overloaded') else (retry_delay or BULK_RETRY_DELAY_SECONDS)
+            update_job_status(job_ctx['job_id'], 'QUEUED', fields=job_ctx['timings'])
+            continue
+        try:
+            # Erreurs a reprendre traitees ci-dessus : rien a rendre a la file ici
+            finish_titre_job(job_ctx, [])
+            if summary_result['success']:
+                completed += 1
+            else:
+                failed += 1
+        except Exception as e:
+            logger.error(f"Bulk child {job_ctx['job_id']} failed: {str(e)}")
+            failed += 1
+
+    return retry_indexes, retry_delay, update_bulk_progress(message['job_id'], completed=completed, failed=failed)
+
+
+def process_bulk_job(record, message, prefetched_jobs, context, batch_item_failures):
+    """
+    Import groupe : reserve les credits de tous les conducteurs en une fois, puis genere
+    par vagues paralleles bornees en suivant la progression sur le job parent.
+    Avant la fin du temps Lambda (ou si l'IA est surchargee), le message est remis en file
+    avec un curseur (next_index, retry_indexes) et l'import reprend la ou il s'etait arrete.
+    Un message rejoue sans curseur (timeout) ne redebite pas et saute les enfants termines.
+    """
+    parent_job_id = message['job_id']
+    uploads_bucket = UPLOADS_BUCKET
+
+    parent_job = prefetched_jobs.get(parent_job_id)
+    if parent_job is None:
+        response = dynamodb.Table(JOBS_TABLE).get_item(Key={'job_id': parent_job_id})
+        if 'Item' not in response:
+            raise Exception(f"Job {parent_job_id} not found in database")
+        parent_job = response['Item']
+    user_id = message.get('user_id') or parent_job.get('user_id', 'unknown')
+
+    start_memory_profile(parent_job_id)
+    archive_path = download_bulk_archive(parent_job, uploads_bucket)
+    try:
+        run_bulk_import(record, message, parent_job, user_id, archive_path, context, batch_item_failures)
+    finally:
+        if archive_path:
+            os.remove(archive_path)
+        memory_checkpoint('bulk', parent_job_id)
+        emit_memory_profile(context, parent_job_id)
+
+
+def run_bulk_import(record, message, parent_job, user_id, archive_path, context, batch_item_failures):
+    """
+    Denombrement, reservation des credits et vagues de generation d'un import
+    (archive tar deja telechargee dans archive_path, None pour les autres sources)
+    """
+    parent_job_id = parent_job['job_id']
+    uploads_bucket = UPLOADS_BUCKET
+
+    # Premiere execution : denombrer les fichiers et reserver les credits en une operation
+    if not message.get('credit_consumed'):
+        total_count = sum(1 for _ in iter_bulk_members(parent_job, uploads_bucket, lambda index: False, archive_path))
+        if total_count == 0:
+            update_job_status(parent_job_id, 'FAILED', error="Aucun fichier texte trouve dans l'import")
+            return
+
+        credit_success, credit_message = reserve_titre_credits(user_id, parent_job_id, total_count)
+        if not credit_success:
+            update_job_status(parent_job_id, 'FAILED', error=credit_message)
+            return
+
+        message['credit_consumed'] = True
+        message['total_count'] = total_count
+        update_job_status(
+            parent_job_id,
+            'PROCESSING',
+            fields={'job_type': 'bulk', 'model': CLAUDE_MODEL, 'total_count': total_count}
+        )
+        logger.info(f"Bulk job {parent_job_id}: {total_count} files, credits reserved")
+
+    total_count = message['total_count']
+    next_index = message.get('next_index', 0)
+    retry_indexes = set(message.get('retry_indexes', []))
+
+    def wanted(index):
+        return index >= next_index or index in retry_indexes
+
+    def remaining_ms():
+        if context is None or not hasattr(context, 'get_remaining_time_in_millis'):
+            return BULK_TIME_MARGIN_MS + 1
+        return context.get_remaining_time_in_millis()
+
+    wave = []
+    pending_retries = []
+    seen_indexes = set()
+    cursor = next_index
+    progress = None
+    defer_seconds = None
+
+    for index, file_name, content in iter_bulk_members(parent_job, uploads_bucket, wanted, archive_path):
+        if content is None:
+            continue
+
+        child = create_bulk_child_job(parent_job, index, file_name)
+        if child is None:
+            # Deja genere lors d'une execution interrompue
+            seen_indexes.add(index)
+            cursor = max(cursor, index + 1)
+            continue
+        text = decode_text_content(content) or ''
+        if EXTRACTIVE_PRESUMMARY:
+            text, _ = presummarize_text(text, PRESUMMARY_TOKEN_BUDGET)
+
+        wave.append({
+            'record': record,
+            'message': {'job_id': child['job_id'], 'user_id': user_id},
+            'index': index,
+            'job_id': child['job_id'],
+            'job': child,
+            'text': text,
+            'task_type': 'titre',
+            'timings': {'dequeued_at': datetime.utcnow().isoformat()}
+        })
+        seen_indexes.add(index)
+        cursor = max(cursor, index + 1)
+
+        if len(wave) < BULK_MAX_PARALLELISM:
+            continue
+
+        allowed, wait_seconds = circuit_allows_request()
+        if not allowed:
+            pending_retries.extend(job_ctx['index'] for job_ctx in wave)
+            defer_seconds = wait_seconds
+            break
+
+        retries, retry_delay, progress = run_bulk_wave(record, message, wave)
+        wave = []
+        if retries:
+            pending_retries.extend(retries)
+            defer_seconds = retry_delay
+            break
+        if remaining_ms() < BULK_TIME_MARGIN_MS:
+            defer_seconds = 0
+            break
+    else:
+        if wave:
+            retries, retry_delay, progress = run_bulk_wave(record, message, wave)
+            if retries:
+                pending_retries.extend(retries)
+                defer_seconds = retry_delay
+
+    if defer_seconds is not None:
+        # Reprises de l'execution precedente pas encore atteintes : conservees
+        pending_retries.extend(index for index in retry_indexes if index not in seen_indexes)
+        message['next_index'] = cursor
+        message['retry_indexes'] = sorted(set(pending_retries))
+        defer_message(record, message, defer_seconds, batch_item_failures, reason='bulk import')
+        logger.info(f"Bulk job {parent_job_id} paused at {cursor}/{total_count} ({len(message['retry_indexes'])} to retry)")
+        return
+
+    completed_count, failed_count = progress or update_bulk_progress(parent_job_id)
+    update_job_status(
+        parent_job_id,
+        'COMPLETED',
+        result={'total': total_count, 'completed': completed_count, 'failed': failed_count}
+    )
+    logger.info(f"Bulk job {parent_job_id} completed: {completed_count} ok, {failed_count} failed / {total_count}")
+
+
+# Consignes communes au prompt normal et au prompt groupe
+SUMMARY_GUIDELINES = """OBJECTIF :
+- Generer un titre attractif pour l'episode
+- Rediger un resume de 5 a 6 lignes presentant le sujet principal, les invites et les points cles de facon engageante
+
+CONTENU DU RESUME :
+- Angle attractif sur le sujet principal
+- Noms et fonctions des invites principaux
+- Points cles les plus importants de l'emission
+- Une phrase finale soulignant l'interet pour l'auditeur
+
+STYLE :
+- Ton informatif et vivant, comme un article de presse de qualite
+- Phrases courtes et percutantes
+- Style engageant sans superlatifs
+- Vocabulaire accessible et varie
+- Focus sur l'essentiel et les enjeux cles"""
 
-        prompt = f"""RESULTAT PRECEDENT :
+# Sections delimitees des requetes groupees
+COALESCED_SECTION_RE = re.compile(r"=== JOB (\d+) ===(.*?)=== FIN JOB \1 ===", re.DOTALL)
+
+
+def build_summary_prompt(text, file_name, file_extension):
+    """
+    Prompt normal : titre + resume du conducteur
+    """
+    return f"""{SUMMARY_GUIDELINES}
+
+FORMAT OBLIGATOIRE :
+TITRE : [titre genere]
+RESUME : [resume genere de 5 a 6 lignes maximum]
+
+CONSIGNE : Utiliser uniquement les infos du conducteur fourni. Donner envie d'ecouter en restant concis.
+
+Fichier: {file_name} (format: {file_extension})
+
+CONDUCTEUR :
+{text[:30000]}"""
+
+
+def build_regeneration_prompt(text, file_name, file_extension, prompt_adjustment, previous_result=None):
+    """
+    Prompt de regeneration : nouveau titre / resume a partir du resultat precedent et du feedback
+    """
+    previous_title = previous_result.get('titre', '') if previous_result else ''
+    previous_summary = previous_result.get('resume', '') if previous_result else ''
+
+    return f"""RESULTAT PRECEDENT :
 TITRE : {previous_title}
 RESUME : {previous_summary}
 
@@ -327,101 +966,131 @@ Fichier: {file_name} (format: {file_extension})
 
 CONDUCTEUR :
 {text[:30000]}"""
-    else:
-        # Prompt normal sans feedback
-        prompt = f"""OBJECTIF :
-- Generer un titre attractif pour l'episode
-- Rediger un resume de 5 a 6 lignes presentant le sujet principal, les invites et les points cles de facon engageante
 
-CONTENU DU RESUME :
-- Angle attractif sur le sujet principal
-- Noms et fonctions des invites principaux
-- Points cles les plus importants de l'emission
-- Une phrase finale soulignant l'interet pour l'auditeur
 
-STYLE :
-- Ton informatif et vivant, comme un article de presse de qualite
-- Phrases courtes et percutantes
-- Style engageant sans superlatifs
-- Vocabulaire accessible et varie
-- Focus sur l'essentiel et les enjeux cles
+def build_task_prompt(text, job, prompt_adjustment=None):
+    """
+    Prompt d'un job : regeneration si un feedback est fourni, prompt normal sinon
+    """
+    file_name = job.get('file_name', 'unknown.txt')
+    file_extension = job.get('file_extension', 'txt')
+    if prompt_adjustment:
+        return build_regeneration_prompt(text, file_name, file_extension, prompt_adjustment, job.get('result', {}))
+    return build_summary_prompt(text, file_name, file_extension)
 
-FORMAT OBLIGATOIRE :
-TITRE : [titre genere]
-RESUME : [resume genere de 5 a 6 lignes maximum]
 
-CONSIGNE : Utiliser uniquement les infos du conducteur fourni. Donner envie d'ecouter en restant concis.
+def generate_summary_with_retry(prompt, parse, max_retries=3, timings=None):
+    """
+    Appel Claude API avec retry logic (prompt construit par la definition de tache)
+    """
+    generation = generate_with_retry(
+        prompt,
+        parse,
+        model=CLAUDE_MODEL,
+        max_tokens=2000,
+        temperature=0.3,
+        max_retries=max_retries,
+        timings=timings
+    )
+    if not generation['success']:
+        return generation
 
-Fichier: {file_name} (format: {file_extension})
+    return {
+        'success': True,
+        'summary': generation['result']
+    }
 
-CONDUCTEUR :
-{text[:30000]}"""
 
-    for attempt in range(max_retries):
-        try:
-            logger.info(f"Calling Claude API (attempt {attempt + 1}/{max_retries})")
-
-            # Call Claude API
-            response = claude_client.messages.create(
-                model="claude-haiku-4-5-20251001",
-                max_tokens=2000,
-                temperature=0.3,
-                messages=[
-                    {
-                        "role": "user",
-                        "content": prompt
-                    }
-                ]
-            )
+def generate_coalesced_summaries(group):
+    """
+    Genere titre + resume pour plusieurs conducteurs independants en un seul appel Claude.
+    Retourne {job_id: summary_result} pour les sections correctement parsees ;
+    les jobs absents du resultat sont a traiter en appel unitaire.
+    """
+    if not claude_pool and ANTHROPIC_CASSETTE_MODE != 'replay':
+        return {}
+
+    sections = []
+    for number, job_ctx in enumerate(group, start=1):
+        job = job_ctx['job']
+        sections.append(
+            f"=== CONDUCTEUR {number} ===\n"
+            f"Fichier: {job.get('file_name', 'unknown.txt')} (format: {job.get('file_extension', 'txt')})\n\n"
+            f"{job_ctx['text']}\n"
+            f"=== FIN CONDUCTEUR {number} ==="
+        )
+
+    prompt = f"""{SUMMARY_GUIDELINES}
 
-            # Extract response text
-            response_text = response.content[0].text if response.content else ""
+TRAITEMENT GROUPE :
+Les {len(group)} conducteurs ci-dessous sont INDEPENDANTS. Traiter chacun separement,
+sans jamais melanger les informations d'un conducteur avec un autre.
 
-            logger.info(f"Claude API response received: {len(response_text)} characters")
+FORMAT OBLIGATOIRE (un bloc par conducteur, dans l'ordre, avec le meme numero) :
+=== JOB [numero] ===
+TITRE : [titre genere]
+RESUME : [resume genere de 5 a 6 lignes maximum]
+=== FIN JOB [numero] ===
 
-            # Parse the response to extract title and summary
-            parsed_result = parse_claude_response(response_text)
+CONSIGNE : Utiliser uniquement les infos du conducteur correspondant. Donner envie d'ecouter en restant concis.
 
-            return {
-                'success': True,
-                'summary': parsed_result
-            }
+{chr(10).join(sections)}"""
 
-        except anthropic.RateLimitError as e:
-            logger.warning(f"Rate limit error (attempt {attempt + 1}): {str(e)}")
-            if attempt < max_retries - 1:
-                wait_time = 2 ** attempt
-                logger.info(f"Waiting {wait_time} seconds before retry...")
-                time.sleep(wait_time)
-            else:
-                return {
-                    'success': False,
-                    'error': f'Rate limit depasse apres {max_retries} tentatives'
+    timings = {'generation_started_at': datetime.utcnow().isoformat()}
+    try:
+        logger.info(f"Calling Claude API for {len(group)} coalesced titre jobs")
+
+        response = create_claude_message(
+            timings=timings,
+            model=CLAUDE_MODEL,
+            max_tokens=min(8000, 700 * len(group)),
+            temperature=0.3,
+            messages=[
+                {
+                    "role": "user",
+                    "content": prompt
                 }
+            ]
+        )
+        record_circuit_result(overloaded=False)
 
-        except anthropic.APIError as e:
-            logger.error(f"Claude API error: {str(e)}")
-            if 'overloaded' in str(e).lower() or '529' in str(e):
-                return {
+        response_text = response.content[0].text if response.content else ""
+
+    except anthropic.APIError as e:
+        logger.warning(f"Coalesced Claude call failed, falling back to single calls: {str(e)}")
+        if is_overloaded_error(e):
+            record_circuit_result(overloaded=True)
+            return {
+                job_ctx['job_id']: {
                     'success': False,
+                    'overloaded': True,
                     'error': 'IA temporairement surchargee. Merci de reessayer dans quelques instants.'
                 }
-            return {
-                'success': False,
-                'error': f'Erreur API Claude: {str(e)}'
+                for job_ctx in group
             }
+        return {}
 
-        except Exception as e:
-            logger.error(f"Unexpected error calling Claude: {str(e)}")
-            return {
-                'success': False,
-                'error': f'Erreur inattendue: {str(e)}'
+    except Exception as e:
+        logger.warning(f"Coalesced Claude call failed, falling back to single calls: {str(e)}")
+        return {}
+
+    results = {}
+    for match in COALESCED_SECTION_RE.finditer(response_text):
+        number = int(match.group(1))
+        section = match.group(2).strip()
+        if not 1 <= number <= len(group) or 'TITRE' not in section.upper():
+            continue
+
+        parsed_result = parse_claude_response(section)
+        if parsed_result['titre'] and parsed_result['resume']:
+            group[number - 1]['timings'].update(timings)
+            results[group[number - 1]['job_id']] = {
+                'success': True,
+                'summary': parsed_result
             }
 
-    return {
-        'success': False,
-        'error': 'Echec apres toutes les tentatives'
-    }
+    logger.info(f"Coalesced call parsed {len(results)}/{len(group)} jobs")
+    return results
 
 
 def parse_claude_response(response_text):
@@ -476,7 +1145,7 @@ def parse_claude_response(response_text):
     return result
 
 
-def update_job_status(job_id, status, result=None, error=None):
+def update_job_status(job_id, status, result=None, error=None, artifacts=None, fields=None):
     """
     Update job status in DynamoDB
     """
@@ -499,6 +1168,16 @@ def update_job_status(job_id, status, result=None, error=None):
             update_expr += ", error_message = :error"
             expr_values[':error'] = error
 
+        if artifacts:
+            update_expr += ", artifacts = :artifacts"
+            expr_values[':artifacts'] = artifacts
+
+        # Horodatages d'etapes et attributs de suivi (queued_at, first_token_at, model...)
+        for name, value in (fields or {}).items():
+            update_expr += f", #{name} = :{name}"
+            expr_values[f":{name}"] = value
+            expr_names[f"#{name}"] = name
+
         table.update_item(
             Key={'job_id': job_id},
             UpdateExpression=update_expr,
@@ -512,6 +1191,36 @@ def update_job_status(job_id, status, result=None, error=None):
         logger.error(f"Error updating job status: {str(e)}")
 
 
+def persist_summary(job_id, job, summary, timings=None):
+    """
+    Persiste un titre / resume : JSON S3, rendus HTML / Markdown, DynamoDB, statut COMPLETED
+    """
+    user_group = job.get('user_group', 'unknown')
+    user_id = job.get('user_id', 'unknown')
+
+    s3_key = save_result_to_s3(job_id=job_id, user_group=user_group, user_id=user_id, summary=summary)
+
+    # Save publish-ready HTML / Markdown next to the JSON
+    artifacts = save_summary_artifacts(job_id=job_id, user_group=user_group, user_id=user_id, summary=summary)
+
+    save_result_to_dynamodb(
+        job_id=job_id,
+        user_id=user_id,
+        user_group=user_group,
+        summary=summary,
+        s3_key=s3_key,
+        artifacts=artifacts
+    )
+
+    update_job_status(
+        job_id=job_id,
+        status='COMPLETED',
+        result=summary,
+        artifacts=artifacts,
+        fields={**(timings or {}), 'persisted_at': datetime.utcnow().isoformat()}
+    )
+
+
 def save_result_to_s3(job_id, user_group, user_id, summary):
     """
     Save result to S3
@@ -535,7 +1244,19 @@ def save_result_to_s3(job_id, user_group, user_id, summary):
         return None
 
 
-def save_result_to_dynamodb(job_id, user_id, user_group, summary, s3_key):
+def save_summary_artifacts(job_id, user_group, user_id, summary):
+    """
+    Pre-rend le titre et le resume en HTML et Markdown
+    """
+    return save_rendered_artifacts(
+        bucket=RESULTS_BUCKET,
+        base_key=f"{user_group}/{user_id}/{job_id}/result",
+        title=summary.get('titre', ''),
+        sections=[(summary.get('resume', ''), 'resume', False)]
+    )
+
+
+def save_result_to_dynamodb(job_id, user_id, user_group, summary, s3_key, artifacts=None):
     """
     Save result to DynamoDB with TTL
     """
@@ -552,6 +1273,7 @@ def save_result_to_dynamodb(job_id, user_id, user_group, summary, s3_key):
                 'user_group': user_group,
                 'summary': summary,
                 's3_key': s3_key,
+                'artifacts': artifacts,
                 'created_at': datetime.utcnow().isoformat(),
                 'ttl': ttl
             }
@@ -561,3 +1283,26 @@ def save_result_to_dynamodb(job_id, user_id, user_group, summary, s3_key):
 
     except Exception as e:
         logger.error(f"Error saving to DynamoDB: {str(e)}")
+
+
+# Types de taches de ce processeur, testes dans l'ordre (registre du task engine) :
+# prompt, parsing, credit consomme et persistance du resultat
+TASK_DEFINITIONS = {
+    'regeneration': {
+        'job_type': 'regeneration',
+        # Deja paye lors de la generation initiale
+        'credit_attribute': None,
+        'build_prompt': lambda text, job, message: build_task_prompt(text, job, message.get('prompt_adjustment')),
+        'parse': parse_claude_response,
+        'persist': persist_summary,
+        'matches': lambda message: bool(message.get('is_regeneration'))
+    },
+    'titre': {
+        'job_type': 'titre',
+        'credit_attribute': 'remainingTitreCredits',
+        'build_prompt': lambda text, job, message: build_task_prompt(text, job),
+        'parse': parse_claude_response,
+        'persist': persist_summary,
+        'matches': lambda message: True
+    },
+}
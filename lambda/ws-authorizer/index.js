@@ -0,0 +1,55 @@
+const { CognitoJwtVerifier } = require('aws-jwt-verify');
+
+const COGNITO_USER_POOL_ID = process.env.COGNITO_USER_POOL_ID;
+const COGNITO_CLIENT_ID = process.env.COGNITO_CLIENT_ID;
+// Second user pool de connexion du frontend (utilisateurs Saint-Esprit)
+const SAINT_ESPRIT_USER_POOL_ID = process.env.SAINT_ESPRIT_USER_POOL_ID;
+const SAINT_ESPRIT_CLIENT_ID = process.env.SAINT_ESPRIT_CLIENT_ID;
+
+const userPools = [
+    { userPoolId: COGNITO_USER_POOL_ID, clientId: COGNITO_CLIENT_ID },
+    { userPoolId: SAINT_ESPRIT_USER_POOL_ID, clientId: SAINT_ESPRIT_CLIENT_ID }
+].filter(pool => pool.userPoolId && pool.clientId);
+
+// Vérifie les ID tokens Cognito de chaque user pool (choisi d'après l'émetteur du token,
+// JWKS mis en cache entre invocations)
+const verifier = CognitoJwtVerifier.create(
+    userPools.map(pool => ({ ...pool, tokenUse: 'id' }))
+);
+
+/**
+ * Lambda Handler - Authorizer REQUEST de l'API WebSocket thor-web-jobs-ws
+ * Valide le token Cognito passé en query string (?token=...) sur la route $connect
+ * et transmet l'identité (user_id = sub) au job-notifier via requestContext.authorizer
+ */
+exports.handler = async (event) => {
+    const token = event.queryStringParameters?.token;
+
+    if (!token) {
+        console.log('Missing token on $connect');
+        throw new Error('Unauthorized');
+    }
+
+    try {
+        const claims = await verifier.verify(token);
+
+        return {
+            principalId: claims.sub,
+            policyDocument: {
+                Version: '2012-10-17',
+                Statement: [{
+                    Action: 'execute-api:Invoke',
+                    Effect: 'Allow',
+                    Resource: event.methodArn
+                }]
+            },
+            context: {
+                user_id: claims.sub
+            }
+        };
+
+    } catch (error) {
+        console.log('Invalid token on $connect:', error.message);
+        throw new Error('Unauthorized');
+    }
+};
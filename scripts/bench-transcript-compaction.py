@@ -0,0 +1,155 @@
+#!/usr/bin/env python3
+"""
+THOR WEB - Benchmark de la compaction et du pré-résumé des transcriptions
+
+Mesure la réduction de tokens, le contenu conservé et le temps de traitement de
+compact_transcript() puis de presummarize_text() (TF-IDF + TextRank, lambda/article-generator) sur des
+transcriptions d'exemple.
+
+Usage :
+    python3 scripts/bench-transcript-compaction.py [fichier.json|fichier.txt ...]
+
+Les fichiers .json sont lus au format Amazon Transcribe
+(results.transcripts[0].transcript). Sans argument, une transcription
+synthétique d'environ deux heures d'antenne est utilisée.
+
+Nécessite les dépendances de la Lambda (pip3 install -r lambda/article-generator/requirements.txt).
+"""
+
+import json
+import os
+import random
+import re
+import sys
+import time
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(PROJECT_ROOT, 'lambda', 'article-generator'))
+
+from index import (  # noqa: E402
+    PRESUMMARY_TOKEN_BUDGET, REPEATABLE_FUNCTION_WORDS, STRONG_FILLERS_RE, compact_transcript, presummarize_text
+)
+
+ITERATIONS = 20
+
+FILLERS = ['euh,', 'ben,', 'hum', 'bon,', 'bah,', 'voilà,']
+SUBJECTS = ['le festival', 'la mairie', 'le club de foot', 'la médiathèque', 'le marché', 'la paroisse', 'le lycée']
+VERBS = ['organise', 'prépare', 'annonce', 'présente', 'accueille', 'finance']
+OBJECTS = ['une soirée solidaire', 'des ateliers', 'un concert gratuit', 'une exposition', 'des rencontres', 'un débat']
+PLACES = ['à Lyon', 'à Villeurbanne', 'dans le quartier', 'au centre-ville', 'à la salle des fêtes']
+# Hésitations et interjections : ni contenu, ni mots-outils
+FILLER_WORDS = {'ben', 'bah', 'bon', 'voilà', 'hein', 'quoi'}
+WORD_RE = re.compile(r"[^\W\d_]+(?:['’][^\W\d_]+)*|\d+")
+
+JINGLES = [
+    "Vous écoutez Radio Fidélité, la radio qui vous accompagne au quotidien.",
+    "On se retrouve après une courte pause, restez avec nous sur Radio Fidélité.",
+]
+
+
+def load_transcript(path):
+    with open(path, encoding='utf-8') as f:
+        content = f.read()
+    if path.endswith('.json'):
+        return json.loads(content)['results']['transcripts'][0]['transcript']
+    return content
+
+
+def synthetic_transcript(target_chars=120000, seed=42):
+    """
+    Transcription réaliste : phrases uniques ponctuées d'hésitations,
+    de répétitions et de jingles réguliers
+    """
+    rng = random.Random(seed)
+    parts = []
+    size = 0
+    while size < target_chars:
+        words = f"{rng.choice(SUBJECTS)} {rng.choice(VERBS)} {rng.choice(OBJECTS)} {rng.choice(PLACES)} le {rng.randint(1, 28)} mai".split()
+        if rng.random() < 0.5:
+            words.insert(rng.randrange(len(words)), rng.choice(FILLERS))
+        if rng.random() < 0.3:
+            i = rng.randrange(len(words))
+            words.insert(i, words[i])
+        sentence = ' '.join(words)
+        sentence = sentence[:1].upper() + sentence[1:] + '.'
+        if rng.random() < 0.05:
+            sentence = rng.choice(JINGLES)
+        parts.append(sentence)
+        size += len(sentence) + 1
+    return ' '.join(parts)
+
+
+def content_words(text):
+    """
+    Mots porteurs de sens : hors hésitations, interjections et mots-outils
+    """
+    words = []
+    for word in WORD_RE.findall(text.lower()):
+        if word.replace('’', "'") in REPEATABLE_FUNCTION_WORDS or word in FILLER_WORDS:
+            continue
+        if STRONG_FILLERS_RE.fullmatch(word):
+            continue
+        words.append(word)
+    return words
+
+
+def bench(name, text):
+    start = time.perf_counter()
+    for _ in range(ITERATIONS):
+        compacted, stats = compact_transcript(text)
+    elapsed_ms = (time.perf_counter() - start) * 1000 / ITERATIONS
+
+    # Contenu conservé par la compaction (les jingles et phrases dupliquées en retirent légitimement)
+    # et contenu réel qui tient dans la fenêtre [:50000] du prompt
+    content_before = len(content_words(text))
+    content_kept = 100.0 * len(content_words(compacted)) / content_before if content_before else 100.0
+    window_before = len(content_words(text[:50000]))
+    window_after = len(content_words(compacted[:50000]))
+
+    print(
+        f"{name:<40} {stats['original_tokens']:>9} {stats['compacted_tokens']:>9} "
+        f"{stats['reduction_pct']:>7.1f}% {elapsed_ms:>9.1f} ms {content_kept:>8.1f}% "
+        f"{window_before:>7} -> {window_after:<7}"
+    )
+    return stats, compacted
+
+
+def bench_presummary(name, text):
+    start = time.perf_counter()
+    for _ in range(ITERATIONS):
+        summary, stats = presummarize_text(text, PRESUMMARY_TOKEN_BUDGET)
+    elapsed_ms = (time.perf_counter() - start) * 1000 / ITERATIONS
+
+    print(
+        f"{name:<40} {stats['original_tokens']:>9} {stats['presummary_tokens']:>9} "
+        f"{stats['selected_units']:>6}/{stats['units']:<6} {elapsed_ms:>9.1f} ms"
+    )
+
+
+def main():
+    samples = [(os.path.basename(path), load_transcript(path)) for path in sys.argv[1:]]
+    if not samples:
+        samples = [('synthetique (~2h)', synthetic_transcript())]
+
+    print(f"{'Transcription':<40} {'Tokens':>9} {'Compacte':>9} {'Gain':>8} {'Temps':>12} {'Contenu':>9} {'Mots de contenu dans [:50000]'}")
+    total_before = 0
+    total_after = 0
+    compacted_samples = []
+    for name, text in samples:
+        stats, compacted = bench(name, text)
+        total_before += stats['original_tokens']
+        total_after += stats['compacted_tokens']
+        compacted_samples.append((name, compacted))
+
+    if len(samples) > 1 and total_before:
+        print(f"\nTotal : {total_before} -> {total_after} tokens (-{100.0 * (total_before - total_after) / total_before:.1f}%)")
+
+    # Pré-résumé appliqué après compaction, comme dans la Lambda
+    print(f"\nPré-résumé extractif (budget {PRESUMMARY_TOKEN_BUDGET} tokens)")
+    print(f"{'Transcription':<40} {'Tokens':>9} {'Résumé':>9} {'Phrases':>13} {'Temps':>12}")
+    for name, compacted in compacted_samples:
+        bench_presummary(name, compacted)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,12 +1,14 @@
 #!/bin/bash
 
 # THOR WEB - Deploy Lambda Functions
-# Ce script package et déploie les 3 Lambda functions
+# Ce script package et déploie les Lambda functions
 
 set -e
 
 REGION="eu-west-3"
 PROJECT_ROOT="$(cd "$(dirname "$0")/.." && pwd)"
+# Dépendances Python installées pour le runtime Lambda (Linux x86_64, python3.11)
+LAMBDA_PIP_PLATFORM_FLAGS="--platform manylinux2014_x86_64 --python-version 3.11 --only-binary=:all:"
 
 echo "==================================="
 echo "THOR WEB - Lambda Deployment"
@@ -53,9 +55,11 @@ deploy_node_lambda() {
 }
 
 # Function to deploy a Python Lambda
+# Arguments suivants optionnels : "lambda_source:module" embarque lambda/<source>/index.py en <module>.py
 deploy_python_lambda() {
     local lambda_name=$1
     local lambda_dir="$PROJECT_ROOT/lambda/$lambda_name"
+    shift
 
     echo -e "${BLUE}📦 Packaging $lambda_name...${NC}"
 
@@ -69,10 +73,21 @@ deploy_python_lambda() {
     # Copy Lambda code
     cp index.py "$temp_dir/"
 
+    # Copy bundled processor modules
+    for bundled in "$@"; do
+        cp "$PROJECT_ROOT/lambda/${bundled%%:*}/index.py" "$temp_dir/${bundled##*:}.py"
+    done
+
+    # Runtime commun des processeurs (lambda/common/thor_common.py)
+    if grep -q "thor_common" index.py; then
+        cp "$PROJECT_ROOT/lambda/common/thor_common.py" "$temp_dir/"
+    fi
+
     # Install dependencies if requirements.txt exists
+    # Roues Linux du runtime Lambda (numpy compilé) : le package peut être construit sous macOS
     if [ -f "requirements.txt" ]; then
         echo "  Installing Python dependencies..."
-        pip3 install -r requirements.txt -t "$temp_dir" > /dev/null
+        pip3 install -r requirements.txt -t "$temp_dir" $LAMBDA_PIP_PLATFORM_FLAGS > /dev/null
     fi
 
     # Create zip file
@@ -107,9 +122,26 @@ deploy_node_lambda "upload-handler"
 # 2. Transcription Complete (Node.js)
 deploy_node_lambda "transcription-complete"
 
-# 3. Article Generator (Python)
+# 3. WebSocket Authorizer (Node.js)
+deploy_node_lambda "ws-authorizer"
+
+# User pools acceptés par l'authorizer (les deux connexions du frontend, frontend/src/config/index.ts)
+WS_AUTHORIZER_ENV="Variables={COGNITO_USER_POOL_ID=eu-west-3_abTBNREBJ,COGNITO_CLIENT_ID=4j9q6in6cpcsmroimb30b54d5s,SAINT_ESPRIT_USER_POOL_ID=eu-west-3_oD1fm8OLs,SAINT_ESPRIT_CLIENT_ID=5jst6bnhl26ekdr5a7pu9ik2f5}"
+# TODO: Uncomment when the ws-authorizer Lambda is created in AWS
+# aws lambda update-function-configuration \
+#     --function-name "thor-web-ws-authorizer" \
+#     --region "$REGION" \
+#     --environment "$WS_AUTHORIZER_ENV"
+
+# 4. Article Generator (Python)
 deploy_python_lambda "article-generator"
 
+# 5. Job Notifier (Python)
+deploy_python_lambda "job-notifier"
+
+# 6. Task Engine (Python) - héberge les processeurs article et titre
+deploy_python_lambda "task-engine" "article-generator:article_tasks" "titre-async-processor:titre_tasks"
+
 echo ""
 echo -e "${GREEN}==================================="
 echo "✓ All Lambdas packaged successfully!"
@@ -122,5 +154,8 @@ echo ""
 echo "Package files are in /tmp/:"
 echo "  - upload-handler.zip"
 echo "  - transcription-complete.zip"
+echo "  - ws-authorizer.zip"
 echo "  - article-generator.zip"
+echo "  - job-notifier.zip"
+echo "  - task-engine.zip"
 echo ""
@@ -0,0 +1,197 @@
+#!/usr/bin/env python3
+"""
+THOR WEB - Rapport de latence du pipeline (SLO)
+
+Calcule p50/p95/p99 des étapes du pipeline à partir des horodatages des jobs,
+par type de job (article / titre / regeneration) et par modèle :
+- queue_wait   : queued_at -> dequeued_at
+- transcription: created_at -> transcribed_at (jobs audio)
+- headline     : dequeued_at -> preview_published_at (titre en avant-première)
+- ttft         : generation_started_at -> first_token_at
+- generation   : generation_started_at -> generation_finished_at
+- quality_gate : generation_finished_at -> quality_checked_at (contrôle + réparations)
+- persistence  : quality_checked_at (sinon generation_finished_at) -> persisted_at
+- end_to_end   : created_at -> completed_at
+
+Usage :
+    # Scan parallèle segmenté de la table jobs
+    python3 scripts/latency-report.py --table thor-web-jobs --segments 16
+
+    # Export local : JSON lines (un job par ligne, format DynamoDB typé ou simple)
+    python3 scripts/latency-report.py --export jobs.jsonl
+"""
+
+import argparse
+import gzip
+import json
+import math
+import sys
+import threading
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+REGION = 'eu-west-3'
+
+STAGES = [
+    ('queue_wait', 'queued_at', 'dequeued_at'),
+    ('transcription', 'created_at', 'transcribed_at'),
+    ('headline', 'dequeued_at', 'preview_published_at'),
+    ('ttft', 'generation_started_at', 'first_token_at'),
+    ('generation', 'generation_started_at', 'generation_finished_at'),
+    ('quality_gate', 'generation_finished_at', 'quality_checked_at'),
+    # Début : premier horodatage présent (sans contrôle qualité, fin de génération)
+    ('persistence', ('quality_checked_at', 'generation_finished_at'), 'persisted_at'),
+    ('end_to_end', 'created_at', 'completed_at'),
+]
+
+def _attributes(start):
+    return start if isinstance(start, tuple) else (start,)
+
+
+TIMESTAMP_ATTRIBUTES = sorted({
+    attribute for _, start, end in STAGES for attribute in _attributes(start) + (end,)
+})
+PROJECTED_ATTRIBUTES = TIMESTAMP_ATTRIBUTES + ['job_type', 'model', 'status']
+
+
+def parse_timestamp(value):
+    if not value:
+        return None
+    try:
+        return datetime.fromisoformat(str(value).replace('Z', '+00:00')).replace(tzinfo=None).timestamp()
+    except ValueError:
+        return None
+
+
+def percentile(values, pct):
+    """
+    Percentile par rang le plus proche
+    """
+    if not values:
+        return 0.0
+    rank = max(0, math.ceil(pct / 100.0 * len(values)) - 1)
+    return values[rank]
+
+
+class LatencyAggregator:
+    """
+    Durées par (type de job, modèle, étape). Thread-safe pour le scan parallèle.
+    """
+
+    def __init__(self):
+        self.durations = defaultdict(list)
+        self.jobs = 0
+        self.lock = threading.Lock()
+
+    def add_jobs(self, jobs):
+        local = defaultdict(list)
+        count = 0
+        for job in jobs:
+            count += 1
+            group = (job.get('job_type') or 'article', job.get('model') or 'inconnu')
+            timestamps = {attribute: parse_timestamp(job.get(attribute)) for attribute in TIMESTAMP_ATTRIBUTES}
+            for stage, start, end in STAGES:
+                started = next((timestamps[a] for a in _attributes(start) if timestamps[a] is not None), None)
+                if started is not None and timestamps[end] is not None and timestamps[end] >= started:
+                    local[group + (stage,)].append(timestamps[end] - started)
+
+        with self.lock:
+            self.jobs += count
+            for key, values in local.items():
+                self.durations[key].extend(values)
+
+    def report(self):
+        print(f"{self.jobs} jobs analysés\n")
+        print(f"{'Type':<14} {'Modèle':<28} {'Étape':<14} {'n':>9} {'p50 (s)':>9} {'p95 (s)':>9} {'p99 (s)':>9}")
+        for (job_type, model, stage), values in sorted(self.durations.items()):
+            values.sort()
+            print(
+                f"{job_type:<14} {model:<28} {stage:<14} {len(values):>9} "
+                f"{percentile(values, 50):>9.2f} {percentile(values, 95):>9.2f} {percentile(values, 99):>9.2f}"
+            )
+
+
+def scan_segment(table_name, segment, total_segments, aggregator):
+    """
+    Scanne un segment de la table (client bas niveau, thread-safe) et agrège page par page
+    """
+    import boto3
+    from boto3.dynamodb.types import TypeDeserializer
+
+    dynamodb_client = boto3.client('dynamodb', region_name=REGION)
+    deserializer = TypeDeserializer()
+    paginator = dynamodb_client.get_paginator('scan')
+
+    names = {f"#a{index}": attribute for index, attribute in enumerate(PROJECTED_ATTRIBUTES)}
+    for page in paginator.paginate(
+        TableName=table_name,
+        Segment=segment,
+        TotalSegments=total_segments,
+        ProjectionExpression=', '.join(names),
+        ExpressionAttributeNames=names
+    ):
+        aggregator.add_jobs(
+            {key: deserializer.deserialize(value) for key, value in item.items()}
+            for item in page.get('Items', [])
+        )
+
+
+def read_export(path, aggregator, chunk_size=10000):
+    """
+    Lit un export local : JSON lines, éventuellement gzip, items typés DynamoDB
+    ({"Item": {"job_id": {"S": ...}}}) ou objets simples
+    """
+    def plain(value):
+        if isinstance(value, dict) and len(value) == 1:
+            type_key, inner = next(iter(value.items()))
+            if type_key in ('S', 'N'):
+                return inner
+        return value
+
+    opener = gzip.open if path.endswith('.gz') else open
+    chunk = []
+    with opener(path, 'rt', encoding='utf-8') as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            item = json.loads(line)
+            item = item.get('Item', item)
+            chunk.append({key: plain(value) for key, value in item.items()})
+            if len(chunk) >= chunk_size:
+                aggregator.add_jobs(chunk)
+                chunk = []
+    aggregator.add_jobs(chunk)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Rapport de latence du pipeline THOR WEB")
+    parser.add_argument('--table', help="Table DynamoDB des jobs à scanner")
+    parser.add_argument('--segments', type=int, default=8, help="Nombre de segments de scan parallèles")
+    parser.add_argument('--export', action='append', default=[], help="Export local JSON lines (.jsonl / .jsonl.gz)")
+    args = parser.parse_args()
+
+    if not args.table and not args.export:
+        parser.print_help()
+        sys.exit(1)
+
+    aggregator = LatencyAggregator()
+
+    for path in args.export:
+        read_export(path, aggregator)
+
+    if args.table:
+        with ThreadPoolExecutor(max_workers=args.segments) as executor:
+            futures = [
+                executor.submit(scan_segment, args.table, segment, args.segments, aggregator)
+                for segment in range(args.segments)
+            ]
+            for future in futures:
+                future.result()
+
+    aggregator.report()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,172 @@
+#!/usr/bin/env python3
+"""
+THOR WEB - Rapport mémoire des Lambdas Python
+
+Agrège les lignes MEMORY_PROFILE (émises avec MEMORY_PROFILING=true) et les lignes
+REPORT de Lambda ("Max Memory Used"), calcule les percentiles par fonction et
+recommande un réglage mémoire.
+
+Usage :
+    # Depuis des logs exportés (aws logs tail ... > logs.txt)
+    python3 scripts/memory-report.py logs.txt [autres.txt ...]
+
+    # Directement depuis CloudWatch Logs (boto3 requis)
+    python3 scripts/memory-report.py --log-group /aws/lambda/thor-web-article-generator --hours 24
+"""
+
+import argparse
+import json
+import math
+import re
+import sys
+import time
+from collections import defaultdict
+
+REGION = 'eu-west-3'
+
+# Marge appliquée au p99 observé avant arrondi
+HEADROOM = 1.3
+MEMORY_STEP_MB = 64
+MIN_MEMORY_MB = 128
+MAX_MEMORY_MB = 10240
+# Au-delà, Lambda alloue plus d'un vCPU
+ONE_VCPU_MB = 1769
+
+REPORT_RE = re.compile(r"REPORT RequestId:.*?Memory Size: (\d+) MB\s+Max Memory Used: (\d+) MB")
+
+
+def percentile(values, pct):
+    """
+    Percentile par rang le plus proche
+    """
+    if not values:
+        return 0
+    ordered = sorted(values)
+    rank = max(0, math.ceil(pct / 100.0 * len(ordered)) - 1)
+    return ordered[rank]
+
+
+def read_log_files(paths):
+    for path in paths:
+        with open(path, encoding='utf-8', errors='replace') as f:
+            for line in f:
+                yield path, line
+
+
+def read_log_group(log_group, hours):
+    import boto3
+
+    logs_client = boto3.client('logs', region_name=REGION)
+    paginator = logs_client.get_paginator('filter_log_events')
+    start_time = int((time.time() - hours * 3600) * 1000)
+    for page in paginator.paginate(
+        logGroupName=log_group,
+        startTime=start_time,
+        filterPattern='?MEMORY_PROFILE ?REPORT'
+    ):
+        for event in page.get('events', []):
+            yield log_group, event['message']
+
+
+def collect(lines):
+    """
+    Regroupe les mesures par source (fichier ou groupe de logs, donc par fonction) :
+    {source: {'functions': set(), 'rss': [...], 'traced': [...], 'max_used': [...],
+              'memory_size': set(), 'stages': {etape: [...]}}}
+    """
+    sources = defaultdict(lambda: {
+        'functions': set(), 'rss': [], 'traced': [], 'max_used': [], 'memory_size': set(),
+        'stages': defaultdict(list)
+    })
+
+    for source, line in lines:
+        if 'MEMORY_PROFILE ' in line:
+            try:
+                profile = json.loads(line.split('MEMORY_PROFILE ', 1)[1])
+            except ValueError:
+                continue
+            stats = sources[source]
+            if profile.get('function'):
+                stats['functions'].add(profile['function'])
+            stats['rss'].append(profile['peak_rss_kb'] / 1024.0)
+            stats['traced'].append(profile['peak_traced_kb'] / 1024.0)
+            if profile.get('memory_limit_mb'):
+                stats['memory_size'].add(profile['memory_limit_mb'])
+            for stage, values in profile.get('stages', {}).items():
+                stats['stages'][stage].append(values['traced_peak_kb'] / 1024.0)
+            continue
+
+        match = REPORT_RE.search(line)
+        if match:
+            stats = sources[source]
+            stats['memory_size'].add(int(match.group(1)))
+            stats['max_used'].append(int(match.group(2)))
+
+    return sources
+
+
+def recommend(observed_p99_mb):
+    recommended = math.ceil(observed_p99_mb * HEADROOM / MEMORY_STEP_MB) * MEMORY_STEP_MB
+    return max(MIN_MEMORY_MB, min(MAX_MEMORY_MB, recommended))
+
+
+def print_report(sources):
+    if not sources:
+        print("Aucune mesure trouvée (MEMORY_PROFILING=true est-il activé ?)")
+        return
+
+    for name, stats in sorted(sources.items()):
+        header = f"{name} ({', '.join(sorted(stats['functions']))})" if stats['functions'] else name
+        print(f"\n=== {header} ===")
+        configured = ', '.join(str(size) for size in sorted(stats['memory_size'])) or 'inconnue'
+        print(f"Mémoire configurée : {configured} MB")
+
+        rows = [
+            ('RSS max (profil)', stats['rss']),
+            ('tracemalloc pic', stats['traced']),
+            ('Lambda Max Memory Used', stats['max_used']),
+        ]
+        for stage, values in sorted(stats['stages'].items()):
+            rows.append((f"  étape {stage}", values))
+
+        print(f"{'Mesure (MB)':<28} {'n':>6} {'p50':>8} {'p95':>8} {'p99':>8} {'max':>8}")
+        for label, values in rows:
+            if not values:
+                continue
+            print(
+                f"{label:<28} {len(values):>6} {percentile(values, 50):>8.1f} {percentile(values, 95):>8.1f} "
+                f"{percentile(values, 99):>8.1f} {max(values):>8.1f}"
+            )
+
+        observed_p99 = max(percentile(stats['rss'], 99), percentile(stats['max_used'], 99))
+        if not observed_p99:
+            continue
+        recommended = recommend(observed_p99)
+        print(f"\nRecommandation : {recommended} MB (p99 observé {observed_p99:.0f} MB x {HEADROOM} de marge)")
+        if recommended < ONE_VCPU_MB:
+            print(
+                f"Note : la CPU Lambda est proportionnelle à la mémoire ({ONE_VCPU_MB} MB = 1 vCPU). "
+                "Comparer la durée des étapes locales avant de réduire."
+            )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Rapport mémoire des Lambdas THOR WEB")
+    parser.add_argument('files', nargs='*', help="Fichiers de logs exportés")
+    parser.add_argument('--log-group', action='append', default=[], help="Groupe CloudWatch Logs à lire")
+    parser.add_argument('--hours', type=float, default=24, help="Fenêtre de lecture CloudWatch (heures)")
+    args = parser.parse_args()
+
+    if not args.files and not args.log_group:
+        parser.print_help()
+        sys.exit(1)
+
+    lines = list(read_log_files(args.files))
+    for log_group in args.log_group:
+        lines.extend(read_log_group(log_group, args.hours))
+
+    print_report(collect(lines))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,137 @@
+#!/usr/bin/env python3
+"""
+THOR WEB - Benchmark hors ligne des processeurs sur cassettes Anthropic
+
+Rejoue des appels Claude enregistrés (ANTHROPIC_CASSETTE_MODE=record) à travers
+les définitions de tâches des processeurs (TASK_DEFINITIONS : prompt et parsing) et
+generate_article_with_retry (puis finalize_article) / generate_summary_with_retry, sans réseau, avec la
+latence d'origine ou mise à l'échelle. Les requêtes inconnues (prompt modifié) sont
+servies dans l'ordre d'enregistrement (ANTHROPIC_CASSETTE_MATCH=sequence).
+
+Usage :
+    # Enregistrement : déployer ou lancer la Lambda avec
+    #   ANTHROPIC_CASSETTE_MODE=record ANTHROPIC_CASSETTE_DIR=/chemin/cassettes
+    # puis rejouer :
+    python3 scripts/replay-bench.py --cassettes cassettes/ --processor article [entrees.txt|.json ...]
+    python3 scripts/replay-bench.py --cassettes cassettes/ --processor titre --scale 0.1 --runs 50
+
+Sans fichier d'entrée, la transcription synthétique de bench-transcript-compaction.py est utilisée.
+Nécessite les dépendances de la Lambda (pip3 install -r lambda/article-generator/requirements.txt).
+"""
+
+import argparse
+import importlib.util
+import json
+import math
+import os
+import sys
+import time
+from datetime import datetime
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+PROCESSORS = {
+    'article': 'article-generator',
+    'titre': 'titre-async-processor',
+}
+
+
+def load_module(name, path):
+    spec = importlib.util.spec_from_file_location(name, path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def load_input(path):
+    with open(path, encoding='utf-8') as f:
+        content = f.read()
+    if path.endswith('.json'):
+        return json.loads(content)['results']['transcripts'][0]['transcript']
+    return content
+
+
+def percentile(values, pct):
+    """
+    Percentile par rang le plus proche
+    """
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = max(0, math.ceil(pct / 100.0 * len(ordered)) - 1)
+    return ordered[rank]
+
+
+def seconds_between(start, end):
+    if not start or not end:
+        return None
+    return (datetime.fromisoformat(end) - datetime.fromisoformat(start)).total_seconds()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark hors ligne sur cassettes Anthropic")
+    parser.add_argument('inputs', nargs='*', help="Transcriptions ou textes (.txt / .json Amazon Transcribe)")
+    parser.add_argument('--cassettes', required=True, help="Répertoire des cassettes enregistrées")
+    parser.add_argument('--processor', choices=sorted(PROCESSORS), default='article')
+    parser.add_argument('--scale', type=float, default=1.0, help="Facteur de latence (1 = origine, 0 = instantané)")
+    parser.add_argument('--runs', type=int, default=0, help="Nombre d'appels (défaut : nombre d'interactions enregistrées)")
+    args = parser.parse_args()
+
+    os.environ['ANTHROPIC_CASSETTE_MODE'] = 'replay'
+    os.environ['ANTHROPIC_CASSETTE_DIR'] = args.cassettes
+    os.environ['ANTHROPIC_CASSETTE_LATENCY_SCALE'] = str(args.scale)
+    os.environ.setdefault('ANTHROPIC_CASSETTE_MATCH', 'sequence')
+
+    index = load_module('index', os.path.join(PROJECT_ROOT, 'lambda', PROCESSORS[args.processor], 'index.py'))
+    # Cassettes rejouées par le runtime commun importé par le processeur
+    runtime = sys.modules['thor_common']
+    _, sequences = runtime._load_cassettes()
+    # Séquences par (modèle, max_tokens) : appel principal et réparations du modèle du processeur
+    recorded = sum(len(interactions) for (model, _), interactions in sequences.items() if model == index.CLAUDE_MODEL)
+    if not recorded:
+        print(f"Aucune interaction enregistrée pour {index.CLAUDE_MODEL} dans {args.cassettes}")
+        sys.exit(1)
+
+    inputs = [(os.path.basename(path), load_input(path)) for path in args.inputs]
+    if not inputs:
+        bench = load_module('bench_compaction', os.path.join(PROJECT_ROOT, 'scripts', 'bench-transcript-compaction.py'))
+        inputs = [('synthetique (~2h)', bench.synthetic_transcript())]
+
+    task = index.TASK_DEFINITIONS[args.processor]
+    generate = index.generate_article_with_retry if args.processor == 'article' else index.generate_summary_with_retry
+
+    runs = args.runs or recorded
+    durations, ttfts, failures = [], [], 0
+    start = time.perf_counter()
+
+    for run in range(runs):
+        name, text = inputs[run % len(inputs)]
+        timings = {}
+        call_start = time.perf_counter()
+        prompt = task['build_prompt'](text, {'file_name': name, 'file_extension': 'txt'}, {})
+        result = generate(prompt, task['parse'], timings=timings)
+        if args.processor == 'article' and result.get('success'):
+            # Contrôle qualité et réparations, comme dans le handler (sans avant-première)
+            index.finalize_article(result['article'], timings=timings)
+        durations.append(time.perf_counter() - call_start)
+
+        ttft = seconds_between(timings.get('generation_started_at'), timings.get('first_token_at'))
+        if ttft is not None:
+            ttfts.append(ttft)
+        if not result.get('success'):
+            failures += 1
+
+    total = time.perf_counter() - start
+    print(f"{runs} appels {args.processor} ({recorded} interactions enregistrées, latence x{args.scale}) en {total:.1f} s")
+    print(f"{'Mesure (s)':<20} {'p50':>8} {'p95':>8} {'p99':>8} {'max':>8}")
+    for label, values in [('durée appel', durations), ('premier token', ttfts)]:
+        if values:
+            print(
+                f"{label:<20} {percentile(values, 50):>8.2f} {percentile(values, 95):>8.2f} "
+                f"{percentile(values, 99):>8.2f} {max(values):>8.2f}"
+            )
+    if failures:
+        print(f"\n{failures} appels en échec (cassette manquante ou réponse non exploitable)")
+
+
+if __name__ == '__main__':
+    main()